@@ -8,13 +8,8 @@ import mysql.connector
 from werkzeug.security import generate_password_hash
 import sys
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',  # Your MySQL username
-    'password': '',  # Your MySQL password
-    'database': 'digital_id_system'
-}
+# Use the same database as the API
+from config import DB_CONFIG
 
 def add_admin():
     try:
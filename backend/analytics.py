@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Stage-duration analytics for the Digital ID system
+Triggers record every status change in status_history. This module folds new
+history rows into hourly and daily rollups: for each stage an application
+left, how long it spent there, bucketed on a log scale per constituency and
+officer. Percentiles are read back from the bucket counts, so reports never
+scan status_history.
+
+Run this script from terminal, or let app.py run it in the background:
+    python analytics.py rollup     Fold in history recorded since the last run
+    python analytics.py rebuild    Clear the rollups and fold in all history again
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+PROGRESS_NAME = 'stage_durations'
+
+# End-to-end stage reported alongside the per-status ones
+SUBMITTED_TO_COLLECTED = 'submitted_to_collected'
+
+# Bucket 0 is under a minute; bucket b > 0 covers [60 * 2^((b-1)/4), 60 * 2^(b/4)) seconds,
+# so each bucket is ~19% wide and a percentile read from them is within that of the truth
+BUCKETS_PER_DOUBLING = 4
+MAX_BUCKET = 100
+
+# History rows younger than this are left for the next run, so a transaction
+# that committed a lower id late is not skipped past
+SETTLE_SECONDS = 30
+
+HOURLY_RETENTION_DAYS = 14
+PERCENTILES = (50, 90, 95, 99)
+
+
+def bucket_for(seconds):
+    if seconds < 60:
+        return 0
+    return min(MAX_BUCKET, int(BUCKETS_PER_DOUBLING * math.log2(seconds / 60)) + 1)
+
+
+def bucket_bounds(bucket):
+    if bucket == 0:
+        return 0, 60
+    return (60 * 2 ** ((bucket - 1) / BUCKETS_PER_DOUBLING),
+            60 * 2 ** (bucket / BUCKETS_PER_DOUBLING))
+
+
+def percentile(histogram, total, p):
+    """Interpolate the p-th percentile (in seconds) from sorted (bucket, count) pairs."""
+    rank = total * p / 100
+    seen = 0
+    for bucket, count in histogram:
+        if seen + count >= rank:
+            lower, upper = bucket_bounds(bucket)
+            return round(lower + (upper - lower) * (rank - seen) / count)
+        seen += count
+    return round(bucket_bounds(histogram[-1][0])[1]) if histogram else None
+
+
+def rollup_batch(conn, batch_size=5000, id_limit=None):
+    """Fold one batch of new status_history rows into the rollups. Returns rows consumed.
+
+    id_limit bounds the history ids this shard allocates itself; rows copied in
+    from another shard by a constituency move carry that shard's ids and were
+    already counted there.
+    """
+    cursor = conn.cursor()
+    try:
+        # Locking the progress row keeps concurrent workers from double counting
+        cursor.execute("""
+            SELECT last_history_id FROM rollup_progress WHERE name = %s FOR UPDATE
+        """, (PROGRESS_NAME,))
+        last_id = cursor.fetchone()[0]
+
+        # Each transition closes the stage named by old_status, which began at the
+        # application's previous transition
+        cursor.execute("""
+            SELECT h.id, h.old_status, h.new_status, h.changed_at,
+                   (SELECT p.changed_at FROM status_history p
+                    WHERE p.application_id = h.application_id AND p.id < h.id
+                    ORDER BY p.id DESC LIMIT 1) AS entered_at,
+                   CASE WHEN h.new_status = 'collected' THEN
+                       (SELECT MIN(s.changed_at) FROM status_history s
+                        WHERE s.application_id = h.application_id AND s.new_status = 'submitted')
+                   END AS submitted_at,
+                   COALESCE(a.constituency, ''), COALESCE(a.officer_id, 0)
+            FROM status_history h
+            JOIN applications a ON a.id = h.application_id
+            WHERE h.id > %s AND (%s IS NULL OR h.id < %s)
+              AND h.changed_at <= NOW() - INTERVAL %s SECOND
+            ORDER BY h.id
+            LIMIT %s
+        """, (last_id, id_limit, id_limit, SETTLE_SECONDS, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+
+        totals = defaultdict(lambda: [0, 0])
+        for (history_id, old_status, new_status, changed_at, entered_at, submitted_at,
+             constituency, officer_id) in rows:
+            durations = []
+            if old_status and entered_at:
+                durations.append((old_status, (changed_at - entered_at).total_seconds()))
+            if submitted_at:
+                durations.append((SUBMITTED_TO_COLLECTED, (changed_at - submitted_at).total_seconds()))
+
+            hour = changed_at.replace(minute=0, second=0, microsecond=0)
+            day = hour.replace(hour=0)
+            for stage, seconds in durations:
+                seconds = max(0, int(seconds))
+                for period, start in (('hour', hour), ('day', day)):
+                    entry = totals[(period, start, stage, constituency, officer_id, bucket_for(seconds))]
+                    entry[0] += 1
+                    entry[1] += seconds
+
+        if totals:
+            cursor.executemany("""
+                INSERT INTO stage_duration_rollups
+                    (period, period_start, stage, constituency, officer_id, bucket, count, total_seconds)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE count = count + VALUES(count),
+                                        total_seconds = total_seconds + VALUES(total_seconds)
+            """, [(*key, count, seconds) for key, (count, seconds) in totals.items()])
+
+        cursor.execute("""
+            UPDATE rollup_progress SET last_history_id = %s, updated_at = %s WHERE name = %s
+        """, (rows[-1][0], datetime.now(), PROGRESS_NAME))
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def prune_hourly(conn, keep_days=HOURLY_RETENTION_DAYS):
+    """Drop hourly rollups older than keep_days; the daily ones are kept."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        DELETE FROM stage_duration_rollups WHERE period = 'hour' AND period_start < %s
+    """, (datetime.now() - timedelta(days=keep_days),))
+    deleted = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return deleted
+
+
+def run_rollup(get_connection, batch_size=5000, id_limit=None):
+    """Fold in everything pending. Returns the number of history rows consumed."""
+    conn = get_connection()
+    try:
+        consumed = 0
+        while True:
+            count = rollup_batch(conn, batch_size, id_limit)
+            consumed += count
+            if count < batch_size:
+                return consumed
+    finally:
+        conn.close()
+
+
+def rebuild(get_connection, batch_size=5000, id_range=(0, None)):
+    """Clear the rollups and fold in all history again; id_range is the shard's own [start, limit)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM stage_duration_rollups")
+    cursor.execute("UPDATE rollup_progress SET last_history_id = %s WHERE name = %s",
+                   (id_range[0], PROGRESS_NAME))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return run_rollup(get_connection, batch_size, id_range[1])
+
+
+def start_rollup_worker(get_connection, interval_seconds=60, id_limit=None):
+    """Keep the rollups current on a daemon thread."""
+    def run():
+        while True:
+            try:
+                run_rollup(get_connection, id_limit=id_limit)
+                conn = get_connection()
+                try:
+                    prune_hourly(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"[analytics] Error rolling up stage durations: {e}")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=run, name='stage-rollups', daemon=True)
+    thread.start()
+    return thread
+
+
+def stage_histograms(cursor, period, start, end, group_by=None, stage=None):
+    """Bucket counts per (stage, group) between start and end, from the rollups."""
+    group_column = {'constituency': 'constituency', 'officer': 'officer_id'}.get(group_by)
+    select_group = f"{group_column}," if group_column else "'' AS group_key,"
+    group_clause = f"{group_column}," if group_column else ""
+
+    sql = f"""
+        SELECT stage, {select_group} bucket, SUM(count), SUM(total_seconds)
+        FROM stage_duration_rollups
+        WHERE period = %s AND period_start >= %s AND period_start < %s
+    """
+    params = [period, start, end]
+    if stage:
+        sql += " AND stage = %s"
+        params.append(stage)
+    sql += f" GROUP BY stage, {group_clause} bucket ORDER BY stage, {group_clause} bucket"
+    cursor.execute(sql, params)
+
+    groups = {}
+    for row_stage, group_key, bucket, count, seconds in cursor.fetchall():
+        entry = groups.setdefault((row_stage, group_key), {'histogram': [], 'count': 0, 'seconds': 0})
+        entry['histogram'].append((bucket, int(count)))
+        entry['count'] += int(count)
+        entry['seconds'] += int(seconds)
+    return groups
+
+
+def merge_histograms(shard_groups):
+    """Combine stage_histograms results from several shards; bucket counts simply add up."""
+    merged = {}
+    for groups in shard_groups:
+        for key, entry in groups.items():
+            target = merged.setdefault(key, {'buckets': defaultdict(int), 'count': 0, 'seconds': 0})
+            for bucket, count in entry['histogram']:
+                target['buckets'][bucket] += count
+            target['count'] += entry['count']
+            target['seconds'] += entry['seconds']
+    return {key: {'histogram': sorted(entry['buckets'].items()), 'count': entry['count'],
+                  'seconds': entry['seconds']}
+            for key, entry in merged.items()}
+
+
+def summarize(groups, group_by=None):
+    """Report rows (count, average and percentiles) from stage_histograms groups."""
+    report = []
+    for (row_stage, group_key), entry in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        row = {
+            'stage': row_stage,
+            'count': entry['count'],
+            'avgSeconds': round(entry['seconds'] / entry['count']),
+            **{f'p{p}Seconds': percentile(entry['histogram'], entry['count'], p) for p in PERCENTILES}
+        }
+        if group_by == 'constituency':
+            row['constituency'] = group_key
+        elif group_by == 'officer':
+            row['officerId'] = group_key or None
+        report.append(row)
+    return report
+
+
+def stage_report(cursor, period, start, end, group_by=None, stage=None):
+    """Durations per stage (and per constituency or officer) between start and end, from the rollups."""
+    return summarize(stage_histograms(cursor, period, start, end, group_by, stage), group_by)
+
+
+if __name__ == "__main__":
+    from config import SHARDS, connect as connect_shard
+    from sharding import id_range
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ("rollup", "rebuild"):
+        print(__doc__)
+        sys.exit(0)
+
+    for shard in SHARDS:
+        connect = lambda: connect_shard(shard)
+        if command == "rollup":
+            consumed = run_rollup(connect, id_limit=id_range(SHARDS, shard)[1])
+            print(f"✅ {shard}: rolled up {consumed} status changes")
+        else:
+            consumed = rebuild(connect, id_range=id_range(SHARDS, shard))
+            print(f"✅ {shard}: rebuilt rollups from {consumed} status changes")
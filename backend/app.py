@@ -1,26 +1,270 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 import mysql.connector
+from mysql.connector import errorcode
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 import jwt
 from datetime import datetime, timedelta
+import io
 import os
 import json
+from collections import Counter
+from archive import start_archiver
+from json_provider import init_json, fetch_rows
+from constituencies import ConstituencyRegistry, bump_version
+from payments import parse_callback, record_callback, start_callback_worker
+from rate_limit import init_admission
+from photo_hash import PhotoIndex, safe_dhash, DEFAULT_RADIUS
+from audit import AuditLog, init_audit, record_change
+from application_cache import ApplicationCache
+from analytics import merge_histograms, stage_histograms, start_rollup_worker, summarize
+from sharding import ShardMoving, ShardRouter, id_range
+from uploads import ClamdScanner, UploadRejected, parse_stream
+from maintenance import MaintenanceContext, MaintenanceScheduler
+from db_pool import ConnectionPool
+from lineage import issuance_chain, original_application, record_issue, record_rejection, record_request
+from officers_bulk import STATUS_ACTIONS, ImportRejected, import_officers, read_officers, set_status
+from config import (
+    ADMISSION_CONFIG, ARCHIVE_CONFIG, BACKUP_CONFIG, CLAIM_LEASE_MINUTES, DB_CONFIG, DB_POOL_CONFIG, DEFAULT_SHARD,
+    IF_MATCH_REQUIRED, MAINTENANCE_CONFIG, MAX_PENDING_OFFICERS_PAGE_SIZE, OFFICER_IMPORT_CONFIG,
+    PENDING_OFFICERS_PAGE_SIZE, SHARDS, UPLOAD_CONFIG, UPLOAD_DIR, shard_config
+)
+import time
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
+init_json(app)  # orjson responses, gzip/brotli above a size threshold
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this in production
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',  # Your MySQL username
-    'password': '',  # Your MySQL password
-    'database': 'dig_id'
+# Bodies of every other route (JSON) are capped too
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_CONFIG['max_total_bytes']
+upload_scanner = ClamdScanner(UPLOAD_CONFIG['clamd_socket']) if UPLOAD_CONFIG['clamd_socket'] else None
+
+# Written by claims, manifests and print batches without bumping applications.version
+APPLICATION_BOOKKEEPING_COLUMNS = ('claimed_by_admin_id', 'claim_expires_at', 'manifest_id', 'print_batch_id',
+                                   'print_error', 'updated_at')
+
+# Constraint errors that mean the client sent bad values (400, not 500):
+# unknown foreign key, NULL in a required column, bad ENUM/number in strict mode
+REJECTED_WRITE_ERRORS = {
+    errorcode.ER_NO_REFERENCED_ROW_2, errorcode.ER_BAD_NULL_ERROR, errorcode.WARN_DATA_TRUNCATED,
+    errorcode.ER_TRUNCATED_WRONG_VALUE_FOR_FIELD, errorcode.ER_WARN_DATA_OUT_OF_RANGE
+}
+
+# Waiting for a pooled connection feeds the same DB-pressure signal as connecting did
+db_pools = {
+    shard: ConnectionPool(shard_config(shard), on_acquire=lambda seconds: admission.record_connect(seconds),
+                          **DB_POOL_CONFIG)
+    for shard in SHARDS
 }
 
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    return db_pools['main'].get()
+
+def get_shard_connection(shard):
+    return db_pools[shard].get()
+
+def get_session_connection(shard='main'):
+    """An unpooled connection, for session state that must not go back to the pool (named locks, @variables)."""
+    return mysql.connector.connect(**shard_config(shard))
+
+# Per-worker constituency list (and shard map), reloaded when add/delete/move bump its version
+constituency_registry = ConstituencyRegistry(lambda: get_db_connection())
+
+shard_router = ShardRouter(SHARDS, constituency_registry, lambda: get_db_connection(),
+                           get_shard_connection, DEFAULT_SHARD, get_session_connection=get_session_connection)
+
+def get_token_payload():
+    """Decode the Bearer token from the Authorization header, if any."""
+    return decode_bearer(request.headers.get('Authorization', ''))
+
+def decode_bearer(auth_header):
+    if not auth_header.startswith('Bearer '):
+        return None
+    try:
+        token = auth_header.split(' ')[1]
+        return jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    except Exception as e:
+        print('JWT decode failed:', e)
+        return None
+
+def get_if_match_version():
+    """Parse the expected row version from If-Match. Returns (version, error_response)."""
+    header = request.headers.get('If-Match', '').strip()
+    if not header:
+        if IF_MATCH_REQUIRED:
+            return None, (jsonify({'error': 'If-Match header with the current version is required'}), 428)
+        return None, None
+    tag = header[2:] if header.startswith('W/') else header
+    tag = tag.strip('"')
+    if not tag.isdigit():
+        return None, (jsonify({'error': 'Invalid If-Match header'}), 400)
+    return int(tag), None
+
+def version_conflict(conn, cursor, table, row_id, expected_version, message):
+    """Explain why a conditional write matched no row: 404 missing, 412 stale version, 409 wrong state."""
+    cursor.execute(f"SELECT version FROM {table} WHERE id = %s", (row_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    
+    if not row:
+        return jsonify({'error': message}), 404
+    current_version = row['version'] if isinstance(row, dict) else row[0]
+    if expected_version is not None and current_version != expected_version:
+        response = jsonify({
+            'error': 'This record was changed by someone else. Reload and try again.',
+            'currentVersion': current_version
+        })
+        response.headers['ETag'] = f'"{current_version}"'
+        return response, 412
+    return jsonify({'error': message}), 409
+
+def etag_response(body, version):
+    """200 response carrying a row version as its ETag."""
+    response = jsonify(body)
+    if version is not None:
+        response.headers['ETag'] = f'"{version}"'
+    return response, 200
+
+def versioned_response(body, expected_version):
+    """200 response after a conditional write; the update trigger bumps the version by one."""
+    return etag_response(body, expected_version + 1 if expected_version is not None else None)
+
+def shard_moving_response():
+    response = jsonify({'error': 'This constituency is being moved between servers. Retry in a few seconds.'})
+    response.headers['Retry-After'] = str(constituency_registry.check_interval_seconds * 2)
+    return response, 503
+
+def application_connection(application_id, for_write=False):
+    """Connection to the shard holding an application. Returns (conn, error_response)."""
+    try:
+        shard = shard_router.locate(application_id, for_write)
+    except ShardMoving:
+        return None, shard_moving_response()
+    if shard is None:
+        return None, (jsonify({'error': 'Application not found'}), 404)
+    return get_shard_connection(shard), None
+
+def scatter_rows(query, params=(), order_by=None, descending=False):
+    """Run a read on every shard and merge the rows, re-sorted on order_by."""
+    def run(shard, conn):
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = fetch_rows(cursor)
+        cursor.close()
+        return rows
+    
+    rows = [row for shard_rows in shard_router.scatter(run).values() for row in shard_rows]
+    if order_by:
+        # NULLs sort first ascending and last descending, as in MySQL
+        rows.sort(key=lambda row: (row[order_by] is not None, row[order_by] or 0), reverse=descending)
+    return rows
+
+def attach_officers(rows, station=False, keep_id=False):
+    """Fill officer_name (and officer_station) from the main database, where officers live."""
+    officer_ids = sorted({row['officer_id'] for row in rows if row.get('officer_id')})
+    officers = {}
+    if officer_ids:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT id, full_name, station FROM officers WHERE id IN ({', '.join(['%s'] * len(officer_ids))})
+        """, officer_ids)
+        officers = {officer_id: (name, officer_station) for officer_id, name, officer_station in cursor.fetchall()}
+        cursor.close()
+        conn.close()
+    
+    for row in rows:
+        officer_id = row['officer_id'] if keep_id else row.pop('officer_id')
+        name, officer_station = officers.get(officer_id, (None, None))
+        row['officer_name'] = name
+        if station:
+            row['officer_station'] = officer_station
+    return rows
+
+# Lock conflicts between concurrent lineage writes; the write is retried
+LINEAGE_RETRY_ERRORS = {errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT}
+
+def update_lineage(record, *args, attempts=3):
+    """Apply a lineage.record_* change on the main database, after the application's own commit.
+
+    Lock conflicts are retried. Any other failure is logged rather than failing
+    the request; `python lineage.py rebuild` recovers it.
+    """
+    for attempt in range(1, attempts + 1):
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(prepared=True)
+            record(cursor, *args)
+            conn.commit()
+            cursor.close()
+            conn.close()
+            return
+        except Exception as e:
+            if conn is not None:
+                conn.close()  # Rolls back
+            if getattr(e, 'errno', None) in LINEAGE_RETRY_ERRORS and attempt < attempts:
+                continue
+            print(f"[lineage] {record.__name__}{args[:2]} failed, run `python lineage.py rebuild`: {e}")
+            return
+
+def receive_uploads(fields):
+    """Stream the multipart body into (form, uploads), checking each file as it arrives.
+
+    fields maps the accepted file fields to document types. Raises UploadRejected.
+    """
+    form, uploads = parse_stream(request.stream, request.content_type, request.content_length,
+                                 UPLOAD_CONFIG, UPLOAD_DIR, fields, upload_scanner)
+    g.upload_form = form  # request.form is empty once the stream has been read
+    g.uploads = uploads
+    return form, uploads
+
+@app.teardown_request
+def discard_unsaved_uploads(exc=None):
+    # Uploads of a request that was turned away after parsing are still temporary files
+    for upload in g.pop('uploads', []):
+        if not upload.saved:
+            upload.discard()
+
+def upload_rejected_response(error):
+    response = jsonify({'error': error.message})
+    # The rest of the body is never read, so the connection cannot be reused
+    response.headers['Connection'] = 'close'
+    return response, error.status
+
+admission = init_admission(app, ADMISSION_CONFIG, get_token_payload)
+
+# Mutating requests are buffered in memory and flushed to audit_log in batches
+audit_log = AuditLog(lambda: get_db_connection())
+init_audit(app, audit_log, get_token_payload)
+
+# Composed application details, reused while applications.version is unchanged
+application_cache = ApplicationCache()
+
+# Per-worker BK-trees of passport photo hashes for duplicate-person lookups, one per shard
+photo_indexes = {shard: PhotoIndex(lambda shard=shard: get_shard_connection(shard)) for shard in SHARDS}
+
+maintenance = MaintenanceScheduler(
+    MaintenanceContext(lambda: get_db_connection(), shard_router, UPLOAD_DIR,
+                       lambda: get_session_connection()), MAINTENANCE_CONFIG)
+
+@app.route('/api/admin/metrics/admission', methods=['GET'])
+def get_admission_metrics():
+    return jsonify(admission.snapshot()), 200
+
+@app.route('/api/admin/metrics/db-pools', methods=['GET'])
+def get_db_pool_metrics():
+    return jsonify({shard: pool.snapshot() for shard, pool in db_pools.items()}), 200
+
+@app.route('/api/admin/metrics/maintenance', methods=['GET'])
+def get_maintenance_metrics():
+    try:
+        return jsonify(maintenance.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 # Officer Authentication Routes
 @app.route('/api/officer/signup', methods=['POST'])
@@ -34,6 +278,9 @@ def officer_signup():
             if not data.get(field):
                 return jsonify({'error': f'{field} is required'}), 400
         
+        if not constituency_registry.contains(data['constituency'].strip()):
+            return jsonify({'error': 'Unknown constituency'}), 400
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -51,7 +298,7 @@ def officer_signup():
             INSERT INTO officers (id_number, email, phone_number, full_name, station, constituency, password_hash, status, created_at)
             VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending', %s)
         """, (data['idNumber'], data['email'], data['phoneNumber'], 
-              data['fullName'], data['station'], data['constituency'], hashed_password, datetime.now()))
+              data['fullName'], data['station'], data['constituency'].strip(), hashed_password, datetime.now()))
         
         conn.commit()
         cursor.close()
@@ -73,7 +320,7 @@ def officer_login():
             return jsonify({'error': 'Email and password are required'}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor(prepared=True, dictionary=True)
         
         # Get officer details including constituency
         cursor.execute("""
@@ -172,16 +419,13 @@ def admin_login():
 @app.route('/api/constituencies', methods=['GET'])
 def get_constituencies():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        version, constituencies = constituency_registry.all()
         
-        cursor.execute("SELECT id, name, created_at FROM constituencies ORDER BY name")
-        constituencies = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'constituencies': constituencies}), 200
+        # Browsers revalidate with If-None-Match and get a 304 until the list changes
+        response = jsonify({'constituencies': constituencies})
+        response.set_etag(f"constituencies-{version}", weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -206,7 +450,9 @@ def add_constituency():
         
         cursor.execute("INSERT INTO constituencies (name, created_at) VALUES (%s, %s)", 
                       (name, datetime.now()))
+        bump_version(cursor)
         conn.commit()
+        constituency_registry.invalidate()
         
         cursor.close()
         conn.close()
@@ -221,13 +467,18 @@ def delete_constituency(constituency_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        # The name comes from this worker's cached list rather than a read of the row
+        name = next((row['name'] for row in constituency_registry.all()[1] if row['id'] == constituency_id), None)
         cursor.execute("DELETE FROM constituencies WHERE id = %s", (constituency_id,))
         if cursor.rowcount == 0:
             cursor.close()
             conn.close()
             return jsonify({'error': 'Constituency not found'}), 404
             
+        bump_version(cursor)
         conn.commit()
+        record_change({'name': name}, {'name': None})
+        constituency_registry.invalidate()
         cursor.close()
         conn.close()
         
@@ -239,20 +490,112 @@ def delete_constituency(constituency_id):
 @app.route('/api/admin/officers/pending', methods=['GET'])
 def get_pending_officers():
     try:
+        page = request.args.get('page', 1, type=int)
+        page_size = request.args.get('pageSize', PENDING_OFFICERS_PAGE_SIZE, type=int)
+        if page < 1 or page_size < 1:
+            return jsonify({'error': 'page and pageSize must be positive'}), 400
+        page_size = min(page_size, MAX_PENDING_OFFICERS_PAGE_SIZE)
+        
+        conditions, params = ["status = 'pending'"], []
+        if request.args.get('station'):
+            conditions.append("station = %s")
+            params.append(request.args['station'])
+        if request.args.get('constituency'):
+            conditions.append("constituency = %s")
+            params.append(request.args['constituency'])
+        if request.args.get('search'):
+            # Prefix matches, so the id_number/email indexes still apply
+            search = request.args['search'].strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(full_name LIKE %s OR id_number LIKE %s OR email LIKE %s)")
+            params.extend([search] * 3)
+        where = " AND ".join(conditions)
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("""
-            SELECT id, id_number, email, phone_number, full_name, station, created_at
-            FROM officers WHERE status = 'pending'
-            ORDER BY created_at DESC
-        """)
+        cursor.execute(f"SELECT COUNT(*) AS total FROM officers WHERE {where}", params)
+        total = cursor.fetchone()['total']
+        
+        cursor.execute(f"""
+            SELECT id, id_number, email, phone_number, full_name, station, constituency, created_at, version
+            FROM officers WHERE {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s OFFSET %s
+        """, params + [page_size, (page - 1) * page_size])
         officers = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
-        return jsonify({'officers': officers}), 200
+        return jsonify({'officers': officers, 'total': total, 'page': page, 'pageSize': page_size}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/officers/import', methods=['POST'])
+def import_officers_csv():
+    try:
+        # Capped before anything is read; max_rows is only checked once the rows are parsed
+        if request.content_length is None:
+            return jsonify({'error': 'Content-Length is required'}), 411
+        if request.content_length > OFFICER_IMPORT_CONFIG['max_bytes']:
+            return jsonify({'error': f"At most {OFFICER_IMPORT_CONFIG['max_bytes'] // 1024} KB per import; "
+                                     "use python officers_bulk.py import for larger files"}), 413
+        
+        # A multipart upload in the "file" field, or the CSV as the request body
+        upload = request.files.get('file')
+        text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True)
+        
+        try:
+            # Quoted fields may span lines, so rows are only counted once parsed
+            officers = read_officers(io.StringIO(text, newline=''), lambda name: constituency_registry.contains(name))
+        except ImportRejected as e:
+            return jsonify({'error': 'Nothing was imported', 'rows': e.errors}), 400
+        if not officers:
+            return jsonify({'error': 'CSV file with a header row and at least one officer is required'}), 400
+        if len(officers) > OFFICER_IMPORT_CONFIG['max_rows']:
+            return jsonify({'error': f"At most {OFFICER_IMPORT_CONFIG['max_rows']} officers per import; "
+                                     "use python officers_bulk.py import for larger files"}), 413
+        
+        approve = request.args.get('approve') == 'true'
+        conn = get_db_connection()
+        try:
+            counts = import_officers(conn, officers, approve=approve,
+                                     workers=OFFICER_IMPORT_CONFIG['workers'],
+                                     batch_size=OFFICER_IMPORT_CONFIG['batch_size'])
+        except ImportRejected as e:
+            return jsonify({'error': 'Nothing was imported', 'rows': e.errors}), 400
+        finally:
+            conn.close()
+        
+        return jsonify({'message': f"{counts['created']} officers added, {counts['updated']} updated",
+                        **counts}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/officers/bulk-status', methods=['PUT'])
+def bulk_officer_status():
+    try:
+        data = request.get_json()
+        action = data.get('action')
+        officer_ids = data.get('officerIds')
+        
+        if action not in STATUS_ACTIONS:
+            return jsonify({'error': f"action must be one of: {', '.join(STATUS_ACTIONS)}"}), 400
+        if not officer_ids or not isinstance(officer_ids, list) or not all(isinstance(i, int) for i in officer_ids):
+            return jsonify({'error': 'officerIds must be a list of officer ids'}), 400
+        
+        conn = get_db_connection()
+        changed, skipped = set_status(conn, officer_ids, action)
+        conn.close()
+        status, applies_to = STATUS_ACTIONS[action]
+        record_change({'status': ', '.join(applies_to)}, {'status': status}, officers=changed)
+        
+        return jsonify({
+            'updated': changed,
+            'skipped': [{'id': officer_id, 'status': status} for officer_id, status in skipped.items()]
+        }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -260,16 +603,28 @@ def get_pending_officers():
 @app.route('/api/admin/officers/<int:officer_id>/approve', methods=['PUT'])
 def approve_officer(officer_id):
     try:
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(prepared=True)
         
-        cursor.execute("UPDATE officers SET status = 'approved' WHERE id = %s", (officer_id,))
-        conn.commit()
+        cursor.execute("""
+            UPDATE officers SET status = 'approved'
+            WHERE id = %s AND status = 'pending' AND (%s IS NULL OR version = %s)
+        """, (officer_id, expected_version, expected_version))
+        
+        if cursor.rowcount == 0:
+            return version_conflict(conn, cursor, 'officers', officer_id, expected_version,
+                                    'Officer not found or not pending')
         
+        conn.commit()
+        record_change({'status': 'pending'}, {'status': 'approved'})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Officer approved successfully'}), 200
+        return versioned_response({'message': 'Officer approved successfully'}, expected_version)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -277,21 +632,139 @@ def approve_officer(officer_id):
 @app.route('/api/admin/officers/<int:officer_id>/reject', methods=['PUT'])
 def reject_officer(officer_id):
     try:
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(prepared=True)
         
-        cursor.execute("UPDATE officers SET status = 'rejected' WHERE id = %s", (officer_id,))
-        conn.commit()
+        cursor.execute("""
+            UPDATE officers SET status = 'rejected'
+            WHERE id = %s AND status = 'pending' AND (%s IS NULL OR version = %s)
+        """, (officer_id, expected_version, expected_version))
+        
+        if cursor.rowcount == 0:
+            return version_conflict(conn, cursor, 'officers', officer_id, expected_version,
+                                    'Officer not found or not pending')
         
+        conn.commit()
+        record_change({'status': 'pending'}, {'status': 'rejected'})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Officer rejected'}), 200
+        return versioned_response({'message': 'Officer rejected'}, expected_version)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Application Routes
+# Application submissions; shared with the async routes in asgi.py
+APPLICATION_REQUIRED_FIELDS = ['fullNames', 'dateOfBirth', 'gender', 'fatherName', 'motherName',
+                               'districtOfBirth', 'tribe', 'homeDistrict', 'division',
+                               'constituency', 'location', 'subLocation', 'villageEstate', 'occupation']
+
+# Upload field -> documents.document_type
+APPLICATION_DOCUMENT_TYPES = {
+    'passportPhoto': 'passport_photo',
+    'birthCertificate': 'birth_certificate',
+    'parentsId': 'parent_id_front'
+}
+
+# Ids come from the application directory (shard_router.register), not AUTO_INCREMENT
+APPLICATION_INSERT = """
+    INSERT INTO applications (
+        id, application_number, officer_id, application_type,
+        full_names, date_of_birth, gender, father_name, mother_name,
+        marital_status, husband_name, husband_id_no,
+        district_of_birth, tribe, clan, family, home_district,
+        division, constituency, location, sub_location, village_estate,
+        home_address, occupation, supporting_documents, status, created_at
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+"""
+
+def application_params(data, application_id, application_number, officer_id):
+    return (
+        application_id, application_number, officer_id, 'new',
+        data['fullNames'], data['dateOfBirth'], data['gender'],
+        data['fatherName'], data['motherName'], data.get('maritalStatus'),
+        data.get('husbandName'), data.get('husbandIdNo'),
+        data['districtOfBirth'], data['tribe'], data.get('clan'),
+        data.get('family'), data['homeDistrict'], data['division'],
+        data['constituency'].strip(), data['location'], data['subLocation'],
+        data['villageEstate'], data.get('homeAddress'), data['occupation'],
+        json.dumps(data.get('supportingDocuments', {})), 'submitted', datetime.now()
+    )
+
+LOST_ID_REQUIRED_FIELDS = ['existing_id_number', 'ob_number', 'full_names']
+
+LOST_ID_DOCUMENT_TYPES = {
+    'ob_photo': 'ob_photo',
+    'passport_photo': 'passport_photo',
+    'birth_certificate': 'birth_certificate'
+}
+
+LOST_ID_INSERT = """
+    INSERT INTO applications (
+        id, application_number, officer_id, application_type,
+        full_names, date_of_birth, father_name, mother_name, home_district,
+        existing_id_number, renewal_reason, ob_number, constituency,
+        status, created_at
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+"""
+
+def lost_id_params(data, application_id, application_number, officer_id):
+    return (
+        application_id, application_number, officer_id, 'renewal',
+        data['full_names'], data.get('date_of_birth'),
+        data.get('father_name'), data.get('mother_name'), data.get('home_district'),
+        data['existing_id_number'], 'lost', data['ob_number'], (data.get('constituency') or '').strip() or None,
+        'submitted', datetime.now()
+    )
+
+def submission_error(data, required_fields):
+    """Why a submission's fields are unacceptable (its 400 message), or None.
+
+    Checks the constituency against the registry, which may reload from MySQL.
+    """
+    missing_fields = [field for field in required_fields if not data.get(field)]
+    if missing_fields:
+        return f'Missing required fields: {", ".join(missing_fields)}'
+    if data.get('constituency') and not constituency_registry.contains(data['constituency'].strip()):
+        return 'Unknown constituency'
+    return None
+
+APPROVED_OFFICER_QUERY = "SELECT id FROM officers WHERE id = %s AND status = 'approved'"
+
+DOCUMENT_INSERT = """
+    INSERT INTO documents (application_id, document_type, file_path, phash)
+    VALUES (%s, %s, %s, %s)
+"""
+
+def document_path(application_number, upload):
+    """Where a validated upload is kept, named after its application."""
+    return os.path.join(UPLOAD_DIR, f"{application_number}_{upload.field}_{secure_filename(upload.filename)}")
+
+# Tracking and ID search look at live applications first, then archived (closed) ones
+TRACK_QUERIES = tuple(f"""
+    SELECT application_number, full_names, status, created_at, updated_at
+    FROM {table} WHERE application_number = %s
+""" for table in ('applications', 'applications_archive'))
+
+ID_SEARCH_QUERIES = tuple(f"""
+    SELECT id, application_number, full_names, date_of_birth, gender,
+           generated_id_number, status, father_name, mother_name,
+           home_district, district_of_birth, division, constituency,
+           location, sub_location, tribe, village_estate
+    FROM {table}
+    WHERE generated_id_number = %s AND status IN ('approved', 'dispatched', 'ready_for_collection', 'collected')
+""" for table in ('applications', 'applications_archive'))
+
 @app.route('/api/applications', methods=['POST'])
 def submit_application():
     try:
@@ -301,28 +774,22 @@ def submit_application():
         if request.content_type and 'application/json' in request.content_type:
             # Handle JSON data
             data = request.get_json()
-            files = {}
+            uploads = []
             print("Processing JSON data:", list(data.keys()) if data else "No data")
         else:
-            # Handle form data with files
-            data = request.form.to_dict()
-            files = request.files
+            # Handle form data with files, rejecting bad uploads as soon as they show
+            try:
+                data, uploads = receive_uploads(APPLICATION_DOCUMENT_TYPES)
+            except UploadRejected as e:
+                return upload_rejected_response(e)
             print("Processing form data:", list(data.keys()) if data else "No data")
         
-        # Validate required fields
-        required_fields = ['fullNames', 'dateOfBirth', 'gender', 'fatherName', 'motherName', 
-                          'districtOfBirth', 'tribe', 'homeDistrict', 'division', 
-                          'constituency', 'location', 'subLocation', 'villageEstate', 'occupation']
-        
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            print("Missing required fields:", missing_fields)
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        # Validate required fields and the constituency
+        error = submission_error(data, APPLICATION_REQUIRED_FIELDS)
+        if error:
+            print("Rejected submission:", error)
+            return jsonify({'error': error}), 400
         
-        # Open connection
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # Determine submitting officer
         officer_id = None
 
@@ -342,80 +809,54 @@ def submit_application():
 
         # Validate officer
         if not officer_id:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Officer ID missing'}), 400
 
-        cursor.execute("SELECT id FROM officers WHERE id = %s AND status = 'approved'", (officer_id,))
+        conn = get_db_connection()
+        cursor = conn.cursor(prepared=True)
+        cursor.execute(APPROVED_OFFICER_QUERY, (officer_id,))
         officer_result = cursor.fetchone()
+        cursor.close()
+        conn.close()
         if not officer_result:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Invalid or unapproved officer'}), 400
 
-        # Generate application number (sequential per total count)
-        cursor.execute("SELECT COUNT(*) FROM applications")
-        count = cursor.fetchone()[0]
-        application_number = f"APP{datetime.now().year}{count + 1:06d}"
+        # Id and application number come from the global directory, which also
+        # records the shard that owns the constituency
+        try:
+            application_id, application_number, shard = shard_router.register(
+                'application', 'APP', data['constituency'])
+        except ShardMoving:
+            return shard_moving_response()
         
         print(f"Generated application number: {application_number}")
         
-        # Insert application
-        cursor.execute("""
-            INSERT INTO applications (
-                application_number, officer_id, application_type,
-                full_names, date_of_birth, gender, father_name, mother_name,
-                marital_status, husband_name, husband_id_no,
-                district_of_birth, tribe, clan, family, home_district,
-                division, constituency, location, sub_location, village_estate,
-                home_address, occupation, supporting_documents, status, created_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-        """, (
-            application_number, officer_id, 'new',
-            data['fullNames'], data['dateOfBirth'], data['gender'],
-            data['fatherName'], data['motherName'], data.get('maritalStatus'),
-            data.get('husbandName'), data.get('husbandIdNo'),
-            data['districtOfBirth'], data['tribe'], data.get('clan'),
-            data.get('family'), data['homeDistrict'], data['division'],
-            data['constituency'], data['location'], data['subLocation'],
-            data['villageEstate'], data.get('homeAddress'), data['occupation'],
-            json.dumps(data.get('supportingDocuments', {})), 'submitted', datetime.now()
-        ))
-        
-        application_id = cursor.lastrowid
-        
-        # Handle file uploads (only if files were sent)
-        upload_dir = 'uploads'
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        for file_key, file in files.items():
-            if file and file.filename:
-                # Create safe filename
-                filename = f"{application_number}_{file_key}_{file.filename}"
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                
-                # Map file types
-                doc_type_mapping = {
-                    'passportPhoto': 'passport_photo',
-                    'birthCertificate': 'birth_certificate', 
-                    'parentsId': 'parent_id_front'
-                }
+        conn = get_shard_connection(shard)
+        cursor = conn.cursor(prepared=True)
+        try:
+            # Insert application
+            cursor.execute(APPLICATION_INSERT, application_params(data, application_id, application_number, officer_id))
+            
+            # Move the validated uploads (already on disk) into place
+            for upload in uploads:
+                file_path = document_path(application_number, upload)
+                upload.save(file_path)
                 
-                doc_type = doc_type_mapping.get(file_key, file_key)
+                doc_type = APPLICATION_DOCUMENT_TYPES[upload.field]
+                phash = safe_dhash(file_path) if doc_type == 'passport_photo' else None
                 
                 # Insert document record
-                cursor.execute("""
-                    INSERT INTO documents (application_id, document_type, file_path)
-                    VALUES (%s, %s, %s)
-                """, (application_id, doc_type, file_path))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+                cursor.execute(DOCUMENT_INSERT, (application_id, doc_type, file_path, phash))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            shard_router.unregister(application_id)
+            for upload in uploads:
+                upload.discard()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
         
         return jsonify({
             'message': 'Application submitted successfully',
@@ -428,17 +869,25 @@ def submit_application():
 @app.route('/api/applications/track/<application_number>', methods=['GET'])
 def track_application(application_number):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT application_number, full_names, status, created_at, updated_at
-            FROM applications WHERE application_number = %s
-        """, (application_number,))
+        # The directory names the shard; unknown numbers never reach the shards
+        shards = shard_router.locate_number(application_number)
         
-        application = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        application = None
+        for shard in shards:
+            conn = get_shard_connection(shard)
+            cursor = conn.cursor(prepared=True, dictionary=True)
+            
+            # Falls back to archived (closed) applications
+            for query in TRACK_QUERIES:
+                cursor.execute(query, (application_number,))
+                application = cursor.fetchone()
+                if application:
+                    break
+            
+            cursor.close()
+            conn.close()
+            if application:
+                break
         
         if not application:
             return jsonify({'error': 'Application not found'}), 404
@@ -455,7 +904,7 @@ def get_approved_officers():
         cursor = conn.cursor(dictionary=True)
         
         cursor.execute("""
-            SELECT id, id_number, email, phone_number, full_name, station, status, created_at
+            SELECT id, id_number, email, phone_number, full_name, station, status, created_at, version
             FROM officers WHERE status IN ('approved', 'suspended')
             ORDER BY created_at DESC
         """)
@@ -472,23 +921,14 @@ def get_approved_officers():
 @app.route('/api/admin/applications', methods=['GET'])
 def get_all_applications():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get only pending applications (submitted status)
-        cursor.execute("""
+        # Get only pending applications (submitted status), from every shard
+        applications = attach_officers(scatter_rows("""
             SELECT a.id, a.application_number, a.full_names, a.status, 
-                   a.application_type, a.created_at, a.updated_at,
-                   o.full_name as officer_name
+                   a.application_type, a.created_at, a.updated_at, a.version, a.officer_id
             FROM applications a 
-            LEFT JOIN officers o ON a.officer_id = o.id
             WHERE a.status = 'submitted'
             ORDER BY a.created_at DESC
-        """)
-        
-        applications = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        """, order_by='created_at', descending=True))
         
         return jsonify({'applications': applications}), 200
         
@@ -498,22 +938,14 @@ def get_all_applications():
 @app.route('/api/admin/applications/history', methods=['GET'])
 def get_application_history():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get all applications regardless of status
-        cursor.execute("""
+        # Get all applications regardless of status, from every shard
+        applications = attach_officers(scatter_rows("""
             SELECT a.id, a.application_number, a.full_names, a.status, 
                    a.application_type, a.created_at, a.updated_at,
-                   a.generated_id_number, o.full_name as officer_name
+                   a.generated_id_number, a.officer_id
             FROM applications a 
-            LEFT JOIN officers o ON a.officer_id = o.id
             ORDER BY a.created_at DESC
-        """)
-        
-        applications = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        """, order_by='created_at', descending=True))
         
         return jsonify({'applications': applications}), 200
         
@@ -523,37 +955,122 @@ def get_application_history():
 @app.route('/api/admin/applications/<int:application_id>', methods=['GET'])
 def get_application_details(application_id):
     try:
-        conn = get_db_connection()
+        conn, error = application_connection(application_id)
+        if error:
+            return error
         cursor = conn.cursor(dictionary=True)
         
-        # Get application details
+        # A cached copy is only good while the version still matches; the
+        # bookkeeping columns do not bump it, so they are always read fresh
+        if application_id in application_cache:
+            cursor.execute(f"""
+                SELECT version, {', '.join(APPLICATION_BOOKKEEPING_COLUMNS)} FROM applications WHERE id = %s
+            """, (application_id,))
+            row = cursor.fetchone()
+            application = application_cache.get(application_id, row['version']) if row else None
+            if application:
+                cursor.close()
+                conn.close()
+                return etag_response({'application': {**application, **row}}, application['version'])
+        
+        # Application, documents, payments and status timeline in one round trip
         cursor.execute("""
-            SELECT a.*, o.full_name as officer_name
+            SELECT a.*,
+                   (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                        'document_type', d.document_type, 'file_path', d.file_path,
+                        'uploaded_at', d.uploaded_at))
+                    FROM documents d WHERE d.application_id = a.id) AS documents_json,
+                   (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                        'id', p.id, 'amount', p.amount, 'payment_method', p.payment_method,
+                        'mpesa_transaction_id', p.mpesa_transaction_id, 'status', p.status,
+                        'created_at', p.created_at))
+                    FROM payments p WHERE p.application_id = a.id) AS payments_json,
+                   (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                        'old_status', h.old_status, 'new_status', h.new_status,
+                        'changed_by_admin_id', h.changed_by_admin_id,
+                        'changed_by_officer_id', h.changed_by_officer_id,
+                        'changed_at', h.changed_at, 'notes', h.notes))
+                    FROM status_history h WHERE h.application_id = a.id) AS timeline_json
             FROM applications a 
-            LEFT JOIN officers o ON a.officer_id = o.id
             WHERE a.id = %s
         """, (application_id,))
         
         application = cursor.fetchone()
+        cursor.close()
+        conn.close()
         
         if not application:
-            cursor.close()
-            conn.close()
+            application_cache.discard(application_id)
             return jsonify({'error': 'Application not found'}), 404
         
-        # Get supporting documents
-        cursor.execute("""
-            SELECT document_type, file_path
-            FROM documents WHERE application_id = %s
-        """, (application_id,))
+        application['documents'] = json.loads(application.pop('documents_json') or '[]')
+        application['payments'] = sorted(json.loads(application.pop('payments_json') or '[]'),
+                                         key=lambda payment: payment['created_at'] or '')
+        application['timeline'] = sorted(json.loads(application.pop('timeline_json') or '[]'),
+                                         key=lambda entry: entry['changed_at'] or '')
+        attach_officers([application], station=True, keep_id=True)
         
-        documents = cursor.fetchall()
-        application['documents'] = documents
+        application_cache.put(application_id, application['version'], application)
+        
+        return etag_response({'application': application}, application['version'])
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/applications/<int:application_id>/duplicates', methods=['GET'])
+def find_duplicate_photos(application_id):
+    try:
+        radius = request.args.get('radius', str(DEFAULT_RADIUS))
+        if not radius.isdigit():
+            return jsonify({'error': 'radius must be a non-negative integer'}), 400
+        radius = min(int(radius), 16)
+        
+        conn, error = application_connection(application_id)
+        if error:
+            return error
+        cursor = conn.cursor()
         
+        cursor.execute("""
+            SELECT phash FROM documents
+            WHERE application_id = %s AND document_type = 'passport_photo' AND phash IS NOT NULL
+        """, (application_id,))
+        hashes = [row[0] for row in cursor.fetchall()]
         cursor.close()
         conn.close()
         
-        return jsonify({'application': application}), 200
+        if not hashes:
+            return jsonify({'error': 'No hashed passport photo for this application'}), 404
+        
+        # Closest distance per other application, searching every shard's index
+        distances = {}
+        match_shards = {}
+        for shard, index in photo_indexes.items():
+            for value in hashes:
+                for distance, match_id in index.find(value, radius):
+                    if match_id != application_id and distance < distances.get(match_id, radius + 1):
+                        distances[match_id] = distance
+                        match_shards[match_id] = shard
+        
+        def load_matches(shard, conn):
+            ids = [match_id for match_id, match_shard in match_shards.items() if match_shard == shard]
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, application_number, full_names, date_of_birth, status, generated_id_number
+                FROM applications WHERE id IN ({', '.join(['%s'] * len(ids))})
+            """, ids)
+            rows = fetch_rows(cursor)
+            cursor.close()
+            return rows
+        
+        matches = []
+        if distances:
+            results = shard_router.scatter(load_matches, set(match_shards.values()))
+            matches = [match for rows in results.values() for match in rows]
+            for match in matches:
+                match['distance'] = distances[match['id']]
+            matches.sort(key=lambda match: match['distance'])
+        
+        return jsonify({'radius': radius, 'matches': matches}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -561,14 +1078,20 @@ def get_application_details(application_id):
 @app.route('/api/admin/applications/<int:application_id>/approve', methods=['PUT'])
 def approve_application(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True, dictionary=True)
 
         print(f"[approve_application] Start - application_id={application_id}")
 
         # Get application details to check if it's a renewal
         cursor.execute("""
-            SELECT application_type, existing_id_number 
+            SELECT application_type, existing_id_number, application_number, full_names, created_at, status
             FROM applications 
             WHERE id = %s
         """, (application_id,))
@@ -584,52 +1107,47 @@ def approve_application(application_id):
         if app_details['application_type'] == 'renewal' and app_details['existing_id_number']:
             # For renewals, just update status - don't change the generated_id_number
             id_number = app_details['existing_id_number']
+            issued_type = 'renewal'
             cursor.execute("""
                 UPDATE applications 
-                SET status = 'approved', updated_at = %s
-                WHERE id = %s
-            """, (datetime.now(), application_id))
+                SET status = 'approved', updated_at = %s,
+                    claimed_by_admin_id = NULL, claim_expires_at = NULL
+                WHERE id = %s AND (%s IS NULL OR version = %s)
+            """, (datetime.now(), application_id, expected_version, expected_version))
         else:
-            # Generate new ID number for new applications using proper sequence
-            year = datetime.now().year
-            prefix = f"ID{year}"
-
-            # Note: avoid passing a value with '%' via params; use CONCAT to append wildcard in SQL.
-            cursor.execute("""
-                SELECT COALESCE(MAX(CAST(SUBSTRING(generated_id_number, 7) AS UNSIGNED)), 0) AS max_id
-                FROM applications
-                WHERE generated_id_number LIKE CONCAT(%s, '%%')
-            """, (prefix,))
-            result = cursor.fetchone()
-            max_id = result['max_id'] if result and result['max_id'] is not None else 0
+            # Generate new ID number from the global sequence, shared by every shard
+            id_number = shard_router.next_id_number()
+            issued_type = 'new'
 
-            print(f"[approve_application] year={year}, prefix={prefix}, max_id={max_id}")
-
-            # Build next ID number
-            id_number = f"{prefix}{int(max_id) + 1:08d}"
+            print(f"[approve_application] id_number={id_number}")
 
             # Update application status and assign new ID number
             cursor.execute("""
                 UPDATE applications 
-                SET status = 'approved', generated_id_number = %s, updated_at = %s
-                WHERE id = %s
-            """, (id_number, datetime.now(), application_id))
+                SET status = 'approved', generated_id_number = %s, updated_at = %s,
+                    claimed_by_admin_id = NULL, claim_expires_at = NULL
+                WHERE id = %s AND (%s IS NULL OR version = %s)
+            """, (id_number, datetime.now(), application_id, expected_version, expected_version))
 
         if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Application not found'}), 404
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found')
 
         conn.commit()
+        record_change(app_details, {'status': 'approved', 'id_number': id_number})
         cursor.close()
         conn.close()
 
+        # Original issue or the next replacement in this ID number's lineage
+        update_lineage(record_issue, id_number, application_id, app_details['application_number'],
+                       issued_type, app_details['full_names'], app_details['created_at'])
+
         print(f"[approve_application] Success - application_id={application_id}, id_number={id_number}")
 
-        return jsonify({
+        return versioned_response({
             'message': 'Application approved successfully',
             'id_number': id_number
-        }), 200
+        }, expected_version)
 
     except Exception as e:
         # Log the error for debugging
@@ -639,26 +1157,159 @@ def approve_application(application_id):
 @app.route('/api/admin/applications/<int:application_id>/reject', methods=['PUT'])
 def reject_application(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True, dictionary=True)
         
         # Update application status
         cursor.execute("""
             UPDATE applications 
-            SET status = 'rejected', updated_at = %s
-            WHERE id = %s
-        """, (datetime.now(), application_id))
+            SET status = 'rejected', updated_at = %s,
+                claimed_by_admin_id = NULL, claim_expires_at = NULL
+            WHERE id = %s AND (%s IS NULL OR version = %s)
+        """, (datetime.now(), application_id, expected_version, expected_version))
+        
+        if cursor.rowcount == 0:
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found')
+        
+        conn.commit()
+        record_change(None, {'status': 'rejected'})
+        cursor.close()
+        conn.close()
+        
+        update_lineage(record_rejection, application_id)
+        
+        return versioned_response({'message': 'Application rejected successfully'}, expected_version)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/applications/claim', methods=['POST'])
+def claim_applications():
+    try:
+        payload = get_token_payload()
+        admin_id = payload.get('admin_id') if payload else None
+        if not admin_id:
+            return jsonify({'error': 'Admin authentication required'}), 401
+        
+        data = request.get_json(silent=True) or {}
+        count = data.get('count', 10)
+        if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+            return jsonify({'error': 'count must be a positive integer'}), 400
+        count = min(count, 100)
+        
+        now = datetime.now()
+        expires_at = now + timedelta(minutes=CLAIM_LEASE_MINUTES)
+        # Constituencies switching shards are left alone until the move finishes
+        moving = shard_router.moving() or ['']
+        moving_placeholders = ', '.join(['%s'] * len(moving))
+        
+        # Split the claim across shards by where the oldest open submissions are
+        shares = {shard_router.names()[0]: count}
+        if len(SHARDS) > 1:
+            def oldest_open(shard, conn):
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT created_at FROM applications
+                    WHERE status = 'submitted'
+                      AND (claim_expires_at IS NULL OR claim_expires_at < %s)
+                      AND constituency NOT IN ({moving_placeholders})
+                    ORDER BY created_at
+                    LIMIT %s
+                """, (now, *moving, count))
+                rows = [(created_at or datetime.min, shard) for (created_at,) in cursor.fetchall()]
+                cursor.close()
+                return rows
+            
+            candidates = sorted(row for rows in shard_router.scatter(oldest_open).values() for row in rows)
+            shares = Counter(shard for _, shard in candidates[:count])
+        
+        def claim_on_shard(shard, conn):
+            cursor = conn.cursor(dictionary=True)
+            
+            # Take the oldest unclaimed (or lease-expired) submissions; rows another
+            # admin is claiming right now are skipped instead of waited on
+            cursor.execute(f"""
+                SELECT id FROM applications
+                WHERE status = 'submitted'
+                  AND (claim_expires_at IS NULL OR claim_expires_at < %s)
+                  AND constituency NOT IN ({moving_placeholders})
+                ORDER BY created_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (now, *moving, shares[shard]))
+            ids = [row['id'] for row in cursor.fetchall()]
+            
+            claimed = []
+            if ids:
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f"""
+                    UPDATE applications
+                    SET claimed_by_admin_id = %s, claim_expires_at = %s
+                    WHERE id IN ({placeholders})
+                """, (admin_id, expires_at, *ids))
+                
+                cursor.execute(f"""
+                    SELECT a.id, a.application_number, a.full_names, a.status, 
+                           a.application_type, a.created_at, a.updated_at,
+                           a.claim_expires_at, a.version, a.officer_id
+                    FROM applications a 
+                    WHERE a.id IN ({placeholders})
+                    ORDER BY a.created_at
+                """, ids)
+                claimed = cursor.fetchall()
+            
+            conn.commit()
+            cursor.close()
+            return claimed
+        
+        applications = []
+        for claimed in shard_router.scatter(claim_on_shard, shares).values():
+            applications.extend(claimed)
+        applications.sort(key=lambda application: application['created_at'])
+        attach_officers(applications)
+        
+        return jsonify({'applications': applications, 'claimExpiresAt': expires_at}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/applications/<int:application_id>/claim', methods=['DELETE'])
+def release_application_claim(application_id):
+    try:
+        payload = get_token_payload()
+        admin_id = payload.get('admin_id') if payload else None
+        if not admin_id:
+            return jsonify({'error': 'Admin authentication required'}), 401
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE applications
+            SET claimed_by_admin_id = NULL, claim_expires_at = NULL
+            WHERE id = %s AND claimed_by_admin_id = %s
+        """, (application_id, admin_id))
         
         if cursor.rowcount == 0:
             cursor.close()
             conn.close()
-            return jsonify({'error': 'Application not found'}), 404
+            return jsonify({'error': 'No claim held on this application'}), 404
         
         conn.commit()
+        record_change({'claimed_by_admin_id': admin_id}, {'claimed_by_admin_id': None})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Application rejected successfully'}), 200
+        return jsonify({'message': 'Claim released'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -666,23 +1317,15 @@ def reject_application(application_id):
 @app.route('/api/admin/applications/dispatch', methods=['GET'])
 def get_dispatch_applications():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
         query = """
             SELECT a.id, a.application_number, a.full_names, a.application_type, 
-                   a.generated_id_number, a.created_at, a.updated_at, o.full_name as officer_name
+                   a.generated_id_number, a.created_at, a.updated_at, a.version, a.officer_id
             FROM applications a
-            LEFT JOIN officers o ON a.officer_id = o.id
             WHERE a.status = 'ready_for_dispatch'
             ORDER BY a.updated_at DESC
         """
         
-        cursor.execute(query)
-        applications = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        applications = attach_officers(scatter_rows(query, order_by='updated_at', descending=True))
         
         return jsonify({'applications': applications}), 200
         
@@ -692,23 +1335,15 @@ def get_dispatch_applications():
 @app.route('/api/admin/applications/preview', methods=['GET'])
 def get_preview_applications():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
         query = """
             SELECT a.id, a.application_number, a.full_names, a.application_type, 
-                   a.generated_id_number, a.created_at, a.updated_at, o.full_name as officer_name
+                   a.generated_id_number, a.created_at, a.updated_at, a.version, a.officer_id
             FROM applications a
-            LEFT JOIN officers o ON a.officer_id = o.id
             WHERE a.status = 'approved'
             ORDER BY a.updated_at DESC
         """
         
-        cursor.execute(query)
-        applications = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        applications = attach_officers(scatter_rows(query, order_by='updated_at', descending=True))
         
         return jsonify({'applications': applications}), 200
         
@@ -718,26 +1353,32 @@ def get_preview_applications():
 @app.route('/api/admin/applications/<int:application_id>/print', methods=['PUT'])
 def print_application(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True)
         
         # Update application status to 'ready_for_dispatch' (printed, ready for dispatch)
         cursor.execute("""
             UPDATE applications 
             SET status = 'ready_for_dispatch', updated_at = %s
-            WHERE id = %s AND status = 'approved'
-        """, (datetime.now(), application_id))
+            WHERE id = %s AND status = 'approved' AND (%s IS NULL OR version = %s)
+        """, (datetime.now(), application_id, expected_version, expected_version))
         
         if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Application not found or not in approved status'}), 404
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found or not in approved status')
         
         conn.commit()
+        record_change({'status': 'approved'}, {'status': 'ready_for_dispatch'})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Application marked as printed successfully'}), 200
+        return versioned_response({'message': 'Application marked as printed successfully'}, expected_version)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -745,30 +1386,276 @@ def print_application(application_id):
 @app.route('/api/admin/applications/<int:application_id>/dispatch', methods=['PUT'])
 def dispatch_application(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True, dictionary=True)
         
         # Update application status to dispatched
         cursor.execute("""
             UPDATE applications 
             SET status = 'dispatched', updated_at = %s
-            WHERE id = %s AND status = 'ready_for_dispatch'
-        """, (datetime.now(), application_id))
+            WHERE id = %s AND status = 'ready_for_dispatch' AND (%s IS NULL OR version = %s)
+        """, (datetime.now(), application_id, expected_version, expected_version))
+        
+        if cursor.rowcount == 0:
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found or not approved')
+        
+        conn.commit()
+        record_change({'status': 'ready_for_dispatch'}, {'status': 'dispatched'})
+        cursor.close()
+        conn.close()
+        
+        return versioned_response({'message': 'Application dispatched successfully'}, expected_version)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Dispatch Manifest Routes
+@app.route('/api/admin/manifests', methods=['POST'])
+def create_manifests():
+    try:
+        payload = get_token_payload()
+        admin_id = payload.get('admin_id') if payload else None
+        data = request.get_json(silent=True) or {}
+        
+        now = datetime.now()
+        moving = shard_router.moving() or ['']
+        
+        def create_on_shard(shard, conn):
+            cursor = conn.cursor()
+            
+            # One manifest per constituency with unmanifested printed cards
+            query = f"""
+                SELECT constituency, COUNT(*)
+                FROM applications
+                WHERE status = 'ready_for_dispatch' AND manifest_id IS NULL AND constituency IS NOT NULL
+                  AND constituency NOT IN ({', '.join(['%s'] * len(moving))})
+            """
+            params = tuple(moving)
+            if data.get('constituency'):
+                query += " AND constituency = %s"
+                params += (data['constituency'],)
+            cursor.execute(query + " GROUP BY constituency", params)
+            groups = cursor.fetchall()
+            
+            created = []
+            for constituency, _ in groups:
+                cursor.execute("""
+                    INSERT INTO dispatch_manifests (constituency, status, created_by_admin_id, created_at)
+                    VALUES (%s, 'open', %s, %s)
+                """, (constituency, admin_id, now))
+                manifest_id = cursor.lastrowid
+                manifest_number = f"MAN{now.year}{manifest_id:06d}"
+                cursor.execute("UPDATE dispatch_manifests SET manifest_number = %s WHERE id = %s",
+                              (manifest_number, manifest_id))
+                
+                cursor.execute("""
+                    UPDATE applications SET manifest_id = %s
+                    WHERE status = 'ready_for_dispatch' AND manifest_id IS NULL AND constituency = %s
+                """, (manifest_id, constituency))
+                
+                created.append({
+                    'id': manifest_id,
+                    'manifest_number': manifest_number,
+                    'constituency': constituency,
+                    'card_count': cursor.rowcount
+                })
+            
+            conn.commit()
+            cursor.close()
+            return created
+        
+        manifests = [manifest for created in shard_router.scatter(create_on_shard).values()
+                     for manifest in created]
+        
+        return jsonify({'manifests': manifests}), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/manifests', methods=['GET'])
+def get_manifests():
+    try:
+        query = """
+            SELECT m.id, m.manifest_number, m.constituency, m.status, m.created_at,
+                   m.dispatched_at, m.arrived_at, COUNT(a.id) as card_count
+            FROM dispatch_manifests m
+            LEFT JOIN applications a ON a.manifest_id = m.id
+        """
+        conditions, params = [], []
+        if request.args.get('status'):
+            conditions.append("m.status = %s")
+            params.append(request.args['status'])
+        if request.args.get('constituency'):
+            conditions.append("m.constituency = %s")
+            params.append(request.args['constituency'])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " GROUP BY m.id ORDER BY m.created_at DESC"
+        
+        manifests = scatter_rows(query, params, order_by='created_at', descending=True)
+        
+        return jsonify({'manifests': manifests}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/manifests/<int:manifest_id>', methods=['GET'])
+def get_manifest(manifest_id):
+    try:
+        conn, error = manifest_connection(manifest_id)
+        if error:
+            return error
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, manifest_number, constituency, status, created_at, dispatched_at, arrived_at
+            FROM dispatch_manifests WHERE id = %s
+        """, (manifest_id,))
+        manifests = fetch_rows(cursor)
+        
+        if not manifests:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Manifest not found'}), 404
+        
+        manifest = manifests[0]
+        cursor.execute("""
+            SELECT id, application_number, full_names, generated_id_number, status
+            FROM applications WHERE manifest_id = %s
+            ORDER BY application_number
+        """, (manifest_id,))
+        manifest['applications'] = fetch_rows(cursor)
+        
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'manifest': manifest}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/manifests/<int:manifest_id>/dispatch', methods=['PUT'])
+def dispatch_manifest(manifest_id):
+    try:
+        conn, error = manifest_connection(manifest_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor()
+        now = datetime.now()
+        
+        cursor.execute("""
+            UPDATE dispatch_manifests
+            SET status = 'dispatched', dispatched_at = %s
+            WHERE id = %s AND status = 'open'
+        """, (now, manifest_id))
         
         if cursor.rowcount == 0:
             cursor.close()
             conn.close()
-            return jsonify({'error': 'Application not found or not approved'}), 404
+            return jsonify({'error': 'Manifest not found or already dispatched'}), 404
+        
+        cursor.execute("""
+            UPDATE applications 
+            SET status = 'dispatched', updated_at = %s
+            WHERE manifest_id = %s AND status = 'ready_for_dispatch'
+        """, (now, manifest_id))
+        dispatched = cursor.rowcount
         
         conn.commit()
+        record_change({'status': 'open'}, {'status': 'dispatched'}, cards=dispatched)
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Application dispatched successfully'}), 200
+        return jsonify({'message': 'Manifest dispatched successfully', 'dispatched': dispatched}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def manifest_connection(manifest_id, for_write=False):
+    """Connection to the shard holding a manifest. Returns (conn, error_response)."""
+    shard = shard_router.find_row('dispatch_manifests', manifest_id)
+    if shard is None:
+        return None, (jsonify({'error': 'Manifest not found'}), 404)
+    
+    conn = get_shard_connection(shard)
+    if for_write:
+        cursor = conn.cursor()
+        cursor.execute("SELECT constituency FROM dispatch_manifests WHERE id = %s", (manifest_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        if row and row[0] in shard_router.moving():
+            conn.close()
+            return None, shard_moving_response()
+    return conn, None
+
+def update_manifest_cards(manifest_id, from_status, to_status):
+    """Move a manifest's cards (or only the scanned applicationNumbers) between statuses in one statement."""
+    data = request.get_json(silent=True) or {}
+    application_numbers = data.get('applicationNumbers') or []
+    
+    conn, error = manifest_connection(manifest_id, for_write=True)
+    if error:
+        return error
+    cursor = conn.cursor()
+    now = datetime.now()
+    
+    cursor.execute("SELECT status FROM dispatch_manifests WHERE id = %s", (manifest_id,))
+    manifest = cursor.fetchone()
+    if not manifest or manifest[0] == 'open':
+        cursor.close()
+        conn.close()
+        return jsonify({'error': 'Manifest not found or not dispatched'}), 404
+    
+    query = """
+        UPDATE applications 
+        SET status = %s, updated_at = %s
+        WHERE manifest_id = %s AND status = %s
+    """
+    params = [to_status, now, manifest_id, from_status]
+    if application_numbers:
+        query += f" AND application_number IN ({', '.join(['%s'] * len(application_numbers))})"
+        params.extend(application_numbers)
+    cursor.execute(query, params)
+    updated = cursor.rowcount
+    record_change({'card_status': from_status}, {'card_status': to_status}, cards=updated)
+    
+    # Close the manifest once nothing on it is still in transit
+    cursor.execute("""
+        UPDATE dispatch_manifests m
+        SET m.status = 'arrived', m.arrived_at = %s
+        WHERE m.id = %s AND m.status = 'dispatched'
+          AND NOT EXISTS (
+              SELECT 1 FROM applications a WHERE a.manifest_id = m.id AND a.status = 'dispatched'
+          )
+    """, (now, manifest_id))
+    
+    conn.commit()
+    cursor.close()
+    conn.close()
+    
+    return jsonify({'updated': updated, 'requested': len(application_numbers) or None}), 200
+
+@app.route('/api/officer/manifests/<int:manifest_id>/arrived', methods=['PUT'])
+def mark_manifest_arrived(manifest_id):
+    try:
+        return update_manifest_cards(manifest_id, 'dispatched', 'ready_for_collection')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/officer/manifests/<int:manifest_id>/collected', methods=['PUT'])
+def mark_manifest_collected(manifest_id):
+    try:
+        return update_manifest_cards(manifest_id, 'ready_for_collection', 'collected')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Officer Application Management Routes
 @app.route('/api/officer/applications', methods=['GET'])
 def get_officer_applications():
@@ -782,10 +1669,10 @@ def get_officer_applications():
         # First get the officer's constituency and station
         cursor.execute("SELECT station, constituency FROM officers WHERE id = %s", (officer_id,))
         officer_result = cursor.fetchone()
+        cursor.close()
+        conn.close()
         
         if not officer_result:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Officer not found'}), 404
         
         officer_station = (officer_result[0] or '').strip()
@@ -795,34 +1682,36 @@ def get_officer_applications():
         location_key = officer_constituency if officer_constituency else officer_station
         
         if not location_key:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Officer has no constituency or station set'}), 400
         
-        # Get all applications from the officer's constituency or ones processed by this officer
-        cursor.execute("""
-            SELECT id, application_number, full_names, status, created_at, 
-                   updated_at, generated_id_number
-            FROM applications 
-            WHERE (TRIM(constituency) = %s OR officer_id = %s)
-            ORDER BY created_at DESC
-        """, (location_key, officer_id,))
+        # The constituency's own shard has its applications; the others can only
+        # hold ones this officer processed elsewhere
+        owning_shard = shard_router.shard_for_constituency(location_key)
         
-        applications = []
-        for row in cursor.fetchall():
-            app = {
-                'id': row[0],
-                'application_number': row[1],
-                'full_names': row[2],
-                'status': row[3],
-                'created_at': row[4].isoformat() if row[4] else None,
-                'updated_at': row[5].isoformat() if row[5] else None,
-                'generated_id_number': row[6]
-            }
-            applications.append(app)
+        def officer_rows(shard, conn):
+            cursor = conn.cursor()
+            if shard == owning_shard:
+                cursor.execute("""
+                    SELECT id, application_number, full_names, status, created_at, 
+                           updated_at, generated_id_number, version
+                    FROM applications 
+                    WHERE (constituency = %s OR officer_id = %s)
+                    ORDER BY created_at DESC
+                """, (location_key, officer_id,))
+            else:
+                cursor.execute("""
+                    SELECT id, application_number, full_names, status, created_at, 
+                           updated_at, generated_id_number, version
+                    FROM applications 
+                    WHERE officer_id = %s
+                    ORDER BY created_at DESC
+                """, (officer_id,))
+            rows = fetch_rows(cursor)
+            cursor.close()
+            return rows
         
-        cursor.close()
-        conn.close()
+        applications = [row for rows in shard_router.scatter(officer_rows).values() for row in rows]
+        applications.sort(key=lambda row: (row['created_at'] is not None, row['created_at'] or 0), reverse=True)
         
         return jsonify(applications), 200
         
@@ -832,23 +1721,31 @@ def get_officer_applications():
 @app.route('/api/officer/applications/<int:application_id>/card-arrived', methods=['PUT'])
 def mark_card_arrived(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True)
         
         cursor.execute("""
             UPDATE applications 
             SET status = 'ready_for_collection', updated_at = %s 
-            WHERE id = %s AND status = 'dispatched'
-        """, (datetime.now(), application_id))
+            WHERE id = %s AND status = 'dispatched' AND (%s IS NULL OR version = %s)
+        """, (datetime.now(), application_id, expected_version, expected_version))
         
         if cursor.rowcount == 0:
-            return jsonify({'error': 'Application not found or not in dispatched status'}), 404
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found or not in dispatched status')
         
         conn.commit()
+        record_change({'status': 'dispatched'}, {'status': 'ready_for_collection'})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Card arrival confirmed'}), 200
+        return versioned_response({'message': 'Card arrival confirmed'}, expected_version)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -856,23 +1753,31 @@ def mark_card_arrived(application_id):
 @app.route('/api/officer/applications/<int:application_id>/card-collected', methods=['PUT'])
 def mark_card_collected(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True)
         
         cursor.execute("""
             UPDATE applications 
             SET status = 'collected', updated_at = %s 
-            WHERE id = %s AND (status = 'ready_for_collection' OR (status IN ('', 'dispatched') AND generated_id_number IS NOT NULL))
-        """, (datetime.now(), application_id))
+            WHERE id = %s AND (status = 'ready_for_collection' OR (status IN ('', 'dispatched') AND generated_id_number IS NOT NULL)) AND (%s IS NULL OR version = %s)
+        """, (datetime.now(), application_id, expected_version, expected_version))
         
         if cursor.rowcount == 0:
-            return jsonify({'error': 'Application not found or card not arrived yet'}), 404
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found or card not arrived yet')
         
         conn.commit()
+        record_change(None, {'status': 'collected'})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Card collection confirmed'}), 200
+        return versioned_response({'message': 'Card collection confirmed'}, expected_version)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -881,21 +1786,28 @@ def mark_card_collected(application_id):
 @app.route('/api/applications/search-by-id/<id_number>', methods=['GET'])
 def search_application_by_id(id_number):
     try:
+        # The lineage names the application that issued the ID, and so its shard;
+        # IDs issued before the lineage was kept are looked for on every shard
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT id, application_number, full_names, date_of_birth, gender,
-                   generated_id_number, status, father_name, mother_name, 
-                   home_district, district_of_birth, division, constituency,
-                   location, sub_location, tribe, village_estate
-            FROM applications 
-            WHERE generated_id_number = %s AND status IN ('approved', 'dispatched', 'ready_for_collection', 'collected')
-        """, (id_number,))
-        
-        application = cursor.fetchone()
+        cursor = conn.cursor(prepared=True)
+        original_id = original_application(cursor, id_number)
         cursor.close()
         conn.close()
+        shard = shard_router.locate(original_id) if original_id else None
+        
+        def find(shard, conn):
+            cursor = conn.cursor(dictionary=True)
+            # Falls back to archived (collected) applications
+            for query in ID_SEARCH_QUERIES:
+                cursor.execute(query, (id_number,))
+                application = cursor.fetchone()
+                if application:
+                    break
+            cursor.close()
+            return application
+        
+        application = next((found for found in shard_router.scatter(find, [shard] if shard else None).values()
+                            if found), None)
         
         if not application:
             return jsonify({'error': 'ID not found or not issued yet'}), 404
@@ -905,22 +1817,46 @@ def search_application_by_id(id_number):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/applications/id-history/<id_number>', methods=['GET'])
+def get_id_history(id_number):
+    """Every card issued under an ID number and every replacement request, from id_lineage."""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(prepared=True)
+        chain = issuance_chain(cursor, id_number)
+        cursor.close()
+        conn.close()
+        
+        if not chain:
+            return jsonify({'error': 'No history for this ID number'}), 404
+        
+        return jsonify({
+            'idNumber': id_number.strip().upper(),
+            'timesReplaced': sum(1 for entry in chain
+                                 if entry['application_type'] == 'renewal' and entry['status'] == 'issued'),
+            'chain': chain
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/applications/lost-id', methods=['POST'])
 def submit_lost_id_application():
     try:
         print("Received lost ID application request")
         
-        # Handle form data with files
-        data = request.form.to_dict()
-        files = request.files
+        # Handle form data with files, rejecting bad uploads as soon as they show
+        try:
+            data, uploads = receive_uploads(LOST_ID_DOCUMENT_TYPES)
+        except UploadRejected as e:
+            return upload_rejected_response(e)
         print("Processing lost ID form data:", list(data.keys()) if data else "No data")
         
-        # Validate required fields
-        required_fields = ['existing_id_number', 'ob_number', 'full_names']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            print("Missing required fields:", missing_fields)
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        # Validate required fields and the constituency
+        error = submission_error(data, LOST_ID_REQUIRED_FIELDS)
+        if error:
+            print("Rejected lost ID submission:", error)
+            return jsonify({'error': error}), 400
         
         # Get officer ID from JWT token if provided; otherwise leave as NULL
         officer_id = None
@@ -933,71 +1869,56 @@ def submit_lost_id_application():
             except Exception as e:
                 print('JWT decode failed in lost-id:', e)
         
-        # Open DB connection
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Validate officer_id (must exist and be approved) or set to NULL
         if officer_id:
-            cursor.execute("SELECT id FROM officers WHERE id = %s AND status = 'approved'", (officer_id,))
+            conn = get_db_connection()
+            cursor = conn.cursor(prepared=True)
+            cursor.execute(APPROVED_OFFICER_QUERY, (officer_id,))
             if cursor.fetchone() is None:
                 officer_id = None
+            cursor.close()
+            conn.close()
         
-        # Get current count for application number
-        cursor.execute("SELECT COUNT(*) FROM applications WHERE application_type = 'renewal'")
-        count = cursor.fetchone()[0]
-        application_number = f"REP{datetime.now().year}{count + 1:06d}"
+        # Id and application number from the global directory
+        try:
+            application_id, application_number, shard = shard_router.register(
+                'renewal', 'REP', data.get('constituency'))
+        except ShardMoving:
+            return shard_moving_response()
         
         print(f"Generated application number: {application_number}")
         
-        # Insert lost ID application
-        cursor.execute("""
-            INSERT INTO applications (
-                application_number, officer_id, application_type,
-                full_names, date_of_birth, father_name, mother_name, home_district,
-                existing_id_number, renewal_reason, ob_number, constituency,
-                status, created_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-        """, (
-            application_number, officer_id, 'renewal',
-            data['full_names'], data.get('date_of_birth'), 
-            data.get('father_name'), data.get('mother_name'), data.get('home_district'),
-            data['existing_id_number'], 'lost', data['ob_number'], data.get('constituency'),
-            'submitted', datetime.now()
-        ))
-        
-        application_id = cursor.lastrowid
-        
-        # Handle file uploads
-        upload_dir = 'uploads'
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Define expected files for lost ID applications
-        file_mappings = {
-            'ob_photo': 'ob_photo',
-            'passport_photo': 'passport_photo', 
-            'birth_certificate': 'birth_certificate'
-        }
-        
-        for file_key, doc_type in file_mappings.items():
-            if file_key in files and files[file_key].filename:
-                file = files[file_key]
-                # Create safe filename
-                filename = f"{application_number}_{file_key}_{file.filename}"
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
+        conn = get_shard_connection(shard)
+        cursor = conn.cursor(prepared=True)
+        try:
+            # Insert lost ID application
+            cursor.execute(LOST_ID_INSERT, lost_id_params(data, application_id, application_number, officer_id))
+            
+            # Move the validated uploads (already on disk) into place
+            for upload in uploads:
+                file_path = document_path(application_number, upload)
+                upload.save(file_path)
+                
+                doc_type = LOST_ID_DOCUMENT_TYPES[upload.field]
+                phash = safe_dhash(file_path) if doc_type == 'passport_photo' else None
                 
                 # Insert document record
-                cursor.execute("""
-                    INSERT INTO documents (application_id, document_type, file_path)
-                    VALUES (%s, %s, %s)
-                """, (application_id, doc_type, file_path))
+                cursor.execute(DOCUMENT_INSERT, (application_id, doc_type, file_path, phash))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            shard_router.unregister(application_id)
+            for upload in uploads:
+                upload.discard()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Link the request to the ID it replaces
+        update_lineage(record_request, data['existing_id_number'], application_id, application_number,
+                       data['full_names'])
         
         return jsonify({
             'message': 'Lost ID application submitted successfully',
@@ -1020,19 +1941,47 @@ def submit_payment():
         if missing_fields:
             return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
         
-        conn = get_db_connection()
+        # Retries carrying the same Idempotency-Key return the original payment
+        idempotency_key = request.headers.get('Idempotency-Key')
+        
+        conn, error = application_connection(data['application_id'], for_write=True)
+        if error:
+            return error
         cursor = conn.cursor()
         
         # Insert payment record
-        cursor.execute("""
-            INSERT INTO payments (application_id, amount, payment_method, status, created_at)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (
-            data['application_id'], data['amount'], data['payment_method'], 
-            data.get('status', 'pending'), datetime.now()
-        ))
+        try:
+            cursor.execute("""
+                INSERT INTO payments (application_id, amount, payment_method, status, idempotency_key, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (
+                data['application_id'], data['amount'], data['payment_method'], 
+                data.get('status', 'pending'), idempotency_key, datetime.now()
+            ))
+        except mysql.connector.Error as e:
+            if e.errno == errorcode.ER_DUP_ENTRY and idempotency_key:
+                # The payment bumped the application's version; hand the current one back for If-Match
+                cursor.execute("""
+                    SELECT p.id, a.version FROM payments p JOIN applications a ON a.id = p.application_id
+                    WHERE p.idempotency_key = %s
+                """, (idempotency_key,))
+                payment_id, application_version = cursor.fetchone()
+                cursor.close()
+                conn.close()
+                return jsonify({
+                    'message': 'Payment already submitted',
+                    'paymentId': payment_id,
+                    'applicationVersion': application_version
+                }), 200
+            if e.errno in REJECTED_WRITE_ERRORS:
+                cursor.close()
+                conn.close()
+                return jsonify({'error': f'Invalid payment: {e.msg}'}), 400
+            raise
         
         payment_id = cursor.lastrowid
+        cursor.execute("SELECT version FROM applications WHERE id = %s", (data['application_id'],))
+        row = cursor.fetchone()
         
         conn.commit()
         cursor.close()
@@ -1040,35 +1989,74 @@ def submit_payment():
         
         return jsonify({
             'message': 'Payment submitted successfully',
-            'paymentId': payment_id
+            'paymentId': payment_id,
+            'applicationVersion': row[0] if row else None
         }), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def callback_shard(callback):
+    """Shard whose inbox takes a gateway callback; unknown payments go to the default shard."""
+    if callback['payment_id']:
+        shard = shard_router.find_row('payments', callback['payment_id'])
+    else:
+        shard = next(iter(shard_router.locate_number(callback['application_number'])), None)
+    return shard or DEFAULT_SHARD
+
+@app.route('/api/payments/callback', methods=['POST'])
+def payment_callback():
+    try:
+        callback, error = parse_callback(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Only the inbox insert happens here, on the shard holding the payment;
+        # that shard's callback worker applies it
+        conn = get_shard_connection(callback_shard(callback))
+        cursor = conn.cursor()
+        created = record_callback(cursor, callback)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({
+            'message': 'Callback received' if created else 'Duplicate callback ignored',
+            'ResultCode': 0
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/applications/<int:application_id>/submit-for-approval', methods=['PUT'])
 def submit_for_approval(application_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
+        
+        conn, error = application_connection(application_id, for_write=True)
+        if error:
+            return error
+        cursor = conn.cursor(prepared=True)
         
         # Update application status to indicate it's submitted for approval
         cursor.execute("""
             UPDATE applications 
             SET status = 'submitted', updated_at = %s
-            WHERE id = %s
-        """, (datetime.now(), application_id))
+            WHERE id = %s AND (%s IS NULL OR version = %s)
+        """, (datetime.now(), application_id, expected_version, expected_version))
         
         if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Application not found'}), 404
+            return version_conflict(conn, cursor, 'applications', application_id, expected_version,
+                                    'Application not found')
         
         conn.commit()
+        record_change(None, {'status': 'submitted'})
         cursor.close()
         conn.close()
         
-        return jsonify({'message': 'Application submitted for approval'}), 200
+        return versioned_response({'message': 'Application submitted for approval'}, expected_version)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1076,46 +2064,129 @@ def submit_for_approval(application_id):
 @app.route('/api/admin/officers/<int:officer_id>/suspend', methods=['PUT'])
 def suspend_officer(officer_id):
     try:
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE officers SET status = 'suspended' WHERE id = %s", (officer_id,))
+        cursor = conn.cursor(prepared=True)
+        cursor.execute("""
+            UPDATE officers SET status = 'suspended'
+            WHERE id = %s AND status = 'approved' AND (%s IS NULL OR version = %s)
+        """, (officer_id, expected_version, expected_version))
+        if cursor.rowcount == 0:
+            return version_conflict(conn, cursor, 'officers', officer_id, expected_version,
+                                    'Officer not found or not approved')
         conn.commit()
+        record_change({'status': 'approved'}, {'status': 'suspended'})
         cursor.close()
         conn.close()
-        return jsonify({'message': 'Officer suspended successfully'}), 200
+        return versioned_response({'message': 'Officer suspended successfully'}, expected_version)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/officers/<int:officer_id>/unsuspend', methods=['PUT'])
 def unsuspend_officer(officer_id):
     try:
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE officers SET status = 'approved' WHERE id = %s", (officer_id,))
+        cursor = conn.cursor(prepared=True)
+        cursor.execute("""
+            UPDATE officers SET status = 'approved'
+            WHERE id = %s AND status = 'suspended' AND (%s IS NULL OR version = %s)
+        """, (officer_id, expected_version, expected_version))
+        if cursor.rowcount == 0:
+            return version_conflict(conn, cursor, 'officers', officer_id, expected_version,
+                                    'Officer not found or not suspended')
         conn.commit()
+        record_change({'status': 'suspended'}, {'status': 'approved'})
         cursor.close()
         conn.close()
-        return jsonify({'message': 'Officer unsuspended successfully'}), 200
+        return versioned_response({'message': 'Officer unsuspended successfully'}, expected_version)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/officers/<int:officer_id>', methods=['DELETE'])
 def delete_officer(officer_id):
     try:
+        expected_version, error = get_if_match_version()
+        if error:
+            return error
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM officers WHERE id = %s", (officer_id,))
+        # Plain read, no lock: the DELETE is pinned to the version read, so the
+        # audit entry names exactly the row removed
+        cursor.execute("SELECT id_number, email, full_name, status, version FROM officers WHERE id = %s",
+                      (officer_id,))
+        row = cursor.fetchone()
+        if row is None or (expected_version is not None and row[4] != expected_version):
+            return version_conflict(conn, cursor, 'officers', officer_id, expected_version, 'Officer not found')
+        before = dict(zip(('id_number', 'email', 'full_name', 'status'), row[:4]))
+        cursor.execute("DELETE FROM officers WHERE id = %s AND version = %s", (officer_id, row[4]))
         if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Officer not found'}), 404
+            return version_conflict(conn, cursor, 'officers', officer_id, expected_version, 'Officer not found')
         conn.commit()
+        record_change(before, dict.fromkeys(before, None))
         cursor.close()
         conn.close()
         return jsonify({'message': 'Officer deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/analytics', methods=['GET'])
+def get_stage_analytics():
+    """Stage durations with percentiles, answered from the hourly/daily rollups."""
+    try:
+        period = request.args.get('period', 'day')
+        group_by = request.args.get('groupBy')
+        if period not in ('hour', 'day'):
+            return jsonify({'error': 'period must be hour or day'}), 400
+        if group_by not in (None, 'constituency', 'officer'):
+            return jsonify({'error': 'groupBy must be constituency or officer'}), 400
+        
+        try:
+            end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+            start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                     else end - timedelta(days=30))
+        except ValueError:
+            return jsonify({'error': 'from and to must be ISO dates'}), 400
+        
+        # Each shard rolls up its own history; bucket counts merge exactly
+        def histograms(shard, conn):
+            cursor = conn.cursor()
+            groups = stage_histograms(cursor, period, start, end, group_by, request_stage)
+            cursor.close()
+            return groups
+        
+        request_stage = request.args.get('stage')
+        stages = summarize(merge_histograms(shard_router.scatter(histograms).values()), group_by)
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        if group_by == 'officer':
+            officer_ids = sorted({row['officerId'] for row in stages if row['officerId']})
+            names = {}
+            if officer_ids:
+                placeholders = ', '.join(['%s'] * len(officer_ids))
+                cursor.execute(f"SELECT id, full_name FROM officers WHERE id IN ({placeholders})", officer_ids)
+                names = dict(cursor.fetchall())
+            for row in stages:
+                row['officerName'] = names.get(row['officerId'])
+        
+        cursor.close()
+        conn.close()
+        
+        return jsonify({
+            'period': period,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'stages': stages
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # File serving route
 @app.route('/uploads/<filename>')
 def serve_uploaded_file(filename):
@@ -1124,5 +2195,16 @@ def serve_uploaded_file(filename):
     except Exception as e:
         return jsonify({'error': 'File not found'}), 404
 
+def start_background_jobs():
+    """Archiver, callback worker and stage rollups, one of each per shard, the maintenance scheduler and the audit flusher."""
+    for shard in SHARDS:
+        connect = lambda shard=shard: get_shard_connection(shard)
+        start_archiver(connect, ARCHIVE_CONFIG)
+        start_callback_worker(connect, excluded=lambda shard=shard: shard_router.elsewhere(shard))
+        start_rollup_worker(connect, id_limit=id_range(SHARDS, shard)[1])
+    maintenance.start()
+    audit_log.start()
+
 if __name__ == '__main__':
+    start_background_jobs()
     app.run(debug=True, host='localhost', port=5000)
@@ -0,0 +1,41 @@
+"""
+Per-worker cache of composed application details
+Entries are tagged with applications.version, which database triggers bump
+on every visible change to the application, its documents or payments, so a
+cached entry is served only while its version still matches. Claim, manifest
+and print-batch bookkeeping does not bump it; callers read those fresh.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ApplicationCache:
+    """Small LRU of {application_id: (version, application)}."""
+
+    def __init__(self, max_entries=2000):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def __contains__(self, application_id):
+        return application_id in self.entries
+
+    def get(self, application_id, version):
+        with self.lock:
+            entry = self.entries.get(application_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(application_id)
+            return entry[1]
+
+    def put(self, application_id, version, application):
+        with self.lock:
+            self.entries[application_id] = (version, application)
+            self.entries.move_to_end(application_id)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, application_id):
+        with self.lock:
+            self.entries.pop(application_id, None)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Archival of closed applications for the Digital ID system
+Moves collected/rejected applications (with their documents, payments and
+status history) out of the hot tables once they are older than a set age.
+Run this script from terminal, or let app.py run it in the background.
+"""
+
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+CLOSED_STATUSES = ('collected', 'rejected')
+
+# Child tables are copied before, and deleted before, their parent row
+CHILD_TABLES = ('documents', 'payments', 'status_history')
+
+
+def archive_batch(conn, older_than_days, batch_size):
+    """Move one batch of closed applications into the archive tables.
+
+    Returns the number of applications archived.
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT id FROM applications
+            WHERE status IN (%s, %s) AND updated_at < %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE
+        """, (*CLOSED_STATUSES, cutoff, batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+
+        if not ids:
+            conn.rollback()
+            return 0
+
+        placeholders = ', '.join(['%s'] * len(ids))
+
+        cursor.execute(f"""
+            INSERT IGNORE INTO applications_archive
+            SELECT a.*, %s FROM applications a WHERE a.id IN ({placeholders})
+        """, (datetime.now(), *ids))
+
+        for table in CHILD_TABLES:
+            cursor.execute(f"""
+                INSERT IGNORE INTO {table}_archive
+                SELECT * FROM {table} WHERE application_id IN ({placeholders})
+            """, ids)
+
+        for table in CHILD_TABLES:
+            cursor.execute(f"DELETE FROM {table} WHERE application_id IN ({placeholders})", ids)
+
+        cursor.execute(f"DELETE FROM applications WHERE id IN ({placeholders})", ids)
+
+        conn.commit()
+        return len(ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def archive_closed_applications(get_connection, older_than_days, batch_size, pause_seconds=0):
+    """Archive batches until no eligible applications remain.
+
+    Each batch runs in its own transaction so row locks stay short.
+    """
+    total = 0
+    while True:
+        conn = get_connection()
+        try:
+            moved = archive_batch(conn, older_than_days, batch_size)
+        finally:
+            conn.close()
+
+        total += moved
+        if moved < batch_size:
+            return total
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+
+def start_archiver(get_connection, config):
+    """Run archive_closed_applications periodically on a daemon thread."""
+    def run():
+        while True:
+            try:
+                moved = archive_closed_applications(
+                    get_connection,
+                    config['older_than_days'],
+                    config['batch_size'],
+                    config['pause_seconds']
+                )
+                if moved:
+                    print(f"[archiver] Archived {moved} applications")
+            except Exception as e:
+                print(f"[archiver] Error: {e}")
+            time.sleep(config['interval_seconds'])
+
+    thread = threading.Thread(target=run, name='archiver', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from config import SHARDS, ARCHIVE_CONFIG, connect
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_CONFIG['older_than_days']
+    for shard in SHARDS:
+        moved = archive_closed_applications(
+            lambda: connect(shard), days, ARCHIVE_CONFIG['batch_size'], ARCHIVE_CONFIG['pause_seconds']
+        )
+        print(f"✅ {shard}: archived {moved} applications closed more than {days} days ago")
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the Digital ID API
+The routes that spend their time waiting on clients and MySQL (tracking, ID
+search, application uploads and uploaded files) run natively async on Quart,
+with an aiomysql connection pool per shard, so one process can hold thousands
+of them open at once. Uploads are validated while they stream in (uploads.py),
+with the parsing and disk writes on worker threads. Every other route is the
+WSGI app from app.py on a thread pool, so the API (routes, payloads, rate
+limits, audit log) is the same whichever way it is served.
+
+Usage: hypercorn asgi:application --bind localhost:5000
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, g, jsonify, request, send_from_directory
+from quart_cors import cors
+from werkzeug.exceptions import HTTPException
+
+import app as wsgi
+from audit import MUTATING_METHODS
+from json_provider import OrjsonProvider, orjson
+from lineage import ORIGINAL_APPLICATION_QUERY, normalize, record_request
+from photo_hash import safe_dhash
+from rate_limit import EXEMPT_ENDPOINTS, classify, retry_after_header
+from sharding import ShardMoving
+from uploads import UploadRejected, open_parser
+
+ASYNC_DB_POOL = {
+    'minsize': 5,
+    'maxsize': 50,
+    'pool_recycle': 3600
+}
+
+# Request bodies for routes handed to the WSGI app are buffered up to this size
+WSGI_MAX_BODY_BYTES = 64 * 1024 * 1024
+
+async_app = cors(Quart(__name__))
+async_app.config['MAX_CONTENT_LENGTH'] = wsgi.UPLOAD_CONFIG['max_total_bytes']
+if orjson is not None:
+    async_app.json = OrjsonProvider(async_app)
+
+
+@async_app.before_serving
+async def open_pools():
+    # autocommit: a pooled connection must not carry a stale REPEATABLE READ snapshot
+    # into the next request; writes open their own transaction with begin()
+    async_app.pools = {}
+    for shard in wsgi.SHARDS:
+        config = wsgi.shard_config(shard)
+        async_app.pools[shard] = await aiomysql.create_pool(
+            host=config['host'], port=config.get('port', 3306), user=config['user'],
+            password=config['password'], db=config['database'],
+            autocommit=True, **ASYNC_DB_POOL)
+
+    # The same background jobs `python app.py` starts
+    wsgi.start_background_jobs()
+
+
+@async_app.after_serving
+async def close_pools():
+    for pool in async_app.pools.values():
+        pool.close()
+        await pool.wait_closed()
+
+
+@asynccontextmanager
+async def db_connection(shard=wsgi.DEFAULT_SHARD):
+    started = time.perf_counter()
+    async with async_app.pools[shard].acquire() as conn:
+        # Waiting for a pooled connection is this side's DB-pressure signal
+        wsgi.admission.record_connect(time.perf_counter() - started)
+        yield conn
+
+
+@async_app.before_request
+async def admit_request():
+    g.token_payload = wsgi.decode_bearer(request.headers.get('Authorization', ''))
+    if request.method == 'OPTIONS' or request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+
+    priority, key = classify(g.token_payload, request.remote_addr)
+    rejection = wsgi.admission.check(priority, key, request.method, request.endpoint)
+    if rejection:
+        status, message, retry_after = rejection
+        return jsonify({'error': message}), status, {'Retry-After': retry_after_header(retry_after)}
+    g.admitted = True
+    return None
+
+
+@async_app.after_request
+async def audit_request(response):
+    if request.method in MUTATING_METHODS and request.endpoint and response.status_code < 400:
+        if request.is_json:
+            body = await request.get_json(silent=True)
+        elif 'upload_form' in g:
+            body = g.upload_form
+        else:
+            body = (await request.form).to_dict()
+        wsgi.audit_log.record_request(g.token_payload, request.remote_addr, request.endpoint,
+                                      request.view_args, body, response.status_code)
+    return response
+
+
+@async_app.teardown_request
+async def release_request(exc=None):
+    if g.pop('admitted', False):
+        wsgi.admission.release()
+    for upload in g.pop('uploads', []):
+        if not upload.saved:
+            upload.discard()
+
+
+async def receive_uploads(fields):
+    """Stream the body through the upload parser as it arrives. Raises UploadRejected."""
+    parser = open_parser(request.content_type, request.content_length, wsgi.UPLOAD_CONFIG,
+                         wsgi.UPLOAD_DIR, fields, wsgi.upload_scanner)
+    try:
+        async for chunk in request.body:
+            await asyncio.to_thread(parser.feed, chunk)
+        form, uploads = await asyncio.to_thread(parser.finish)
+    except Exception:
+        parser.discard()
+        raise
+    g.upload_form = form
+    g.uploads = uploads
+    return form, uploads
+
+
+def upload_rejected_response(error):
+    return jsonify({'error': error.message}), error.status, {'Connection': 'close'}
+
+
+async def save_documents(cursor, application_id, application_number, uploads, document_types):
+    """Move validated uploads into place, hash passport photos off the event loop, then record them."""
+    for upload in uploads:
+        doc_type = document_types[upload.field]
+        file_path = wsgi.document_path(application_number, upload)
+        await asyncio.to_thread(upload.save, file_path)
+
+        phash = await asyncio.to_thread(safe_dhash, file_path) if doc_type == 'passport_photo' else None
+        await cursor.execute(wsgi.DOCUMENT_INSERT, (application_id, doc_type, file_path, phash))
+
+
+@async_app.route('/api/applications', methods=['POST'])
+async def submit_application():
+    try:
+        if request.content_type and 'application/json' in request.content_type:
+            data = await request.get_json()
+            uploads = []
+        else:
+            try:
+                data, uploads = await receive_uploads(wsgi.APPLICATION_DOCUMENT_TYPES)
+            except UploadRejected as e:
+                return upload_rejected_response(e)
+
+        # The constituency registry may reload from MySQL (blocking), so keep it off the event loop
+        error = await asyncio.to_thread(wsgi.submission_error, data, wsgi.APPLICATION_REQUIRED_FIELDS)
+        if error:
+            return jsonify({'error': error}), 400
+
+        officer_id = (g.token_payload or {}).get('officer_id') or data.get('officerId')
+        if not officer_id:
+            return jsonify({'error': 'Officer ID missing'}), 400
+
+        async with db_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(wsgi.APPROVED_OFFICER_QUERY, (officer_id,))
+                if not await cursor.fetchone():
+                    return jsonify({'error': 'Invalid or unapproved officer'}), 400
+
+        try:
+            application_id, application_number, shard = await asyncio.to_thread(
+                wsgi.shard_router.register, 'application', 'APP', data['constituency'])
+        except ShardMoving:
+            return wsgi.shard_moving_response()
+
+        try:
+            async with db_connection(shard) as conn:
+                async with conn.cursor() as cursor:
+                    await conn.begin()
+                    try:
+                        await cursor.execute(wsgi.APPLICATION_INSERT, wsgi.application_params(
+                            data, application_id, application_number, officer_id))
+
+                        await save_documents(cursor, application_id, application_number, uploads,
+                                             wsgi.APPLICATION_DOCUMENT_TYPES)
+                        await conn.commit()
+                    except Exception:
+                        await conn.rollback()
+                        raise
+        except Exception:
+            await asyncio.to_thread(wsgi.shard_router.unregister, application_id)
+            for upload in uploads:
+                await asyncio.to_thread(upload.discard)
+            raise
+
+        return jsonify({
+            'message': 'Application submitted successfully',
+            'applicationNumber': application_number
+        }), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@async_app.route('/api/applications/lost-id', methods=['POST'])
+async def submit_lost_id_application():
+    try:
+        try:
+            data, uploads = await receive_uploads(wsgi.LOST_ID_DOCUMENT_TYPES)
+        except UploadRejected as e:
+            return upload_rejected_response(e)
+
+        error = await asyncio.to_thread(wsgi.submission_error, data, wsgi.LOST_ID_REQUIRED_FIELDS)
+        if error:
+            return jsonify({'error': error}), 400
+
+        officer_id = (g.token_payload or {}).get('officer_id')
+
+        # Unknown or unapproved officers are recorded as NULL
+        if officer_id:
+            async with db_connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(wsgi.APPROVED_OFFICER_QUERY, (officer_id,))
+                    if await cursor.fetchone() is None:
+                        officer_id = None
+
+        try:
+            application_id, application_number, shard = await asyncio.to_thread(
+                wsgi.shard_router.register, 'renewal', 'REP', data.get('constituency'))
+        except ShardMoving:
+            return wsgi.shard_moving_response()
+
+        try:
+            async with db_connection(shard) as conn:
+                async with conn.cursor() as cursor:
+                    await conn.begin()
+                    try:
+                        await cursor.execute(wsgi.LOST_ID_INSERT, wsgi.lost_id_params(
+                            data, application_id, application_number, officer_id))
+
+                        await save_documents(cursor, application_id, application_number, uploads,
+                                             wsgi.LOST_ID_DOCUMENT_TYPES)
+                        await conn.commit()
+                    except Exception:
+                        await conn.rollback()
+                        raise
+        except Exception:
+            await asyncio.to_thread(wsgi.shard_router.unregister, application_id)
+            for upload in uploads:
+                await asyncio.to_thread(upload.discard)
+            raise
+
+        # Link the request to the ID it replaces (id_lineage on the main database)
+        await asyncio.to_thread(wsgi.update_lineage, record_request, data['existing_id_number'],
+                                application_id, application_number, data['full_names'])
+
+        return jsonify({
+            'message': 'Lost ID application submitted successfully',
+            'applicationNumber': application_number,
+            'applicationId': application_id
+        }), 201
+
+    except Exception as e:
+        print(f"Error in lost ID application: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@async_app.route('/api/applications/track/<application_number>', methods=['GET'])
+async def track_application(application_number):
+    try:
+        # The directory names the shard; unknown numbers never reach the shards
+        shards = await asyncio.to_thread(wsgi.shard_router.locate_number, application_number)
+
+        application = None
+        for shard in shards:
+            async with db_connection(shard) as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    # Falls back to archived (closed) applications
+                    for query in wsgi.TRACK_QUERIES:
+                        await cursor.execute(query, (application_number,))
+                        application = await cursor.fetchone()
+                        if application:
+                            break
+            if application:
+                break
+
+        if not application:
+            return jsonify({'error': 'Application not found'}), 404
+
+        return jsonify({'application': application}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@async_app.route('/api/applications/search-by-id/<id_number>', methods=['GET'])
+async def search_application_by_id(id_number):
+    try:
+        # The lineage names the application that issued the ID, and so its shard;
+        # IDs issued before the lineage was kept are looked for on every shard at once
+        async with db_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(ORIGINAL_APPLICATION_QUERY, (normalize(id_number),))
+                original = await cursor.fetchone()
+        original_shard = await asyncio.to_thread(wsgi.shard_router.locate, original[0]) if original else None
+
+        async def find(shard):
+            async with db_connection(shard) as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    # Falls back to archived (collected) applications
+                    for query in wsgi.ID_SEARCH_QUERIES:
+                        await cursor.execute(query, (id_number,))
+                        application = await cursor.fetchone()
+                        if application:
+                            break
+            return application
+
+        shards = [original_shard] if original_shard else wsgi.SHARDS
+        found = await asyncio.gather(*(find(shard) for shard in shards))
+        application = next((application for application in found if application), None)
+
+        if not application:
+            return jsonify({'error': 'ID not found or not issued yet'}), 404
+
+        return jsonify({'application': application}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@async_app.route('/uploads/<filename>')
+async def serve_uploaded_file(filename):
+    try:
+        return await send_from_directory('uploads', filename)
+    except Exception as e:
+        return jsonify({'error': 'File not found'}), 404
+
+
+wsgi_application = AsyncioWSGIMiddleware(wsgi.app, max_body_size=WSGI_MAX_BODY_BYTES)
+async_routes = async_app.url_map.bind('localhost')
+
+
+async def application(scope, receive, send):
+    """Serve a request from the async app if it has the route, otherwise from the WSGI app."""
+    if scope['type'] == 'http':
+        try:
+            async_routes.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return await wsgi_application(scope, receive, send)
+    return await async_app(scope, receive, send)
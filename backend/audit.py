@@ -0,0 +1,162 @@
+"""
+Write-behind audit log for the Digital ID API
+Every successful mutating request is recorded (actor, action, target and the
+fields it changed) into an in-memory bounded buffer. A background thread
+flushes the buffer to the append-only audit_log table in multi-row batches,
+so a request pays for a queue put rather than a database round trip.
+"""
+
+import atexit
+import json
+import queue
+import threading
+from datetime import datetime
+
+from flask import g, request
+
+MUTATING_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+REDACTED_FIELDS = ('password',)
+
+# Not worth an audit row: high-volume machine traffic with its own inbox table
+SKIPPED_ENDPOINTS = {'payment_callback'}
+
+
+def record_change(before, after, **details):
+    """Note what the current request changed on its target for its audit entry.
+
+    Routes that write call this with the values they set and whatever they
+    already knew of the old ones (from their WHERE clause or a row they had
+    read anyway; None if neither), so auditing costs no extra read. The entry
+    records {column: [old, new]} for each column that changed, plus any
+    details (e.g. how many rows moved). An old application status left
+    unknown here is in status_history, which its trigger writes.
+    """
+    before = before or {}
+    g.audit_changes = {
+        **{column: [before.get(column), value] for column, value in after.items() if before.get(column) != value},
+        **details
+    }
+
+
+def _redact(data):
+    return {
+        key: '***' if any(field in key.lower() for field in REDACTED_FIELDS) else value
+        for key, value in data.items()
+    }
+
+
+class AuditLog:
+    def __init__(self, get_connection, max_buffer=10000, batch_size=500, flush_interval_seconds=1):
+        self.get_connection = get_connection
+        self.buffer = queue.Queue(maxsize=max_buffer)
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.dropped = 0
+        self.flush_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def record(self, actor_type, actor_id, actor_ip, action, target_type, target_id, changes, status_code):
+        entry = (actor_type, actor_id, actor_ip, action, target_type, target_id,
+                 json.dumps(changes, default=str) if changes else None, status_code, datetime.now())
+        try:
+            self.buffer.put(entry, timeout=0.01)
+        except queue.Full:
+            self.dropped += 1
+            print(f"[audit] Buffer full, dropped entry for {action} ({self.dropped} dropped so far)")
+
+    def record_request(self, payload, remote_addr, endpoint, view_args, body, status_code, changes=None):
+        """Record a successful mutating request from its decoded token, route and body.
+
+        changes is what the route noted with record_change(); requests that
+        noted nothing (creates, form submissions) record their body instead.
+        """
+        payload = payload or {}
+        if payload.get('admin_id'):
+            actor_type, actor_id = 'admin', payload['admin_id']
+        elif payload.get('officer_id'):
+            actor_type, actor_id = 'officer', payload['officer_id']
+        else:
+            actor_type, actor_id = 'anonymous', None
+
+        target_type, target_id = None, None
+        for key, value in (view_args or {}).items():
+            if key.endswith('_id'):
+                target_type, target_id = key[:-3], value
+                break
+
+        if changes is None:
+            changes = _redact(body) if isinstance(body, dict) else None
+        self.record(actor_type, actor_id, remote_addr, endpoint, target_type, target_id, changes, status_code)
+
+    def flush(self):
+        """Write everything currently buffered. Returns the number of entries written."""
+        written = 0
+        with self.flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.buffer.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return written
+
+                conn = None
+                try:
+                    conn = self.get_connection()
+                    cursor = conn.cursor()
+                    # mysql-connector rewrites this into one multi-row INSERT
+                    cursor.executemany("""
+                        INSERT INTO audit_log (actor_type, actor_id, actor_ip, action, target_type,
+                                               target_id, changes, status_code, created_at)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, batch)
+                    conn.commit()
+                    cursor.close()
+                    written += len(batch)
+                except Exception as e:
+                    # Put the batch back for the next flush rather than losing it
+                    print(f"[audit] Flush failed, retrying later: {e}")
+                    for entry in batch:
+                        try:
+                            self.buffer.put_nowait(entry)
+                        except queue.Full:
+                            self.dropped += 1
+                    return written
+                finally:
+                    if conn is not None:
+                        conn.close()
+
+    def run(self):
+        while not self.stopping.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='audit-flusher', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopping.set()
+        self.flush()
+
+
+def init_audit(app, audit_log, token_payload):
+    def audit_request(response):
+        if (request.method not in MUTATING_METHODS or request.endpoint in SKIPPED_ENDPOINTS
+                or request.endpoint is None or response.status_code >= 400):
+            return response
+
+        if request.is_json:
+            body = request.get_json(silent=True)
+        elif 'upload_form' in g:
+            body = g.upload_form  # Streamed uploads (uploads.py) leave request.form empty
+        else:
+            body = request.form.to_dict()
+        audit_log.record_request(token_payload(), request.remote_addr, request.endpoint,
+                                 request.view_args, body, response.status_code, g.get('audit_changes'))
+        return response
+
+    app.after_request(audit_request)
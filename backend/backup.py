@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Incremental backup and restore of the Digital ID databases and uploads
+Each run writes a manifest (backups/manifests/NNNNNN.json) holding:
+  - a consistent mysqldump of every shard (--single-transaction), gzipped,
+    with the binlog position it was taken at
+  - the uploads added since the previous manifest, found through the
+    documents.uploaded_at watermark, stored once each by content hash in
+    backups/objects and compressed across a process pool
+Restoring a manifest loads its dumps (shards in parallel), optionally
+replays each shard's binlog from the recorded position up to a given time,
+and unpacks every upload named by that manifest and the ones before it,
+checking each file against its hash.
+
+Usage:
+    python backup.py run                          Take a backup
+    python backup.py list                         List manifests
+    python backup.py verify [MANIFEST]            Check dumps and uploads of a manifest (default: latest)
+    python backup.py restore MANIFEST [--until "YYYY-MM-DD HH:MM:SS"] [--uploads DIR] --force
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+LOCK_NAME = 'dig_id_backup'
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Written by mysqldump --source-data=2 (or --master-data=2 before MySQL 8.0.26)
+BINLOG_POSITION = re.compile(
+    rb"(?:SOURCE|MASTER)_LOG_FILE='([^']+)',\s*(?:SOURCE|MASTER)_LOG_POS=(\d+)")
+
+
+class BackupError(Exception):
+    pass
+
+
+def _client_args(config):
+    """Connection flags for the mysql command-line tools; the password goes in MYSQL_PWD."""
+    args = [f"--host={config.get('host', 'localhost')}", f"--port={config.get('port', 3306)}",
+            f"--user={config['user']}"]
+    env = {**os.environ, 'MYSQL_PWD': config.get('password', '')}
+    return args, env
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BackupStore:
+    """Layout of the backup directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.manifests = os.path.join(root, 'manifests')
+        self.dumps = os.path.join(root, 'dumps')
+        self.objects = os.path.join(root, 'objects')
+
+    def manifest_ids(self):
+        if not os.path.isdir(self.manifests):
+            return []
+        return sorted(int(name[:-5]) for name in os.listdir(self.manifests) if name.endswith('.json'))
+
+    def load(self, manifest_id):
+        path = os.path.join(self.manifests, f"{manifest_id:06d}.json")
+        if not os.path.exists(path):
+            raise BackupError(f"No manifest {manifest_id}")
+        with open(path) as source:
+            return json.load(source)
+
+    def save(self, manifest):
+        os.makedirs(self.manifests, exist_ok=True)
+        path = os.path.join(self.manifests, f"{manifest['id']:06d}.json")
+        with open(f"{path}.part", 'w') as target:
+            json.dump(manifest, target, indent=2, default=str)
+        os.replace(f"{path}.part", path)  # A manifest exists only once everything it names is written
+
+    def uploads_until(self, manifest_id, until=None):
+        """file path -> content hash as of a manifest: its uploads over those of the manifests before it.
+
+        With `until` (a binlog roll-forward), later manifests are taken in up to
+        the first one started after it, so uploads the replayed rows refer to
+        are included.
+        """
+        uploads = {}
+        for other in self.manifest_ids():
+            if other > manifest_id and until is None:
+                break
+            manifest = self.load(other)
+            uploads.update(manifest['uploads'])
+            if other > manifest_id and datetime.fromisoformat(manifest['started_at']) > until:
+                break
+        return uploads
+
+
+def _store_upload(args):
+    """Hash one upload and, if its content is new, gzip it into the object store. Runs in a worker process."""
+    file_path, objects_root, level = args
+    try:
+        digest = _sha256_file(file_path)
+    except FileNotFoundError:
+        return file_path, None, 0, False
+
+    target = os.path.join(objects_root, digest[:2], f"{digest}.gz")
+    if os.path.exists(target):
+        return file_path, digest, 0, False
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    part = f"{target}.{os.getpid()}.part"
+    with open(file_path, 'rb') as source, gzip.open(part, 'wb', compresslevel=level) as packed:
+        shutil.copyfileobj(source, packed, COPY_CHUNK_BYTES)
+    os.replace(part, target)
+    return file_path, digest, os.path.getsize(target), True
+
+
+def _unpack_upload(args):
+    """Restore one upload from the object store, checking it against its hash. Runs in a worker process."""
+    file_path, digest, objects_root, target_dir = args
+    source_path = os.path.join(objects_root, digest[:2], f"{digest}.gz")
+    if not os.path.exists(source_path):
+        return file_path, 'missing'
+
+    target = os.path.join(target_dir, os.path.basename(file_path)) if target_dir else None
+    check = hashlib.sha256()
+    try:
+        with gzip.open(source_path, 'rb') as packed:
+            out = open(f"{target}.part", 'wb') if target else None
+            try:
+                for chunk in iter(lambda: packed.read(COPY_CHUNK_BYTES), b''):
+                    check.update(chunk)
+                    if out:
+                        out.write(chunk)
+            finally:
+                if out:
+                    out.close()
+    except (OSError, EOFError):
+        return file_path, 'corrupt'
+
+    if check.hexdigest() != digest:
+        if target:
+            os.remove(f"{target}.part")
+        return file_path, 'hash mismatch'
+    if target:
+        os.replace(f"{target}.part", target)
+    return file_path, 'ok'
+
+
+def _drain(stream):
+    """Read a child's stderr on a thread, so a chatty process never stalls on a full pipe.
+
+    Returns a function that waits for the end of the stream and gives its bytes.
+    """
+    output = []
+    thread = threading.Thread(target=lambda: output.append(stream.read()), daemon=True)
+    thread.start()
+
+    def collect():
+        thread.join()
+        return output[0] if output else b''
+    return collect
+
+
+def _dump_shard(store, manifest_id, shard, config, backup_config):
+    """mysqldump one shard into a gzip file, noting the binlog position from the dump header."""
+    os.makedirs(store.dumps, exist_ok=True)
+    relative = os.path.join('dumps', f"{manifest_id:06d}-{shard}.sql.gz")
+    path = os.path.join(store.root, relative)
+    args, env = _client_args(config)
+    command = [backup_config['mysqldump'], *args, *backup_config['dump_args'], '--databases', config['database']]
+
+    position = None
+    header = b''
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    errors = _drain(process.stderr)
+    with open(f"{path}.part", 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=backup_config['compress_level']) as packed:
+            for chunk in iter(lambda: process.stdout.read(COPY_CHUNK_BYTES), b''):
+                if position is None and len(header) < 64 * 1024:
+                    header += chunk[:64 * 1024]
+                    match = BINLOG_POSITION.search(header)
+                    if match:
+                        position = {'file': match.group(1).decode(), 'position': int(match.group(2))}
+                packed.write(chunk)
+    process.wait()
+    if process.returncode != 0:
+        os.remove(f"{path}.part")
+        raise BackupError(f"mysqldump of {shard} failed: {errors().decode(errors='replace').strip()}")
+
+    os.replace(f"{path}.part", path)
+    return {
+        'dump': relative,
+        'sha256': _sha256_file(path),
+        'bytes': os.path.getsize(path),
+        'database': config['database'],
+        'binlog': position
+    }
+
+
+def _new_uploads(router, watermarks, overlap_seconds):
+    """Uploads recorded since each shard's watermark: ({file_path}, {shard: new watermark})."""
+    def recent(shard, conn):
+        since = watermarks.get(shard)
+        cursor = conn.cursor()
+        # Files removed by document retention (purged_at) are gone for good
+        where, params = "WHERE purged_at IS NULL", ()
+        if since:
+            # Look back a little: an upload's row can commit after a later one's
+            since = datetime.fromisoformat(since) - timedelta(seconds=overlap_seconds)
+            where, params = f"{where} AND uploaded_at >= %s", (since,)
+        cursor.execute(f"""
+            SELECT file_path, uploaded_at FROM documents {where}
+            UNION ALL
+            SELECT file_path, uploaded_at FROM documents_archive {where}
+        """, params * 2)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    paths, new_watermarks = set(), {}
+    for shard, rows in router.scatter(recent).items():
+        paths.update(file_path for file_path, _ in rows)
+        latest = max((uploaded_at for _, uploaded_at in rows if uploaded_at), default=None)
+        new_watermarks[shard] = latest.isoformat() if latest else watermarks.get(shard)
+    return paths, new_watermarks
+
+
+def run_backup(store, shards, shard_config, router, get_lock_connection, backup_config, log=print):
+    """Take one backup. Returns the manifest."""
+    lock_conn = get_lock_connection()
+    cursor = lock_conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+    if cursor.fetchone()[0] != 1:
+        lock_conn.close()
+        raise BackupError("Another backup is running")
+
+    try:
+        ids = store.manifest_ids()
+        previous = store.load(ids[-1]) if ids else None
+        manifest_id = (ids[-1] + 1) if ids else 1
+        started_at = datetime.now()
+
+        # Dumps first: every upload a dump refers to then exists by the time uploads are listed
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            futures = {shard: pool.submit(_dump_shard, store, manifest_id, shard, shard_config(shard), backup_config)
+                       for shard in shards}
+            dumps = {shard: future.result() for shard, future in futures.items()}
+        for shard, dump in dumps.items():
+            position = dump['binlog']
+            log(f"  {shard}: dump {dump['bytes'] / 1024 / 1024:.1f} MB at "
+                f"{position['file'] + ':' + str(position['position']) if position else 'no binlog position'}")
+
+        watermarks = {shard: (previous or {}).get('shards', {}).get(shard, {}).get('uploads_watermark')
+                      for shard in shards}
+        paths, new_watermarks = _new_uploads(router, watermarks, backup_config['watermark_overlap_seconds'])
+        known = store.uploads_until(ids[-1]) if ids else {}
+
+        uploads, stored, stored_bytes, missing = {}, 0, 0, []
+        jobs = [(path, store.objects, backup_config['compress_level']) for path in sorted(paths)]
+        with ProcessPoolExecutor(max_workers=backup_config['workers'] or os.cpu_count()) as pool:
+            for file_path, digest, size, new_object in pool.map(_store_upload, jobs, chunksize=16):
+                if digest is None:
+                    missing.append(file_path)
+                    continue
+                if known.get(file_path) != digest:
+                    uploads[file_path] = digest
+                stored += new_object
+                stored_bytes += size
+
+        manifest = {
+            'id': manifest_id,
+            'previous': previous['id'] if previous else None,
+            'started_at': started_at.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'shards': {shard: {**dumps[shard], 'uploads_watermark': new_watermarks.get(shard)} for shard in shards},
+            'uploads': uploads,
+            'stats': {'uploads_checked': len(paths), 'uploads_new': len(uploads), 'objects_written': stored,
+                      'object_bytes_written': stored_bytes, 'uploads_missing': len(missing)}
+        }
+        store.save(manifest)
+        if missing:
+            log(f"  {len(missing)} documents point at files that are not on disk, e.g. {missing[0]}")
+        return manifest
+    finally:
+        cursor.close()
+        lock_conn.close()
+
+
+def verify(store, manifest_id, workers=None, target_dir=None, until=None):
+    """Check (or, with target_dir, restore) a manifest's dumps and uploads.
+
+    Returns (problems, number of uploads).
+    """
+    manifest = store.load(manifest_id)
+    problems = []
+    for shard, dump in manifest['shards'].items():
+        path = os.path.join(store.root, dump['dump'])
+        if not os.path.exists(path):
+            problems.append(f"{shard}: dump {dump['dump']} is missing")
+        elif _sha256_file(path) != dump['sha256']:
+            problems.append(f"{shard}: dump {dump['dump']} does not match its checksum")
+
+    if target_dir:
+        os.makedirs(target_dir, exist_ok=True)
+    uploads = store.uploads_until(manifest_id, until)
+    jobs = [(path, digest, store.objects, target_dir) for path, digest in uploads.items()]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for file_path, status in pool.map(_unpack_upload, jobs, chunksize=16):
+            if status != 'ok':
+                problems.append(f"{file_path}: {status}")
+    return problems, len(uploads)
+
+
+def _load_dump(store, dump, config, backup_config, until):
+    """Load one shard's dump, then replay its binlog up to `until` if given."""
+    args, env = _client_args(config)
+    with gzip.open(os.path.join(store.root, dump['dump']), 'rb') as packed:
+        process = subprocess.Popen([backup_config['mysql'], *args], stdin=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env)
+        errors = _drain(process.stderr)
+        try:
+            shutil.copyfileobj(packed, process.stdin, COPY_CHUNK_BYTES)
+        finally:
+            process.stdin.close()
+        if process.wait() != 0:
+            raise BackupError(f"Loading {dump['dump']} failed: {errors().decode(errors='replace').strip()}")
+
+    if until is None:
+        return None
+    if not dump['binlog']:
+        raise BackupError(f"{dump['dump']} has no binlog position to replay from")
+
+    # Binlogs are read from the server the dump came from, only for this database
+    replay = subprocess.Popen([
+        backup_config['mysqlbinlog'], '--read-from-remote-server', *args, '--to-last-log',
+        f"--database={dump['database']}", f"--start-position={dump['binlog']['position']}",
+        f"--stop-datetime={until:%Y-%m-%d %H:%M:%S}", dump['binlog']['file']
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    replay_errors = _drain(replay.stderr)
+    apply = subprocess.Popen([backup_config['mysql'], *args], stdin=replay.stdout,
+                             stderr=subprocess.PIPE, env=env)
+    apply_errors = _drain(apply.stderr)
+    replay.stdout.close()
+    if replay.wait() != 0 or apply.wait() != 0:
+        raise BackupError(f"Binlog replay for {dump['database']} failed: "
+                          f"{(replay_errors() or apply_errors()).decode(errors='replace').strip()}")
+    return until
+
+
+def restore(store, manifest_id, shard_config, backup_config, upload_dir, until=None, log=print):
+    """Rebuild every shard's database and the uploads as of a manifest (plus binlog up to `until`)."""
+    manifest = store.load(manifest_id)
+    problems = []
+    for shard, dump in manifest['shards'].items():
+        path = os.path.join(store.root, dump['dump'])
+        if not os.path.exists(path) or _sha256_file(path) != dump['sha256']:
+            problems.append(f"{shard}: dump {dump['dump']} is missing or does not match its checksum")
+    if problems:
+        raise BackupError(f"Manifest {manifest_id} cannot be restored: {'; '.join(problems)}")
+
+    shards = manifest['shards']
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = {shard: pool.submit(_load_dump, store, dump, shard_config(shard), backup_config, until)
+                   for shard, dump in shards.items()}
+        for shard, future in futures.items():
+            future.result()
+            log(f"  {shard}: database restored" + (f" and rolled forward to {until}" if until else ''))
+
+    problems, count = verify(store, manifest_id, backup_config['workers'], target_dir=upload_dir, until=until)
+    log(f"  uploads: {count - len(problems)} of {count} restored to {upload_dir}")
+    return problems
+
+
+if __name__ == "__main__":
+    from config import BACKUP_CONFIG, SHARDS, UPLOAD_DIR, connect, shard_config
+    from sharding import standalone_router
+
+    store = BackupStore(BACKUP_CONFIG['dir'])
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "run":
+        print(f"Backing up {len(SHARDS)} shard(s) to {store.root}...")
+        manifest = run_backup(store, list(SHARDS), shard_config, standalone_router(),
+                              connect, BACKUP_CONFIG)
+        print(f"✅ Manifest {manifest['id']}: {manifest['stats']}")
+    elif command == "list":
+        for manifest_id in store.manifest_ids():
+            manifest = store.load(manifest_id)
+            print(f"  {manifest_id:6d}  {manifest['started_at']}  {manifest['stats']['uploads_new']} new uploads")
+    elif command == "verify":
+        ids = store.manifest_ids()
+        manifest_id = int(sys.argv[2]) if len(sys.argv) > 2 else (ids[-1] if ids else None)
+        if manifest_id is None:
+            print("No backups yet.")
+            sys.exit(1)
+        problems, count = verify(store, manifest_id, BACKUP_CONFIG['workers'])
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        print(f"{'✅' if not problems else '❌'} Manifest {manifest_id}: {count} uploads checked, "
+              f"{len(problems)} problem(s)")
+        sys.exit(1 if problems else 0)
+    elif command == "restore" and len(sys.argv) > 2:
+        options = sys.argv[3:]
+        until = (datetime.fromisoformat(options[options.index('--until') + 1])
+                 if '--until' in options else None)
+        upload_dir = options[options.index('--uploads') + 1] if '--uploads' in options else UPLOAD_DIR
+        if '--force' not in options:
+            print(f"This overwrites the databases of {', '.join(SHARDS)} and files in {upload_dir}. "
+                  f"Add --force to go ahead.")
+            sys.exit(1)
+        problems = restore(store, int(sys.argv[2]), shard_config, BACKUP_CONFIG, upload_dir, until)
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        print(f"{'✅' if not problems else '❌'} Restored manifest {sys.argv[2]}"
+              + (f" rolled forward to {until}" if until else ''))
+    else:
+        print(__doc__)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Side-by-side benchmark of the WSGI and ASGI serving paths
+Starts app.py on a fixed-size thread pool (like one gthread worker) and
+asgi.py on hypercorn, one process each, then drives both with the same
+number of concurrent clients and reports throughput and latency.
+
+Tracking lookups run by default. Pass --uploads to also submit applications
+with a passport photo; they are written to the configured database, so point
+DB_CONFIG at a scratch copy first. Rate limits and load shedding are lifted
+in the servers.
+
+Usage: python bench_asgi.py APPLICATION_NUMBER [--concurrency 1000] [--requests 20000]
+                            [--threads 32] [--uploads 500 --officer-id 1]
+"""
+
+import argparse
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+WSGI_PORT = 5101
+ASGI_PORT = 5102
+
+LIFTED_RATE = (100000, 100000)
+
+
+def lift_limits(api):
+    for limit in ('public_rate', 'anonymous_write_rate', 'token_rate'):
+        api.ADMISSION_CONFIG[limit] = LIFTED_RATE
+    api.ADMISSION_CONFIG['shed_connect_ms'] = {}
+
+
+def serve_wsgi(port, threads):
+    from werkzeug.serving import BaseWSGIServer
+
+    import app as api
+    lift_limits(api)
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """werkzeug server handling connections on a fixed thread pool."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer('localhost', port, api.app)
+    server.request_queue_size = 1024
+    server.serve_forever()
+
+
+def serve_asgi(port):
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    import app as api
+    lift_limits(api)
+    import asgi
+
+    config = Config()
+    config.bind = [f'localhost:{port}']
+    config.backlog = 1024
+    config.accesslog = None
+    asyncio.run(serve(asgi.application, config))
+
+
+def sample_photo():
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + bytes(20000)  # JPEG magic plus padding
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 500), (120, 140, 160)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+UPLOAD_FIELDS = {
+    'fullNames': 'Bench Applicant', 'dateOfBirth': '1990-01-01', 'gender': 'male',
+    'fatherName': 'Bench Father', 'motherName': 'Bench Mother', 'districtOfBirth': 'Nairobi',
+    'tribe': 'Bench', 'homeDistrict': 'Nairobi', 'division': 'Central', 'location': 'Central',
+    'subLocation': 'Central', 'villageEstate': 'Bench Estate', 'occupation': 'Tester'
+}
+
+
+async def drive(base_url, total, concurrency, make_request):
+    """Run total requests with at most concurrency in flight. Returns (seconds, latencies, statuses)."""
+    latencies, statuses = [], {}
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    status = (await make_request(client)).status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, statuses
+
+
+def report(label, elapsed, latencies, statuses):
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+
+    print(f"{label:<22} {len(latencies) / elapsed:9.0f} req/s   p50 {pct(50):8.1f} ms   "
+          f"p99 {pct(99):8.1f} ms   {statuses}")
+
+
+async def wait_for(url, seconds=30):
+    deadline = time.monotonic() + seconds
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def main(args):
+    photo = sample_photo()
+
+    async def track(client):
+        return await client.get(f'/api/applications/track/{args.application_number}')
+
+    async def upload(client):
+        return await client.post('/api/applications',
+                                 data={**UPLOAD_FIELDS, 'constituency': args.constituency,
+                                       'officerId': str(args.officer_id)},
+                                 files={'passportPhoto': ('photo.jpg', photo, 'image/jpeg')})
+
+    for label, port in (('WSGI', WSGI_PORT), ('ASGI', ASGI_PORT)):
+        base_url = f'http://localhost:{port}'
+        await wait_for(f'{base_url}/api/constituencies')
+        report(f'{label} track', *await drive(base_url, args.requests, args.concurrency, track))
+        if args.uploads:
+            report(f'{label} upload', *await drive(base_url, args.uploads, args.concurrency, upload))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the WSGI and ASGI serving paths')
+    parser.add_argument('application_number', help='An existing application number to track')
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=32, help='WSGI worker threads')
+    parser.add_argument('--uploads', type=int, default=0)
+    parser.add_argument('--officer-id', type=int, default=1)
+    parser.add_argument('--constituency', default='Westlands')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    servers = [context.Process(target=serve_wsgi, args=(WSGI_PORT, args.threads), daemon=True),
+               context.Process(target=serve_asgi, args=(ASGI_PORT,), daemon=True)]
+    for server in servers:
+        server.start()
+    try:
+        asyncio.run(main(args))
+    finally:
+        for server in servers:
+            server.terminate()
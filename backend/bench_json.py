@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for API response serialization
+Compares Flask's default JSON provider with the orjson provider on a listing
+the size of a busy admin dashboard, plus the cost of building row dicts from
+tuple rows and of compressing the result. Needs no database.
+
+Usage: python bench_json.py [rows]
+"""
+
+import gzip
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import OrjsonProvider, GZIP_LEVEL, fetch_rows, orjson
+
+COLUMNS = ('id', 'application_number', 'full_names', 'status', 'application_type',
+           'created_at', 'updated_at', 'generated_id_number', 'officer_name', 'amount')
+
+
+class FakeCursor:
+    column_names = COLUMNS
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+def make_rows(count):
+    now = datetime.now()
+    return [
+        (i, f"APP2025{i:06d}", f"Applicant Number {i}", 'submitted', 'new',
+         now - timedelta(minutes=i), now, f"ID2025{i:08d}", 'Officer Name', Decimal('1000.00'))
+        for i in range(count)
+    ]
+
+
+def timed(label, fn, repeat=20):
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+    print(f"{label:<45} {elapsed:8.2f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = make_rows(count)
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+
+    print(f"=== Serializing {count} rows ===")
+    per_row = timed("dict per row, keys looked up per row",
+                    lambda: [{COLUMNS[i]: value for i, value in enumerate(row)} for row in rows])
+    timed("fetch_rows (keys computed once)", lambda: fetch_rows(FakeCursor(rows)))
+
+    payload = {'applications': per_row}
+    body = timed("Flask DefaultJSONProvider.dumps", lambda: default_provider.dumps(payload))
+    if orjson is not None:
+        orjson_provider = OrjsonProvider(app)
+        body = timed("OrjsonProvider.dumps", lambda: orjson_provider.dumps(payload))
+    else:
+        print("orjson not installed; skipping OrjsonProvider")
+
+    data = body.encode('utf-8')
+    compressed = timed(f"gzip level {GZIP_LEVEL}", lambda: gzip.compress(data, compresslevel=GZIP_LEVEL), repeat=5)
+    print(f"\nResponse size: {len(data) / 1024:.0f} KiB raw, {len(compressed) / 1024:.0f} KiB gzip")
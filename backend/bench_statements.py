@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the statement paths behind submit and track
+Runs the queries of one application submission (approved-officer check,
+application insert, two document inserts) and of one tracking lookup
+(the status, then the version through SQL built per request, as routes that
+pick their table at run time do), three ways:
+  connect      a new connection per request, text protocol (the old path)
+  pooled       a pooled connection, text protocol
+  prepared     a pooled connection through its prepared-statement cache
+and reports the time per request plus the server's statement counters
+(global status, so run it against an otherwise idle server).
+
+Submissions are rolled back, never committed, but still point DB_CONFIG at
+a scratch copy.
+
+Usage: python bench_statements.py APPLICATION_NUMBER OFFICER_ID [requests]
+"""
+
+import sys
+import time
+from datetime import datetime
+
+import mysql.connector
+
+from app import APPLICATION_INSERT, DB_CONFIG, DB_POOL_CONFIG, application_params
+from db_pool import ConnectionPool
+
+TRACK_QUERY = """
+    SELECT application_number, full_names, status, created_at, updated_at
+    FROM applications WHERE application_number = %s
+"""
+OFFICER_QUERY = "SELECT id FROM officers WHERE id = %s AND status = 'approved'"
+DOCUMENT_INSERT = """
+    INSERT INTO documents (application_id, document_type, file_path, phash)
+    VALUES (%s, %s, %s, %s)
+"""
+COUNTERS = ('Com_stmt_prepare', 'Com_stmt_execute', 'Com_stmt_close', 'Com_select', 'Com_insert',
+            'Bytes_received', 'Bytes_sent')
+
+# Never committed; a high id keeps clear of real rows while the transaction is open
+SCRATCH_ID = 2 ** 31 - 1000
+
+FORM = {
+    'fullNames': 'Benchmark Applicant', 'dateOfBirth': '1990-01-01', 'gender': 'female',
+    'fatherName': 'Father', 'motherName': 'Mother', 'districtOfBirth': 'Nairobi', 'tribe': 'Tribe',
+    'homeDistrict': 'Nairobi', 'division': 'Division', 'constituency': 'Westlands',
+    'location': 'Location', 'subLocation': 'Sub-location', 'villageEstate': 'Estate',
+    'occupation': 'Clerk'
+}
+
+
+def server_counters():
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(f"SHOW GLOBAL STATUS WHERE Variable_name IN ({', '.join(['%s'] * len(COUNTERS))})", COUNTERS)
+    counters = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+    return counters
+
+
+def submit(conn, prepared, officer_id, i):
+    cursor = conn.cursor(prepared=True) if prepared else conn.cursor()
+    cursor.execute(OFFICER_QUERY, (officer_id,))
+    cursor.fetchone()
+    number = f"BENCH{i:09d}"
+    cursor.execute(APPLICATION_INSERT, application_params(FORM, SCRATCH_ID, number, officer_id))
+    for field, doc_type in (('passportPhoto', 'passport_photo'), ('birthCertificate', 'birth_certificate')):
+        cursor.execute(DOCUMENT_INSERT, (SCRATCH_ID, doc_type, f"uploads/{number}_{field}_scan.jpg", None))
+    cursor.close()
+    conn.rollback()
+
+
+def track(conn, prepared, application_number, i):
+    cursor = conn.cursor(prepared=True, dictionary=True) if prepared else conn.cursor(dictionary=True)
+    cursor.execute(TRACK_QUERY, (application_number,))
+    cursor.fetchone()
+    # An f-string is a new string object every request; the statement cache must still reuse its prepare
+    table = 'applications'
+    cursor.execute(f"SELECT version FROM {table} WHERE application_number = %s", (application_number,))
+    cursor.fetchone()
+    cursor.close()
+    conn.rollback()  # As the pool does on release: no read view carried over
+
+
+def run(label, get_connection, prepared, fn, arg, requests):
+    before = server_counters()
+    started = time.perf_counter()
+    for i in range(requests):
+        conn = get_connection()
+        fn(conn, prepared, arg, i)
+        conn.close()
+    elapsed = time.perf_counter() - started
+    after = server_counters()
+
+    delta = {name: after.get(name, 0) - before.get(name, 0) for name in COUNTERS}
+    print(f"{label:<22} {elapsed / requests * 1000:8.3f} ms/request   "
+          f"prepares {delta['Com_stmt_prepare']:>6}  executes {delta['Com_stmt_execute']:>6}  "
+          f"selects {delta['Com_select']:>6}  inserts {delta['Com_insert']:>6}  "
+          f"bytes in {delta['Bytes_received'] / requests:7.0f}/req")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    application_number, officer_id = sys.argv[1], int(sys.argv[2])
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+    connect = lambda: mysql.connector.connect(**DB_CONFIG)
+
+    for path, fn, arg in (('submit', submit, officer_id), ('track', track, application_number)):
+        print(f"=== {path}: {requests} requests, one client ({datetime.now():%H:%M:%S}) ===")
+        pool.get().close()  # Warm up: open the pooled connection
+        run('connect + text', connect, False, fn, arg, requests)
+        run('pooled + text', pool.get, False, fn, arg, requests)
+        run('pooled + prepared', pool.get, True, fn, arg, requests)
+        print()
+
+    print(f"Pool: {pool.snapshot()}")
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression check for the Digital ID system
+Builds a scratch database with migrate.py (so its indexes and triggers match
+production), seeds it with a representative dataset, drives every API route
+while recording the SQL they execute, and runs EXPLAIN FORMAT=JSON on each
+statement.
+
+Exits non-zero when a statement full-scans a large table, filesorts too many
+rows, or (on a hot path) reads a table without an index.
+
+Usage: python check_query_plans.py [applications_to_seed]
+"""
+
+import json
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+
+import jwt
+import mysql.connector
+
+import analytics
+import app as api
+import archive
+import migrate
+from db_pool import ConnectionPool
+
+SCRATCH_DATABASE = 'dig_id_plan_check'
+
+# Plan limits
+FULL_SCAN_ROW_LIMIT = 1000   # Full scans of smaller tables (admins, constituencies) are fine
+FILESORT_ROW_LIMIT = 1000
+
+# Routes that run on every page load or submission; each table they read must use an index
+HOT_ROUTES = {
+    'officer_login', 'admin_login', 'submit_application', 'track_application',
+    'get_all_applications', 'get_officer_applications', 'search_application_by_id',
+    'claim_applications', 'approve_application'
+}
+
+# Known offenders, keyed by a fragment of the statement. Remove an entry once
+# the query is fixed so the check guards it from then on.
+KNOWN_ISSUES = {
+    'a.generated_id_number, a.officer_id FROM applications a ORDER BY a.created_at DESC': 'Full history listing is unpaginated',
+}
+
+
+class RecordingCursor:
+    def __init__(self, cursor, statements, route):
+        self._cursor = cursor
+        self._statements = statements
+        self._route = route
+
+    def execute(self, operation, params=None):
+        self._statements.append((self._route[0], operation, params))
+        return self._cursor.execute(operation, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RecordingConnection:
+    def __init__(self, conn, statements, route):
+        self._conn = conn
+        self._statements = statements
+        self._route = route
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self._conn.cursor(*args, **kwargs), self._statements, self._route)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class RecordingPool:
+    """A pool on the scratch database whose connections record their statements."""
+
+    def __init__(self, config, statements, route):
+        self._pool = ConnectionPool(config, **api.DB_POOL_CONFIG)
+        self._statements = statements
+        self._route = route
+
+    def get(self):
+        return RecordingConnection(self._pool.get(), self._statements, self._route)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def build_schema(config):
+    """Recreate the scratch database and apply every migration to it.
+
+    CREATE TABLE ... LIKE would copy the columns and indexes but not the
+    triggers or the rows migrations seed, so routes would run (and plan)
+    differently from production.
+    """
+    conn = mysql.connector.connect(**{k: v for k, v in config.items() if k != 'database'})
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {config['database']}")
+    cursor.close()
+    conn.close()
+    migrate.migrate(config)
+
+
+def seed(config, application_count):
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+    rnd = random.Random(42)
+    now = datetime.now()
+
+    constituencies = [f"Constituency {i:03d}" for i in range(60)]
+    cursor.executemany("INSERT INTO constituencies (name) VALUES (%s)", [(c,) for c in constituencies])
+
+    cursor.execute("""
+        INSERT INTO admins (username, full_name, password_hash)
+        VALUES ('plan_admin', 'Plan Check Admin', 'x')
+    """)
+
+    officers = []
+    for i in range(300):
+        status = rnd.choice(['approved'] * 8 + ['pending', 'suspended'])
+        officers.append((f"OFF{i:06d}", f"officer{i}@example.com", '0700000000', f"Officer {i}",
+                         'Station', rnd.choice(constituencies), 'x', status))
+    cursor.executemany("""
+        INSERT INTO officers (id_number, email, phone_number, full_name, station, constituency, password_hash, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, officers)
+
+    statuses = (['submitted'] * 5 + ['approved'] * 2 + ['rejected', 'ready_for_dispatch', 'dispatched',
+                'ready_for_collection'] + ['collected'] * 10)
+    rows = []
+    for i in range(application_count):
+        status = rnd.choice(statuses)
+        created = now - timedelta(days=rnd.randint(0, 720))
+        generated = f"ID{created.year}{i + 1:08d}" if status not in ('submitted', 'rejected') else None
+        app_type = 'renewal' if rnd.random() < 0.1 else 'new'
+        rows.append((f"APP{created.year}{i + 1:06d}", rnd.randint(1, len(officers)), app_type,
+                     f"Person {i}", '1990-01-01', 'male', 'Father', 'Mother', 'District', 'Tribe',
+                     'Home', 'Division', rnd.choice(constituencies), 'Location', 'Sub', 'Village',
+                     'Farmer', status, generated, created, created))
+    cursor.executemany("""
+        INSERT INTO applications (
+            application_number, officer_id, application_type, full_names, date_of_birth, gender,
+            father_name, mother_name, district_of_birth, tribe, home_district, division,
+            constituency, location, sub_location, village_estate, occupation, status,
+            generated_id_number, created_at, updated_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+
+    documents = []
+    payments = []
+    for application_id, row in enumerate(rows, start=1):
+        for doc_type in ('passport_photo', 'birth_certificate'):
+            phash = rnd.getrandbits(64) if doc_type == 'passport_photo' else None
+            documents.append((application_id, doc_type, f"uploads/{application_id}_{doc_type}.jpg", phash))
+        if row[17] != 'submitted':
+            method = rnd.choice(['cash', 'mpesa'])
+            payments.append((application_id, 100, method, f"MP{application_id:010d}" if method == 'mpesa' else None,
+                             'completed', row[19]))
+    cursor.executemany("""
+        INSERT INTO documents (application_id, document_type, file_path, phash) VALUES (%s, %s, %s, %s)
+    """, documents)
+    cursor.executemany("""
+        INSERT INTO payments (application_id, amount, payment_method, mpesa_transaction_id, status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, payments)
+
+    # Routes find applications through the directory, and number them from the sequences
+    cursor.execute("""
+        INSERT INTO application_directory (id, application_number, constituency, shard, created_at)
+        SELECT id, application_number, constituency, 'main', created_at FROM applications
+    """)
+    # Migration 0014 already created the sequences, at zero
+    cursor.execute("""
+        INSERT INTO number_sequences (name, last_value)
+        VALUES ('application', %s), ('renewal', 0), (CONCAT('id_number:', YEAR(NOW())), %s)
+        ON DUPLICATE KEY UPDATE last_value = VALUES(last_value)
+    """, (application_count, application_count))
+
+    conn.commit()
+    cursor.execute("SHOW TABLES")
+    for (table,) in cursor.fetchall():
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+
+def drive_routes(config, statements):
+    route = ['']
+    # Routes reach every database through db_pools (and shard_config, for
+    # unpooled session connections): point them all at the scratch copy
+    api.DB_CONFIG = config
+    api.shard_config = lambda shard: config
+    api.db_pools = {shard: RecordingPool(config, statements, route) for shard in api.SHARDS}
+
+    # Anything that still connects elsewhere would run against real data, unrecorded
+    connect = mysql.connector.connect
+    def scratch_only(*args, **kwargs):
+        if kwargs.get('database') != config['database']:
+            raise RuntimeError(f"Plan check connected to {kwargs.get('database')!r}, not {config['database']!r}")
+        return connect(*args, **kwargs)
+    mysql.connector.connect = scratch_only
+    try:
+        _call_routes(route)
+    finally:
+        mysql.connector.connect = connect
+
+
+def _call_routes(route):
+    # Every call comes from one client; keep the rate limiter out of the way
+    for limit in ('public_rate', 'anonymous_write_rate', 'token_rate'):
+        api.ADMISSION_CONFIG[limit] = (1000, 1000)
+    # Seeded versions drift as routes run; the version predicate plans the same either way
+    api.IF_MATCH_REQUIRED = False
+    client = api.app.test_client()
+
+    secret = api.app.config['SECRET_KEY']
+    exp = datetime.utcnow() + timedelta(hours=1)
+    admin = {'Authorization': 'Bearer ' + jwt.encode({'admin_id': 1, 'role': 'admin', 'exp': exp}, secret, algorithm='HS256')}
+    officer = {'Authorization': 'Bearer ' + jwt.encode({'officer_id': 1, 'role': 'officer', 'exp': exp}, secret, algorithm='HS256')}
+
+    application = {
+        'fullNames': 'Plan Check', 'dateOfBirth': '1990-01-01', 'gender': 'female',
+        'fatherName': 'F', 'motherName': 'M', 'districtOfBirth': 'D', 'tribe': 'T',
+        'homeDistrict': 'H', 'division': 'Dv', 'constituency': 'Constituency 001',
+        'location': 'L', 'subLocation': 'S', 'villageEstate': 'V', 'occupation': 'O'
+    }
+
+    calls = [
+        ('officer_login', 'post', '/api/officer/login', {'json': {'email': 'officer1@example.com', 'password': 'x'}}),
+        ('admin_login', 'post', '/api/admin/login', {'json': {'username': 'plan_admin', 'password': 'x'}}),
+        ('get_constituencies', 'get', '/api/constituencies', {}),
+        ('get_pending_officers', 'get', '/api/admin/officers/pending', {}),
+        ('get_approved_officers', 'get', '/api/admin/officers/approved', {}),
+        ('submit_application', 'post', '/api/applications', {'json': application, 'headers': officer}),
+        ('track_application', 'get', '/api/applications/track/APP2025000010', {}),
+        ('track_application', 'get', '/api/applications/track/MISSING', {}),
+        ('get_all_applications', 'get', '/api/admin/applications', {}),
+        ('get_application_history', 'get', '/api/admin/applications/history', {}),
+        ('get_application_details', 'get', '/api/admin/applications/10', {}),
+        ('claim_applications', 'post', '/api/admin/applications/claim', {'json': {'count': 10}, 'headers': admin}),
+        ('release_application_claim', 'delete', '/api/admin/applications/10/claim', {'headers': admin}),
+        ('approve_application', 'put', '/api/admin/applications/11/approve', {}),
+        ('reject_application', 'put', '/api/admin/applications/12/reject', {}),
+        ('get_dispatch_applications', 'get', '/api/admin/applications/dispatch', {}),
+        ('get_preview_applications', 'get', '/api/admin/applications/preview', {}),
+        ('print_application', 'put', '/api/admin/applications/13/print', {}),
+        ('dispatch_application', 'put', '/api/admin/applications/14/dispatch', {}),
+        ('create_manifests', 'post', '/api/admin/manifests', {'json': {}, 'headers': admin}),
+        ('get_manifests', 'get', '/api/manifests?status=open', {}),
+        ('get_manifest', 'get', '/api/manifests/1', {}),
+        ('dispatch_manifest', 'put', '/api/admin/manifests/1/dispatch', {}),
+        ('mark_manifest_arrived', 'put', '/api/officer/manifests/1/arrived', {'json': {}}),
+        ('mark_manifest_collected', 'put', '/api/officer/manifests/1/collected',
+         {'json': {'applicationNumbers': ['APP2025000001']}}),
+        ('get_officer_applications', 'get', '/api/officer/applications?officer_id=1', {}),
+        ('mark_card_arrived', 'put', '/api/officer/applications/15/card-arrived', {}),
+        ('mark_card_collected', 'put', '/api/officer/applications/16/card-collected', {}),
+        ('search_application_by_id', 'get', '/api/applications/search-by-id/ID202500000020', {}),
+        ('search_application_by_id', 'get', '/api/applications/search-by-id/MISSING', {}),
+        ('submit_lost_id_application', 'post', '/api/applications/lost-id',
+         {'data': {'existing_id_number': 'ID202500000020', 'ob_number': 'OB1', 'full_names': 'Plan Check'}, 'headers': officer}),
+        ('submit_payment', 'post', '/api/payments', {'json': {'application_id': 17, 'amount': 100, 'payment_method': 'cash'}}),
+        ('submit_for_approval', 'put', '/api/applications/18/submit-for-approval', {}),
+        ('approve_officer', 'put', '/api/admin/officers/2/approve', {}),
+        ('reject_officer', 'put', '/api/admin/officers/3/reject', {}),
+        ('suspend_officer', 'put', '/api/admin/officers/4/suspend', {}),
+        ('unsuspend_officer', 'put', '/api/admin/officers/4/unsuspend', {}),
+        ('add_constituency', 'post', '/api/admin/constituencies', {'json': {'name': 'Plan Check'}}),
+        ('delete_constituency', 'delete', '/api/admin/constituencies/60', {}),
+        ('get_stage_analytics', 'get', '/api/admin/analytics?groupBy=officer', {}),
+    ]
+
+    for name, method, url, kwargs in calls:
+        route[0] = name
+        response = getattr(client, method)(url, **kwargs)
+        if response.status_code >= 500:
+            print(f"⚠️  {name} {url} returned {response.status_code}: {response.get_data(as_text=True)}")
+
+    route[0] = 'rollup_batch'
+    analytics.rollup_batch(api.get_db_connection())
+
+    route[0] = 'archive_batch'
+    archive.archive_batch(api.get_db_connection(), 30, 100)
+
+
+def normalize(sql):
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    return re.sub(r'IN \((%s, )*%s\)', 'IN (...)', sql)
+
+
+def walk(node, tables, filesorts):
+    if isinstance(node, dict):
+        if 'table_name' in node and 'access_type' in node:
+            tables.append(node)
+        if node.get('using_filesort'):
+            nested = []
+            walk({k: v for k, v in node.items() if k != 'using_filesort'}, nested, [])
+            filesorts.append(sum(t.get('rows_examined_per_scan', 0) for t in nested))
+        for value in node.values():
+            walk(value, tables, filesorts)
+    elif isinstance(node, list):
+        for value in node:
+            walk(value, tables, filesorts)
+
+
+def check_plans(config, statements):
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+
+    seen = {}
+    for route, sql, params in statements:
+        verb = sql.lstrip().split(None, 1)[0].upper()
+        if verb not in ('SELECT', 'UPDATE', 'DELETE'):
+            continue
+        seen.setdefault(normalize(sql), (route, sql, params))
+
+    failures = []
+    for key, (route, sql, params) in seen.items():
+        known = next((reason for fragment, reason in KNOWN_ISSUES.items() if fragment in key), None)
+
+        cursor.execute("EXPLAIN FORMAT=JSON " + sql, params)
+        plan = json.loads(cursor.fetchone()[0])
+        tables, filesorts = [], []
+        walk(plan, tables, filesorts)
+
+        problems = []
+        for table in tables:
+            rows = table.get('rows_examined_per_scan', 0)
+            if table['access_type'] == 'ALL' and rows >= FULL_SCAN_ROW_LIMIT:
+                problems.append(f"full scan of {table['table_name']} ({rows} rows)")
+            elif route in HOT_ROUTES and not table.get('key') and rows >= FULL_SCAN_ROW_LIMIT:
+                problems.append(f"no index on {table['table_name']} in hot path")
+        for rows in filesorts:
+            if rows > FILESORT_ROW_LIMIT:
+                problems.append(f"filesort over {rows} rows")
+
+        if not problems:
+            print(f"✅ {route}: {key[:90]}")
+        elif known:
+            print(f"⚠️  {route}: {key[:90]}\n    known issue: {known} ({'; '.join(problems)})")
+        else:
+            print(f"❌ {route}: {key[:90]}\n    {'; '.join(problems)}")
+            failures.append(route)
+
+    cursor.close()
+    conn.close()
+    return failures
+
+
+if __name__ == "__main__":
+    application_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    scratch_config = {**api.DB_CONFIG, 'database': SCRATCH_DATABASE}
+
+    build_schema(scratch_config)
+    seed(scratch_config, application_count)
+
+    statements = []
+    drive_routes(scratch_config, statements)
+    failures = check_plans(scratch_config, statements)
+
+    if failures:
+        print(f"\n{len(failures)} statement(s) regressed")
+        sys.exit(1)
+    print("\nAll query plans within limits")
@@ -0,0 +1,135 @@
+"""
+Settings for the Digital ID API and its command-line tools
+Kept apart from app.py so scripts can read them (and connect) without
+building the Flask app, its connection pools and background jobs.
+"""
+
+import os
+
+import mysql.connector
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',  # Your MySQL username
+    'password': '',  # Your MySQL password
+    'database': 'dig_id'
+}
+
+# Shards holding applications with their documents, payments, status history and
+# manifests, routed by constituency (constituencies.shard). 'main' is DB_CONFIG,
+# which also keeps officers, admins, constituencies and the application directory.
+# Each shard's own row ids start at id_base so they never collide; bring a new
+# shard up with `python sharding.py init-shard NAME`.
+SHARDS = {
+    'main': {'config': None, 'id_base': 0},
+    # 'coast': {'config': {**DB_CONFIG, 'port': 3307}, 'id_base': 100000000},
+}
+DEFAULT_SHARD = 'main'  # For applications without a known constituency
+
+# Closed applications older than this are moved to the *_archive tables
+ARCHIVE_CONFIG = {
+    'older_than_days': 180,
+    'batch_size': 500,
+    'pause_seconds': 1,  # Pause between batches to leave room for live traffic
+    'interval_seconds': 3600
+}
+
+# Multipart uploads are validated while they stream in (see uploads.py): each
+# document type has its accepted file types (by magic bytes) and size limit
+UPLOAD_DIR = 'uploads'
+IMAGE_TYPES = ('image/jpeg', 'image/png')
+UPLOAD_CONFIG = {
+    'max_total_bytes': 12 * 1024 * 1024,
+    'max_field_bytes': 64 * 1024,  # Each text field
+    'chunk_bytes': 64 * 1024,
+    'document_types': {
+        'passport_photo': {'types': IMAGE_TYPES, 'max_bytes': 2 * 1024 * 1024},
+        'birth_certificate': {'types': IMAGE_TYPES + ('application/pdf',), 'max_bytes': 5 * 1024 * 1024},
+        'parent_id_front': {'types': IMAGE_TYPES + ('application/pdf',), 'max_bytes': 5 * 1024 * 1024},
+        'ob_photo': {'types': IMAGE_TYPES + ('application/pdf',), 'max_bytes': 5 * 1024 * 1024}
+    },
+    'clamd_socket': os.environ.get('CLAMD_SOCKET')  # Scan uploads with a local clamd as they arrive
+}
+
+# Cleanup jobs, run by whichever worker holds the maintenance lock (see maintenance.py).
+# Each run handles at most max_per_run rows/files, batch_size at a time.
+MAINTENANCE_CONFIG = {
+    'tick_seconds': 30,
+    'jobs': {
+        # Uploads with no documents row (failed submissions) and abandoned partial uploads
+        'orphan_files': {'interval_seconds': 3600, 'grace_minutes': 60,
+                         'batch_size': 500, 'max_per_run': 50000, 'pause_seconds': 0.2},
+        # Files of rejected applications, and of archived ones, past their retention
+        'document_retention': {'interval_seconds': 6 * 3600, 'rejected_days': 90, 'archived_days': 730,
+                               'batch_size': 200, 'max_per_run': 5000, 'pause_seconds': 0.5},
+        'pending_officers': {'interval_seconds': 24 * 3600, 'pending_days': 30,
+                             'batch_size': 500, 'max_per_run': 5000, 'pause_seconds': 0.2},
+        'expired_claims': {'interval_seconds': 300, 'batch_size': 500, 'max_per_run': 5000,
+                           'pause_seconds': 0.1}
+    }
+}
+
+# Backups (see backup.py): one mysqldump per shard plus the uploads added since
+# the previous manifest. dump_args need RELOAD and REPLICATION CLIENT for the
+# binlog position; use --master-data=2 before MySQL 8.0.26.
+BACKUP_CONFIG = {
+    'dir': os.environ.get('BACKUP_DIR', 'backups'),
+    'workers': None,  # Compression/restore processes; None is one per CPU
+    'compress_level': 6,
+    'watermark_overlap_seconds': 600,
+    'mysqldump': 'mysqldump',
+    'mysql': 'mysql',
+    'mysqlbinlog': 'mysqlbinlog',
+    'dump_args': ['--single-transaction', '--source-data=2', '--routines', '--triggers', '--events',
+                  '--set-gtid-purged=OFF']
+}
+
+# How long an admin holds applications claimed from the review queue
+CLAIM_LEASE_MINUTES = 15
+
+# Mutations of applications/officers must send If-Match: "<version>" (428 otherwise)
+IF_MATCH_REQUIRED = True
+
+# Rate limits are (tokens per second, burst). Requests are shed (503) when the
+# DB connect-time EWMA or in-flight count reaches their priority's threshold.
+ADMISSION_CONFIG = {
+    'public_rate': (5, 20),            # Per IP, unauthenticated reads
+    'anonymous_write_rate': (2, 10),   # Per IP, unauthenticated writes (signup, login)
+    'token_rate': (20, 60),            # Per signed-in officer/admin
+    'shed_connect_ms': {'public': 200, 'officer': 1000},  # Admin traffic is never shed
+    'max_in_flight': {'public': 48, 'officer': 96, 'admin': None},
+    'shed_retry_after': 5,
+    'ewma_alpha': 0.2,
+    'pressure_half_life': 2,  # Seconds; pressure decays when no connections are being made
+    'redis_url': os.environ.get('RATE_LIMIT_REDIS_URL')  # Share buckets across workers
+}
+
+# Connections per worker and database (see db_pool.py). Each keeps up to
+# max_statements prepared statements; size * max_statements * workers must stay
+# under the server's max_prepared_stmt_count.
+DB_POOL_CONFIG = {
+    'size': 32,
+    'max_statements': 32,
+    'acquire_timeout': 5,
+    'max_idle_seconds': 60  # Ping connections idle longer than this before reuse
+}
+
+OFFICER_IMPORT_CONFIG = {
+    'workers': None,  # Password-hashing processes; None is one per CPU
+    'batch_size': 500,  # Officers per INSERT
+    'max_rows': 500,  # Per request; larger rollouts go through python officers_bulk.py import
+    'max_bytes': 512 * 1024  # Request body, checked before it is read
+}
+
+PENDING_OFFICERS_PAGE_SIZE = 50
+MAX_PENDING_OFFICERS_PAGE_SIZE = 200
+
+
+def shard_config(shard):
+    return SHARDS[shard]['config'] or DB_CONFIG
+
+
+def connect(shard='main'):
+    """An unpooled connection to a shard (or the main database), for command-line tools."""
+    return mysql.connector.connect(**shard_config(shard))
@@ -0,0 +1,85 @@
+"""
+In-process constituency registry for the Digital ID system
+Keeps the constituencies list, and the shard owning each one, in memory in
+each worker. add/delete (and shard moves) bump a version counter in the
+cache_versions table; workers poll that counter at most every few seconds
+and reload only when it has moved.
+"""
+
+import threading
+import time
+
+CACHE_NAME = 'constituencies'
+
+
+def bump_version(cursor):
+    """Invalidate every worker's copy. Call inside the transaction that changed the list."""
+    cursor.execute("""
+        INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, (CACHE_NAME,))
+
+
+class ConstituencyRegistry:
+    def __init__(self, get_connection, check_interval_seconds=5):
+        self.get_connection = get_connection
+        self.check_interval_seconds = check_interval_seconds
+        self.version = None
+        self.rows = []
+        self.names = frozenset()
+        self.shards = {}  # name -> (shard, moving)
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def _current_version(self, cursor):
+        cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (CACHE_NAME,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self.checked_at < self.check_interval_seconds:
+            return
+
+        with self.lock:
+            if not force and time.monotonic() - self.checked_at < self.check_interval_seconds:
+                return
+
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                version = self._current_version(cursor)
+                if force or version != self.version:
+                    cursor.execute("""
+                        SELECT id, name, created_at, shard, moving FROM constituencies ORDER BY name
+                    """)
+                    rows = []
+                    shards = {}
+                    for id_, name, created_at, shard, moving in cursor.fetchall():
+                        rows.append({'id': id_, 'name': name, 'created_at': created_at})
+                        shards[name] = (shard, bool(moving))
+                    self.rows = rows
+                    self.names = frozenset(shards)
+                    self.shards = shards
+                    self.version = version
+                self.checked_at = time.monotonic()
+            finally:
+                cursor.close()
+                conn.close()
+
+    def all(self):
+        """Return (version, rows) for the current list."""
+        self.refresh()
+        return self.version, self.rows
+
+    def contains(self, name):
+        self.refresh()
+        return name in self.names
+
+    def shard_for(self, name):
+        """(shard, moving) for a constituency; (None, False) if it is unknown."""
+        self.refresh()
+        return self.shards.get(name, (None, False))
+
+    def invalidate(self):
+        """Force this worker to re-check on next use (other workers follow via the version)."""
+        self.checked_at = 0
@@ -1,5 +1,7 @@
 -- Digital ID System Database Schema
 -- Run this SQL script in your MySQL database
+-- Superseded by migrate.py: new schema changes go in migrations/ as numbered
+-- migrations, applied with `python migrate.py` against DB_CONFIG in config.py.
 
 CREATE DATABASE IF NOT EXISTS digital_id_system;
 USE digital_id_system;
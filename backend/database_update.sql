@@ -1,4 +1,6 @@
 -- Add constituencies table to existing database
+-- Superseded by migrate.py: new schema changes go in migrations/ as numbered
+-- migrations, applied with `python migrate.py` against DB_CONFIG in config.py.
 USE dig_id;
 
 -- Create constituencies table
@@ -8,8 +10,8 @@ CREATE TABLE IF NOT EXISTS constituencies (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Add constituency field to officers table
-ALTER TABLE officers ADD COLUMN IF NOT EXISTS constituency VARCHAR(100);
+-- officers.constituency is added by migration 0002: MySQL has no
+-- ADD COLUMN IF NOT EXISTS, and migrate.py checks information_schema first
 
 -- Insert some default constituencies (optional)
 INSERT IGNORE INTO constituencies (name) VALUES 
@@ -31,3 +33,8 @@ ALTER TABLE officers MODIFY COLUMN status ENUM('pending', 'approved', 'rejected'
 
 -- Add 'ready_for_dispatch' status to applications
 ALTER TABLE applications MODIFY COLUMN status ENUM('submitted', 'approved', 'rejected', 'ready_for_dispatch', 'dispatched', 'ready_for_collection', 'collected') DEFAULT 'submitted';
+
+
+-- Archive tables (migration 0003) and review queue claims (migration 0004)
+-- are only created by migrate.py, which skips columns and indexes that
+-- already exist, so they are safe to apply to a database this script set up.
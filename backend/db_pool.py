@@ -0,0 +1,199 @@
+"""
+Pooled MySQL connections with prepared-statement caches for the Digital ID API
+Each worker keeps a pool of open connections per database instead of
+connecting for every request. A pooled connection remembers the statements
+it has prepared on the server, so the hot queries are parsed once per
+connection and afterwards sent as a statement id plus binary-encoded
+parameters. Each connection caches at most max_statements of them and
+closes the least recently used on the server when it needs room.
+
+get_db_connection() and get_shard_connection() hand out these connections;
+they are used exactly as before. Ask for conn.cursor(prepared=True) to go
+through the statement cache; close() returns the connection to the pool.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import mysql.connector
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class StatementCache:
+    """One connection's server-side prepared statements, least recently used first."""
+
+    def __init__(self, conn, max_statements, stats):
+        self.conn = conn
+        self.max_statements = max_statements
+        self.stats = stats
+        self.cursors = OrderedDict()  # (sql, dictionary) -> (sql as prepared, prepared cursor)
+
+    def get(self, sql, dictionary):
+        """(sql, cursor) to execute with: the connector re-prepares unless handed the very string it prepared."""
+        key = (sql, dictionary)
+        entry = self.cursors.get(key)
+        if entry is not None:
+            self.cursors.move_to_end(key)
+            self.stats['statement_hits'] += 1
+            return entry
+
+        self.stats['statement_prepares'] += 1
+        entry = self.cursors[key] = (sql, self.conn.cursor(prepared=True, dictionary=dictionary))
+        if len(self.cursors) > self.max_statements:
+            _, (_, evicted) = self.cursors.popitem(last=False)
+            evicted.close()  # COM_STMT_CLOSE frees it on the server
+            self.stats['statement_evictions'] += 1
+        return entry
+
+
+class StatementCursor:
+    """Cursor over a connection's statement cache.
+
+    execute() runs the statement through its cached prepared cursor
+    (preparing it on first use); everything else is that cursor's.
+    close() leaves the statement prepared for the next request.
+    """
+
+    def __init__(self, conn, statements, dictionary):
+        self.conn = conn
+        self.statements = statements
+        self.dictionary = dictionary
+        self.current = None
+
+    def execute(self, sql, params=()):
+        self._drain()
+        # SQL built per call (f-strings) is equal to, but not, the string prepared
+        sql, self.current = self.statements.get(sql, self.dictionary)
+        self.current.execute(sql, params)
+
+    def _drain(self):
+        # Rows left unread would block the next statement on this connection
+        if self.current is not None and self.conn.unread_result:
+            self.current.fetchall()
+
+    def close(self):
+        self._drain()
+        self.current = None
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+
+
+class PooledConnection:
+    """A pooled connection as handed to a request; close() gives it back."""
+
+    def __init__(self, pool, conn, statements):
+        self._pool = pool
+        self._conn = conn
+        self._statements = statements
+
+    def cursor(self, prepared=False, dictionary=False, **kwargs):
+        if prepared and not kwargs:
+            return StatementCursor(self._conn, self._statements, dictionary)
+        return self._conn.cursor(prepared=prepared, dictionary=dictionary, **kwargs)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn, self._statements)
+
+    # Routes that return early without close() still give the connection back
+    __del__ = close
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError('Connection was returned to the pool')
+        return getattr(self._conn, name)
+
+
+class ConnectionPool:
+    """Open connections to one database, reused across requests (LIFO, so the hot ones stay warm)."""
+
+    def __init__(self, db_config, size=32, max_statements=32, acquire_timeout=5,
+                 max_idle_seconds=60, on_acquire=None):
+        self.db_config = db_config
+        self.size = size
+        self.max_statements = max_statements
+        self.acquire_timeout = acquire_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.on_acquire = on_acquire
+        self.idle = queue.LifoQueue()  # (conn, statements, idle since)
+        self.created = 0
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def _open(self):
+        conn = mysql.connector.connect(**self.db_config)
+        self.stats['connects'] += 1
+        return conn, StatementCache(conn, self.max_statements, self.stats)
+
+    def _reserve(self):
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                return True
+            return False
+
+    def _forget(self, conn):
+        with self.lock:
+            self.created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get(self):
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    conn, statements, idle_since = self.idle.get_nowait()
+                except queue.Empty:
+                    if self._reserve():
+                        try:
+                            conn, statements = self._open()
+                        except Exception:
+                            with self.lock:
+                                self.created -= 1
+                            raise
+                        break
+                    try:
+                        conn, statements, idle_since = self.idle.get(timeout=self.acquire_timeout)
+                    except queue.Empty:
+                        self.stats['exhausted'] += 1
+                        raise PoolExhausted(f"No database connection free after {self.acquire_timeout}s")
+
+                # The server drops connections idle past wait_timeout; check ones that sat a while
+                if time.monotonic() - idle_since > self.max_idle_seconds:
+                    try:
+                        conn.ping(reconnect=False)
+                    except Exception:
+                        self.stats['stale'] += 1
+                        self._forget(conn)
+                        continue
+                break
+        finally:
+            if self.on_acquire:
+                self.on_acquire(time.perf_counter() - started)
+
+        self.stats['checkouts'] += 1
+        return PooledConnection(self, conn, statements)
+
+    def release(self, conn, statements):
+        try:
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()  # Uncommitted work never leaks into the next request
+        except Exception:
+            self._forget(conn)
+            return
+        self.idle.put((conn, statements, time.monotonic()))
+
+    def snapshot(self):
+        return {'size': self.size, 'open': self.created, 'idle': self.idle.qsize(), **self.stats}
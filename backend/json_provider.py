@@ -0,0 +1,91 @@
+"""
+Fast JSON responses for the Digital ID API
+Swaps Flask's default JSON provider for orjson (native datetime/date support,
+Decimal via a default hook), builds row dicts from plain tuple cursors and
+compresses large responses.
+"""
+
+import gzip
+from decimal import Decimal
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Fall back to Flask's stdlib json provider
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are not worth the CPU to compress
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson. Datetimes are emitted as ISO 8601."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys'):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype='application/json')
+
+
+def fetch_rows(cursor):
+    """Fetch all rows from a tuple cursor as dicts, computing the keys once."""
+    keys = cursor.column_names
+    return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+
+def compress_response(response):
+    """after_request hook: brotli/gzip-compress large uncompressed responses."""
+    if (response.direct_passthrough
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accepted:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_json(app):
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = DefaultJSONProvider(app)
+    app.after_request(compress_response)
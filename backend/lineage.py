@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+ID issuance lineage for the Digital ID system
+Every card issued under an ID number, in order: the original (sequence 0)
+and each lost-ID replacement (1, 2, ...), plus replacement requests still
+pending or rejected. Kept on the main database in id_lineage, keyed by the
+ID number, so a person's history is one indexed lookup whichever shards
+hold the applications. Lost-ID submissions add a pending row; approvals and
+rejections settle it.
+
+Usage:
+    python lineage.py rebuild         Refill id_lineage from every shard's applications
+    python lineage.py ID_NUMBER       Print an ID number's issuance chain
+"""
+
+import sys
+from datetime import datetime
+
+ISSUED_STATUSES = ('approved', 'ready_for_dispatch', 'dispatched', 'ready_for_collection', 'collected')
+
+CHAIN_COLUMNS = ('application_id', 'application_number', 'application_type', 'full_names',
+                 'status', 'sequence', 'requested_at', 'issued_at')
+
+
+def normalize(id_number):
+    """ID numbers are typed in by hand on lost-ID forms."""
+    return (id_number or '').strip().upper() or None
+
+
+def record_request(cursor, id_number, application_id, application_number, full_names, requested_at=None):
+    """A lost-ID replacement was requested. Call on the main database."""
+    cursor.execute("""
+        INSERT INTO id_lineage (id_number, application_id, application_number, application_type,
+                                full_names, status, requested_at)
+        VALUES (%s, %s, %s, 'renewal', %s, 'pending', %s)
+        ON DUPLICATE KEY UPDATE id_number = VALUES(id_number)
+    """, (normalize(id_number), application_id, application_number, full_names, requested_at or datetime.now()))
+
+
+def record_issue(cursor, id_number, application_id, application_number, application_type, full_names,
+                 requested_at=None):
+    """A card was issued: sequence 0 for a new ID, the next replacement number for a renewal."""
+    id_number = normalize(id_number)
+    if application_type == 'renewal':
+        # Concurrent approvals of one ID number queue on its number_sequences
+        # row and number in turn. Locking the chain itself is not enough: for an
+        # ID number with no replacements yet that takes only gap locks, and two
+        # approvals holding them deadlock on their inserts.
+        cursor.execute("""
+            INSERT INTO number_sequences (name, last_value) VALUES (%s, 0)
+            ON DUPLICATE KEY UPDATE last_value = last_value
+        """, (f"lineage:{id_number}",))
+        cursor.execute("""
+            SELECT COALESCE(MAX(sequence), 0) FROM id_lineage
+            WHERE id_number = %s AND application_type = 'renewal' AND status = 'issued'
+            FOR UPDATE
+        """, (id_number,))
+        sequence = cursor.fetchone()[0] + 1
+    else:
+        sequence = 0
+
+    now = datetime.now()
+    cursor.execute("""
+        INSERT INTO id_lineage (id_number, application_id, application_number, application_type,
+                                full_names, status, sequence, requested_at, issued_at)
+        VALUES (%s, %s, %s, %s, %s, 'issued', %s, %s, %s)
+        ON DUPLICATE KEY UPDATE status = 'issued', sequence = VALUES(sequence), issued_at = VALUES(issued_at)
+    """, (id_number, application_id, application_number, application_type, full_names, sequence,
+          requested_at or now, now))
+    return sequence
+
+
+def record_rejection(cursor, application_id):
+    cursor.execute("""
+        UPDATE id_lineage SET status = 'rejected'
+        WHERE application_id = %s AND status = 'pending'
+    """, (application_id,))
+
+
+def issuance_chain(cursor, id_number):
+    """Every issue of and request against an ID number, oldest first."""
+    cursor.execute(f"""
+        SELECT {', '.join(CHAIN_COLUMNS)} FROM id_lineage
+        WHERE id_number = %s
+        ORDER BY sequence IS NULL, sequence, requested_at
+    """, (normalize(id_number),))
+    return [dict(zip(CHAIN_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+ORIGINAL_APPLICATION_QUERY = """
+    SELECT application_id FROM id_lineage
+    WHERE id_number = %s AND sequence = 0
+"""
+
+
+def original_application(cursor, id_number):
+    """Id of the application that first issued an ID number, if it is known."""
+    cursor.execute(ORIGINAL_APPLICATION_QUERY, (normalize(id_number),))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _lineage_rows(shard, conn):
+    """Every application on a shard that issued an ID or asked to replace one, with when it was approved."""
+    cursor = conn.cursor()
+    rows = []
+    for table, history in (('applications', 'status_history'),
+                           ('applications_archive', 'status_history_archive')):
+        # Issued when first approved; applications approved before status
+        # history was kept fall back to their last update. Migrations 0016 and
+        # 0023 number replacements the same way.
+        cursor.execute(f"""
+            SELECT a.id, a.application_number, a.application_type, a.full_names, a.status, a.created_at,
+                   IF(a.application_type = 'renewal', a.existing_id_number, a.generated_id_number),
+                   COALESCE(MIN(h.changed_at), a.updated_at)
+            FROM {table} a
+            LEFT JOIN {history} h ON h.application_id = a.id AND h.new_status = 'approved'
+            WHERE (a.application_type = 'renewal' AND a.existing_id_number IS NOT NULL)
+               OR (a.application_type = 'new' AND a.generated_id_number IS NOT NULL)
+            GROUP BY a.id
+        """)
+        rows.extend(cursor.fetchall())
+    cursor.close()
+    return rows
+
+
+def rebuild(router, get_connection, batch_size=1000):
+    """Recompute id_lineage from the applications on every shard. Returns the number of entries."""
+    chains = {}
+    for shard_rows in router.scatter(_lineage_rows).values():
+        for (application_id, application_number, application_type, full_names, status, created_at,
+             id_number, approved_at) in shard_rows:
+            id_number = normalize(id_number)
+            if id_number:
+                chains.setdefault(id_number, []).append(
+                    (application_id, application_number, application_type, full_names, status,
+                     created_at, approved_at))
+
+    rows = []
+    for id_number, applications in chains.items():
+        replacements = 0
+        for (application_id, application_number, application_type, full_names, status,
+             created_at, approved_at) in sorted(applications, key=lambda a: (a[2] == 'renewal', a[6] or a[5], a[0])):
+            if status in ISSUED_STATUSES:
+                if application_type == 'renewal':
+                    replacements += 1
+                rows.append((id_number, application_id, application_number, application_type, full_names,
+                             'issued', replacements if application_type == 'renewal' else 0,
+                             created_at, approved_at))
+            else:
+                rows.append((id_number, application_id, application_number, application_type, full_names,
+                             'rejected' if status == 'rejected' else 'pending', None, created_at, None))
+
+    # Upserted rather than cleared first, so entries written meanwhile survive
+    conn = get_connection()
+    cursor = conn.cursor()
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany("""
+            INSERT INTO id_lineage (id_number, application_id, application_number, application_type,
+                                    full_names, status, sequence, requested_at, issued_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id_number = VALUES(id_number), status = VALUES(status),
+                                    sequence = VALUES(sequence), issued_at = VALUES(issued_at)
+        """, rows[start:start + batch_size])
+        conn.commit()
+    cursor.close()
+    conn.close()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from config import connect
+    from sharding import standalone_router
+
+    if len(sys.argv) != 2:
+        print(__doc__)
+    elif sys.argv[1] == "rebuild":
+        count = rebuild(standalone_router(), connect)
+        print(f"✅ id_lineage rebuilt with {count} entries")
+    else:
+        conn = connect()
+        cursor = conn.cursor()
+        chain = issuance_chain(cursor, sys.argv[1])
+        cursor.close()
+        conn.close()
+        if not chain:
+            print(f"No issues or replacement requests recorded for {sys.argv[1]}")
+        for entry in chain:
+            if entry['sequence'] == 0:
+                label = 'original'
+            elif entry['sequence']:
+                label = f"replacement {entry['sequence']}"
+            else:
+                label = entry['status']
+            issued = f"issued {entry['issued_at']:%Y-%m-%d}" if entry['issued_at'] else ''
+            print(f"  {label:<16} {entry['application_number']}  {entry['full_names']}  "
+                  f"requested {entry['requested_at']:%Y-%m-%d}  {issued}")
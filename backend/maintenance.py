@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Background maintenance for the Digital ID system
+A scheduler thread runs in every worker, but only the worker holding the
+MySQL named lock (GET_LOCK on the main database) runs jobs, so each job runs
+once per interval across the deployment and another worker takes over if
+the leader dies. Jobs work in small batches with a pause between them, stop
+at a per-run cap and carry on from where they stopped on the next run.
+Every run is recorded in maintenance_runs with its counters; the next run,
+the next leader and the metrics route all read it from there.
+
+Usage:
+    python maintenance.py            Run every job once (ignores the schedule)
+    python maintenance.py JOB        Run one job once
+"""
+
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+LOCK_NAME = 'dig_id_maintenance'
+TEMP_UPLOAD_PREFIX = '.upload-'  # Parts still streaming in (see uploads.py)
+
+
+class MaintenanceContext:
+    """What a job may touch: the main database, each shard and the uploads tree.
+
+    get_lock_connection opens an unpooled main-database connection; the
+    maintenance lock lives as long as its session.
+    """
+
+    def __init__(self, get_connection, router, upload_dir, get_lock_connection=None):
+        self.get_connection = get_connection
+        self.router = router
+        self.upload_dir = upload_dir
+        self.get_lock_connection = get_lock_connection or get_connection
+
+    def moving_clause(self, column='constituency'):
+        """SQL excluding constituencies mid-move (their rows are being copied), with its params."""
+        moving = self.router.moving()
+        if not moving:
+            return '', ()
+        placeholders = ', '.join(['%s'] * len(moving))
+        return f"AND {column} NOT IN ({placeholders})", tuple(moving)
+
+
+def _pause(config):
+    if config.get('pause_seconds'):
+        time.sleep(config['pause_seconds'])
+
+
+def _remove(path):
+    """Delete a file. Returns the bytes freed (0 if it was already gone)."""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def sweep_orphan_files(ctx, config, previous):
+    """Remove uploads no documents row refers to, and abandoned partial uploads.
+
+    Walks the uploads directory in name order, one batch at a time, looking
+    each batch up in documents and documents_archive on every shard. The
+    lookup is by exact path on the file_path indexes rather than a merge
+    against rows read in index order: the column's case-insensitive
+    collation sorts names differently from the filesystem walk, and a merge
+    that disagreed on order would take live uploads for orphans. Files
+    newer than the grace period are left alone: a submission moves its files
+    into place just before it commits.
+    """
+    counters = Counter()
+    cursor_name = (previous or {}).get('cursor', '')
+    grace_cutoff = time.time() - config['grace_minutes'] * 60
+
+    try:
+        names = sorted(entry.name for entry in os.scandir(ctx.upload_dir) if entry.is_file())
+    except FileNotFoundError:
+        names = []
+    start = bisect.bisect_right(names, cursor_name)
+    end = min(len(names), start + config['max_per_run'])
+
+    def referenced(paths):
+        placeholders = ', '.join(['%s'] * len(paths))
+
+        def lookup(shard, conn):
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT file_path FROM documents WHERE file_path IN ({placeholders})
+                UNION
+                SELECT file_path FROM documents_archive WHERE file_path IN ({placeholders})
+            """, (*paths, *paths))
+            found = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+            return found
+
+        return set().union(*ctx.router.scatter(lookup).values())
+
+    for batch_start in range(start, end, config['batch_size']):
+        batch = names[batch_start:min(end, batch_start + config['batch_size'])]
+        paths = {os.path.join(ctx.upload_dir, name): name for name in batch}
+        known = referenced(list(paths))
+
+        for path, name in paths.items():
+            counters['scanned'] += 1
+            if path in known:
+                continue
+            try:
+                if os.path.getmtime(path) > grace_cutoff:
+                    counters['kept_recent'] += 1
+                    continue
+            except FileNotFoundError:
+                continue
+            counters['bytes_freed'] += _remove(path)
+            counters['temp_removed' if name.startswith(TEMP_UPLOAD_PREFIX) else 'orphans_removed'] += 1
+
+        cursor_name = batch[-1]
+        _pause(config)
+
+    # Start over from the top once the whole directory has been walked
+    finished = end >= len(names)
+    return {**counters, 'cursor': '' if finished else cursor_name, 'pass_complete': finished}
+
+
+def _purge_documents(ctx, config, table, select_sql, cutoff):
+    """Delete the files of the documents select_sql picks, then mark the rows purged.
+
+    Returns (documents purged, bytes freed).
+    """
+    moving_sql, moving_params = ctx.moving_clause('a.constituency')
+
+    def purge(shard, conn):
+        cursor = conn.cursor()
+        purged, freed = 0, 0
+        while purged < config['max_per_run']:
+            cursor.execute(f"{select_sql} {moving_sql} ORDER BY d.id LIMIT %s",
+                           (cutoff, *moving_params, config['batch_size']))
+            rows = cursor.fetchall()
+            conn.rollback()  # Don't hold the read view across the file deletes
+            if not rows:
+                break
+
+            freed += sum(_remove(file_path) for _, file_path in rows)
+            ids = [row[0] for row in rows]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"UPDATE {table} SET purged_at = %s WHERE id IN ({placeholders})",
+                           (datetime.now(), *ids))
+            conn.commit()
+
+            purged += len(ids)
+            if len(rows) < config['batch_size']:
+                break
+            _pause(config)
+        cursor.close()
+        return purged, freed
+
+    results = ctx.router.scatter(purge).values()
+    return sum(purged for purged, _ in results), sum(freed for _, freed in results)
+
+
+def enforce_document_retention(ctx, config, previous):
+    """Delete the files of long-rejected applications and of archived ones past retention.
+
+    The documents rows stay, with purged_at set, so the record of what was
+    submitted survives.
+    """
+    rejected, rejected_freed = _purge_documents(ctx, config, 'documents', """
+        SELECT d.id, d.file_path FROM documents d
+        JOIN applications a ON a.id = d.application_id
+        WHERE a.status = 'rejected' AND a.updated_at < %s AND d.purged_at IS NULL
+    """, datetime.now() - timedelta(days=config['rejected_days']))
+    archived, archived_freed = _purge_documents(ctx, config, 'documents_archive', """
+        SELECT d.id, d.file_path FROM documents_archive d
+        JOIN applications_archive a ON a.id = d.application_id
+        WHERE a.archived_at < %s AND d.purged_at IS NULL
+    """, datetime.now() - timedelta(days=config['archived_days']))
+    return {'rejected_purged': rejected, 'archived_purged': archived,
+            'bytes_freed': rejected_freed + archived_freed}
+
+
+def expire_pending_officers(ctx, config, previous):
+    """Reject officer signups left pending longer than pending_days."""
+    cutoff = datetime.now() - timedelta(days=config['pending_days'])
+    conn = ctx.get_connection()
+    cursor = conn.cursor()
+    expired = 0
+    try:
+        while expired < config['max_per_run']:
+            cursor.execute("""
+                UPDATE officers SET status = 'rejected'
+                WHERE status = 'pending' AND created_at < %s
+                ORDER BY id
+                LIMIT %s
+            """, (cutoff, config['batch_size']))
+            conn.commit()
+            expired += cursor.rowcount
+            if cursor.rowcount < config['batch_size']:
+                break
+            _pause(config)
+    finally:
+        cursor.close()
+        conn.close()
+    return {'officers_expired': expired}
+
+
+def release_expired_claims(ctx, config, previous):
+    """Clear review-queue claims whose lease ran out, so the queue shows them as free."""
+    moving_sql, moving_params = ctx.moving_clause()
+
+    def release(shard, conn):
+        cursor = conn.cursor()
+        released = 0
+        while released < config['max_per_run']:
+            cursor.execute(f"""
+                UPDATE applications
+                SET claimed_by_admin_id = NULL, claim_expires_at = NULL
+                WHERE status = 'submitted' AND claim_expires_at < %s {moving_sql}
+                LIMIT %s
+            """, (datetime.now(), *moving_params, config['batch_size']))
+            conn.commit()
+            released += cursor.rowcount
+            if cursor.rowcount < config['batch_size']:
+                break
+            _pause(config)
+        cursor.close()
+        return released
+
+    return {'claims_released': sum(ctx.router.scatter(release).values())}
+
+
+JOBS = {
+    'orphan_files': sweep_orphan_files,
+    'document_retention': enforce_document_retention,
+    'pending_officers': expire_pending_officers,
+    'expired_claims': release_expired_claims,
+}
+
+
+def last_runs(conn):
+    """The latest run of each job: {job: {'started_at', 'duration_ms', 'result', 'error'}}."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT r.job, r.started_at, r.duration_ms, r.result, r.error
+        FROM maintenance_runs r
+        JOIN (SELECT job, MAX(id) AS id FROM maintenance_runs GROUP BY job) latest ON latest.id = r.id
+    """)
+    runs = {
+        job: {'started_at': started_at, 'duration_ms': duration_ms,
+              'result': json.loads(result) if result else None, 'error': error}
+        for job, started_at, duration_ms, result, error in cursor.fetchall()
+    }
+    cursor.close()
+    return runs
+
+
+def job_totals(conn, since):
+    """Runs, failures and average duration of each job since a time."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT job, COUNT(*), SUM(error IS NOT NULL), AVG(duration_ms)
+        FROM maintenance_runs
+        WHERE started_at >= %s
+        GROUP BY job
+    """, (since,))
+    totals = {job: {'runs': runs, 'failures': int(failures or 0), 'avg_duration_ms': round(float(avg or 0))}
+              for job, runs, failures, avg in cursor.fetchall()}
+    cursor.close()
+    return totals
+
+
+def run_job(ctx, name, config, previous=None):
+    """Run one job and record it. Returns the stored run."""
+    started_at = datetime.now()
+    started = time.perf_counter()
+    result, error = None, None
+    try:
+        result = JOBS[name](ctx, config, previous)
+    except Exception as e:
+        error = str(e)[:1000]
+    duration_ms = int((time.perf_counter() - started) * 1000)
+
+    conn = ctx.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO maintenance_runs (job, started_at, duration_ms, result, error)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (name, started_at, duration_ms, json.dumps(result) if result is not None else None, error))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    # A failed run keeps the previous cursor, so the next run retries the same stretch
+    return {'started_at': started_at, 'duration_ms': duration_ms,
+            'result': result if error is None else previous, 'error': error}
+
+
+class MaintenanceScheduler:
+    """Runs JOBS on their intervals in whichever worker holds the maintenance lock."""
+
+    def __init__(self, ctx, config):
+        self.ctx = ctx
+        self.config = config
+        self.lock_conn = None
+        self.runs = {}
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @property
+    def is_leader(self):
+        return self.lock_conn is not None
+
+    def _hold_lock(self):
+        """Take or keep the maintenance lock. The lock lives as long as its session."""
+        try:
+            if self.lock_conn is None:
+                conn = self.ctx.get_lock_connection()
+                cursor = conn.cursor()
+                cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+                acquired = cursor.fetchone()[0] == 1
+                cursor.close()
+                if not acquired:
+                    conn.close()
+                    return False
+                self.lock_conn = conn
+                self.runs = last_runs(conn)
+                conn.commit()
+                print("[maintenance] Took the maintenance lock; running jobs in this worker")
+                return True
+
+            cursor = self.lock_conn.cursor()
+            cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (LOCK_NAME,))
+            held = cursor.fetchone()[0] == 1
+            cursor.close()
+            if not held:
+                raise RuntimeError('lock lost')
+            return True
+        except Exception as e:
+            if self.lock_conn is not None:
+                print(f"[maintenance] Lost the maintenance lock: {e}")
+                try:
+                    self.lock_conn.close()
+                except Exception:
+                    pass
+                self.lock_conn = None
+            return False
+
+    def _due(self, name):
+        last = self.runs.get(name)
+        if last is None:
+            return True
+        interval = self.config['jobs'][name]['interval_seconds']
+        return datetime.now() >= last['started_at'] + timedelta(seconds=interval)
+
+    def tick(self):
+        if not self._hold_lock():
+            return
+        for name in JOBS:
+            if self.stopping.is_set() or not self._due(name):
+                continue
+            previous = (self.runs.get(name) or {}).get('result')
+            run = run_job(self.ctx, name, self.config['jobs'][name], previous)
+            self.runs[name] = run
+            if run['error']:
+                print(f"[maintenance] {name} failed after {run['duration_ms']} ms: {run['error']}")
+            elif any(value for key, value in run['result'].items() if key not in ('cursor', 'pass_complete')):
+                print(f"[maintenance] {name} ({run['duration_ms']} ms): {run['result']}")
+
+    def run(self):
+        while not self.stopping.wait(self.config['tick_seconds']):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[maintenance] Error: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='maintenance', daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stopping.set()
+
+    def snapshot(self):
+        """Per-job metrics for the admin metrics route, read from maintenance_runs."""
+        conn = self.ctx.get_connection()
+        try:
+            latest = last_runs(conn)
+            totals = job_totals(conn, datetime.now() - timedelta(days=1))
+        finally:
+            conn.close()
+
+        jobs = {}
+        for name in JOBS:
+            last = latest.get(name) or {}
+            interval = self.config['jobs'][name]['interval_seconds']
+            jobs[name] = {
+                'intervalSeconds': interval,
+                'lastStartedAt': last['started_at'].isoformat() if last else None,
+                'nextDueAt': ((last['started_at'] + timedelta(seconds=interval)).isoformat()
+                              if last else None),
+                'lastDurationMs': last.get('duration_ms'),
+                'lastResult': last.get('result'),
+                'lastError': last.get('error'),
+                'last24h': totals.get(name, {'runs': 0, 'failures': 0, 'avg_duration_ms': 0})
+            }
+        return {'leader': self.is_leader, 'jobs': jobs}
+
+
+if __name__ == "__main__":
+    from config import MAINTENANCE_CONFIG, UPLOAD_DIR, connect
+    from sharding import standalone_router
+
+    names = sys.argv[1:] or list(JOBS)
+    unknown = [name for name in names if name not in JOBS]
+    if unknown:
+        print(__doc__)
+        print(f"Unknown job(s): {', '.join(unknown)}. Jobs: {', '.join(JOBS)}")
+        sys.exit(1)
+
+    ctx = MaintenanceContext(connect, standalone_router(), UPLOAD_DIR, connect)
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+    if cursor.fetchone()[0] != 1:
+        print("❌ A worker is running maintenance right now; try again later.")
+        sys.exit(1)
+    latest = last_runs(conn)
+    for name in names:
+        previous = (latest.get(name) or {}).get('result')
+        run = run_job(ctx, name, MAINTENANCE_CONFIG['jobs'][name], previous)
+        if run['error']:
+            print(f"❌ {name} failed: {run['error']}")
+        else:
+            print(f"✅ {name} ({run['duration_ms']} ms): {run['result']}")
+    conn.close()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Schema migration runner for the Digital ID system
+Applies the numbered migrations in migrations/ in order and records each one
+in the schema_migrations table. Uses DB_CONFIG and SHARDS from config.py.
+
+Usage:
+    python migrate.py           Apply pending migrations
+    python migrate.py status    List applied and pending migrations
+"""
+
+import importlib.util
+import os
+import re
+import sys
+import time
+
+import mysql.connector
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# MySQL refuses the requested ALGORITHM/LOCK for this change
+ONLINE_DDL_UNSUPPORTED = (1845, 1846)
+
+
+class Migrator:
+    """Schema helpers handed to each migration's up() function.
+
+    Every helper is idempotent, so a migration that failed halfway can be
+    re-run. DDL prefers online algorithms (INSTANT, then INPLACE with
+    LOCK=NONE) and only falls back to a locking table copy when the
+    migration explicitly allows it.
+    """
+
+    def __init__(self, conn, database):
+        self.conn = conn
+        self.database = database
+        self.cursor = conn.cursor()
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(sql, params)
+        return self.cursor
+
+    def table_exists(self, table):
+        self.cursor.execute("""
+            SELECT 1 FROM information_schema.tables
+            WHERE table_schema = %s AND table_name = %s
+        """, (self.database, table))
+        return self.cursor.fetchone() is not None
+
+    def column_exists(self, table, column):
+        self.cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s AND column_name = %s
+        """, (self.database, table, column))
+        return self.cursor.fetchone() is not None
+
+    def index_exists(self, table, index):
+        self.cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = %s AND table_name = %s AND index_name = %s
+        """, (self.database, table, index))
+        return self.cursor.fetchone() is not None
+
+    def alter_online(self, table, change, algorithms=('INPLACE',), allow_locking=False):
+        """Run ALTER TABLE with the first online algorithm MySQL accepts."""
+        for algorithm in algorithms:
+            lock = '' if algorithm == 'INSTANT' else ', LOCK=NONE'
+            try:
+                self.execute(f"ALTER TABLE {table} {change}, ALGORITHM={algorithm}{lock}")
+                return algorithm
+            except mysql.connector.Error as e:
+                if e.errno not in ONLINE_DDL_UNSUPPORTED:
+                    raise
+                print(f"    {algorithm} not supported for {table}: {e.msg}")
+
+        if not allow_locking:
+            raise RuntimeError(f"No online algorithm available for ALTER TABLE {table} {change}")
+        print(f"    Falling back to a locking ALTER on {table}")
+        self.execute(f"ALTER TABLE {table} {change}")
+        return 'COPY'
+
+    def add_column(self, table, column, definition, allow_locking=False):
+        if self.column_exists(table, column):
+            return
+        self.alter_online(table, f"ADD COLUMN {column} {definition}",
+                          algorithms=('INSTANT', 'INPLACE'), allow_locking=allow_locking)
+
+    def modify_column(self, table, column, definition, allow_locking=False):
+        """Change a column definition, e.g. append values to an ENUM (INSTANT on MySQL 8)."""
+        self.alter_online(table, f"MODIFY COLUMN {column} {definition}",
+                          algorithms=('INSTANT', 'INPLACE'), allow_locking=allow_locking)
+
+    def add_index(self, table, index, columns, unique=False, allow_locking=False):
+        if self.index_exists(table, index):
+            return
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        self.alter_online(table, f"ADD {kind} {index} ({columns})", allow_locking=allow_locking)
+
+    def drop_index(self, table, index):
+        if not self.index_exists(table, index):
+            return
+        self.alter_online(table, f"DROP INDEX {index}")
+
+    def backfill(self, table, assignments, where='1 = 1', params=(), chunk_size=5000, pause_seconds=0.05):
+        """UPDATE a large table in primary-key ranges, committing after each chunk.
+
+        Keeps each transaction (and its row locks and undo log) small so live
+        traffic and replication are never stalled by one huge UPDATE.
+        """
+        self.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+        low, high = self.cursor.fetchone()
+        if low is None:
+            return 0
+
+        updated = 0
+        for start in range(low, high + 1, chunk_size):
+            self.execute(f"""
+                UPDATE {table} SET {assignments}
+                WHERE id >= %s AND id < %s AND ({where})
+            """, (start, start + chunk_size, *params))
+            updated += self.cursor.rowcount
+            self.conn.commit()
+            if pause_seconds:
+                time.sleep(pause_seconds)
+        return updated
+
+
+def load_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(MIGRATIONS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append((int(match.group(1)), match.group(2), module))
+    return migrations
+
+
+def connect(db_config):
+    # The database itself may not exist yet on a fresh server
+    server_config = {k: v for k, v in db_config.items() if k != 'database'}
+    conn = mysql.connector.connect(**server_config)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_config['database']}")
+    cursor.close()
+    conn.database = db_config['database']
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INT NOT NULL
+        )
+    """)
+    cursor.close()
+    return conn
+
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def migrate(db_config):
+    conn = connect(db_config)
+    done = applied_versions(conn)
+    pending = [m for m in load_migrations() if m[0] not in done]
+
+    if not pending:
+        print("Schema is up to date.")
+        conn.close()
+        return 0
+
+    for version, name, module in pending:
+        print(f"Applying {version:04d}_{name}...")
+        started = time.time()
+        migrator = Migrator(conn, db_config['database'])
+        module.up(migrator)
+        conn.commit()
+
+        duration_ms = int((time.time() - started) * 1000)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO schema_migrations (version, name, duration_ms)
+            VALUES (%s, %s, %s)
+        """, (version, name, duration_ms))
+        conn.commit()
+        cursor.close()
+        print(f"✅ {version:04d}_{name} applied in {duration_ms} ms")
+
+    conn.close()
+    return len(pending)
+
+
+def status(db_config):
+    conn = connect(db_config)
+    done = applied_versions(conn)
+    conn.close()
+
+    for version, name, _ in load_migrations():
+        state = 'applied' if version in done else 'pending'
+        print(f"{version:04d}_{name}: {state}")
+
+
+if __name__ == "__main__":
+    from config import DB_CONFIG, SHARDS
+
+    # The main database, then every other shard
+    configs = [DB_CONFIG] + [shard['config'] for shard in SHARDS.values() if shard['config']]
+    for config in configs:
+        if len(configs) > 1:
+            print(f"== {config['host']}:{config.get('port', 3306)}/{config['database']}")
+        if len(sys.argv) > 1 and sys.argv[1] == "status":
+            status(config)
+        else:
+            migrate(config)
@@ -0,0 +1,28 @@
+"""Constituencies, officer suspension and the ready_for_dispatch status (database_update.sql)."""
+
+DEFAULT_CONSTITUENCIES = [
+    'Nairobi West', 'Nairobi East', 'Nairobi North', 'Mombasa', 'Kisumu', 'Nakuru',
+    'Eldoret', 'Thika', 'Kitale', 'Garissa', 'Machakos', 'Nyeri'
+]
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS constituencies (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.cursor.executemany("INSERT IGNORE INTO constituencies (name) VALUES (%s)",
+                          [(name,) for name in DEFAULT_CONSTITUENCIES])
+
+    db.add_column('officers', 'constituency', 'VARCHAR(100)')
+
+    # Appending ENUM values is an INSTANT change on MySQL 8, so these no
+    # longer rebuild (and lock) the officers/applications tables
+    db.modify_column('officers', 'status',
+                     "ENUM('pending', 'approved', 'rejected', 'suspended') DEFAULT 'pending'")
+    db.modify_column('applications', 'status',
+                     "ENUM('submitted', 'approved', 'rejected', 'ready_for_dispatch', 'dispatched', "
+                     "'ready_for_collection', 'collected') DEFAULT 'submitted'")
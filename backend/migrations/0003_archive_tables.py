@@ -0,0 +1,12 @@
+"""Archive tables for closed applications (see archive.py)."""
+
+
+def up(db):
+    db.execute("CREATE TABLE IF NOT EXISTS applications_archive LIKE applications")
+    db.add_column('applications_archive', 'archived_at', 'TIMESTAMP NULL')
+
+    for table in ('documents', 'payments', 'status_history'):
+        db.execute(f"CREATE TABLE IF NOT EXISTS {table}_archive LIKE {table}")
+        db.add_index(f"{table}_archive", f"idx_{table}_archive_application", 'application_id')
+
+    db.add_index('applications', 'idx_applications_status_updated', 'status, updated_at')
@@ -0,0 +1,11 @@
+"""Review queue claim leases (see claim_applications in app.py)."""
+
+
+def up(db):
+    db.add_column('applications', 'claimed_by_admin_id', 'INT NULL')
+    db.add_column('applications', 'claim_expires_at', 'DATETIME NULL')
+    db.add_index('applications', 'idx_applications_status_created', 'status, created_at')
+
+    # Keep archive columns in the same order as applications (archived_at last)
+    db.add_column('applications_archive', 'claimed_by_admin_id', 'INT NULL AFTER updated_at')
+    db.add_column('applications_archive', 'claim_expires_at', 'DATETIME NULL AFTER claimed_by_admin_id')
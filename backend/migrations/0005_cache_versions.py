@@ -0,0 +1,11 @@
+"""Version counters for in-process caches (see constituencies.py)."""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name VARCHAR(50) PRIMARY KEY,
+            version INT NOT NULL DEFAULT 0
+        )
+    """)
+    db.execute("INSERT IGNORE INTO cache_versions (name, version) VALUES ('constituencies', 1)")
@@ -0,0 +1,24 @@
+"""Dispatch manifests grouping printed cards by constituency."""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS dispatch_manifests (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            manifest_number VARCHAR(30) UNIQUE NULL,
+            constituency VARCHAR(100) NOT NULL,
+            status ENUM('open', 'dispatched', 'arrived') DEFAULT 'open',
+            created_by_admin_id INT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            dispatched_at DATETIME NULL,
+            arrived_at DATETIME NULL,
+            INDEX idx_manifests_status (status, created_at),
+            FOREIGN KEY (created_by_admin_id) REFERENCES admins(id)
+        )
+    """)
+
+    db.add_column('applications', 'manifest_id', 'INT NULL')
+    db.add_index('applications', 'idx_applications_manifest', 'manifest_id, status')
+    db.add_index('applications', 'idx_applications_status_constituency', 'status, constituency')
+
+    db.add_column('applications_archive', 'manifest_id', 'INT NULL AFTER claim_expires_at')
@@ -0,0 +1,22 @@
+"""Card print batches (see print_cards.py)."""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS print_batches (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            status ENUM('rendering', 'printed') DEFAULT 'rendering',
+            card_count INT NULL,
+            output_path VARCHAR(255) NULL,
+            render_ms INT NULL,
+            sheet_ms INT NULL,
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME NULL,
+            INDEX idx_print_batches_status (status)
+        )
+    """)
+
+    db.add_column('applications', 'print_batch_id', 'INT NULL')
+    db.add_index('applications', 'idx_applications_print_batch', 'print_batch_id, status')
+
+    db.add_column('applications_archive', 'print_batch_id', 'INT NULL AFTER manifest_id')
@@ -0,0 +1,30 @@
+"""Payment callback inbox, idempotent payment submission and reconciliation (see payments.py)."""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS payment_callbacks (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            transaction_id VARCHAR(50) NOT NULL,
+            payment_id INT NULL,
+            application_number VARCHAR(50) NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            status ENUM('completed', 'failed') NOT NULL,
+            received_at DATETIME NOT NULL,
+            processed_at DATETIME NULL,
+            outcome ENUM('applied', 'duplicate', 'unmatched', 'already_settled', 'amount_mismatch') NULL,
+            matched_payment_id INT NULL,
+            UNIQUE KEY uq_payment_callbacks_transaction (transaction_id),
+            INDEX idx_payment_callbacks_pending (processed_at, id)
+        )
+    """)
+
+    db.add_column('payments', 'idempotency_key', 'VARCHAR(64) NULL')
+    db.add_column('payments', 'reconciled_at', 'DATETIME NULL')
+    db.add_index('payments', 'uq_payments_idempotency_key', 'idempotency_key', unique=True)
+    db.add_index('payments', 'uq_payments_mpesa_transaction', 'mpesa_transaction_id', unique=True)
+    db.add_index('payments', 'idx_payments_application', 'application_id, status')
+
+    # payments_archive mirrors payments column for column
+    db.add_column('payments_archive', 'idempotency_key', 'VARCHAR(64) NULL')
+    db.add_column('payments_archive', 'reconciled_at', 'DATETIME NULL')
@@ -0,0 +1,9 @@
+"""Perceptual hashes of passport photos (see photo_hash.py)."""
+
+
+def up(db):
+    db.add_column('documents', 'phash', 'BIGINT UNSIGNED NULL')
+    db.add_index('documents', 'idx_documents_type_id', 'document_type, id')
+
+    # documents_archive mirrors documents column for column
+    db.add_column('documents_archive', 'phash', 'BIGINT UNSIGNED NULL')
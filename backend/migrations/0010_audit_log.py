@@ -0,0 +1,28 @@
+"""Append-only audit log of mutating API calls (see audit.py)."""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            actor_type ENUM('admin', 'officer', 'anonymous') NOT NULL,
+            actor_id INT NULL,
+            actor_ip VARCHAR(45) NULL,
+            action VARCHAR(64) NOT NULL,
+            target_type VARCHAR(32) NULL,
+            target_id INT NULL,
+            changes JSON NULL,
+            status_code SMALLINT NOT NULL,
+            created_at DATETIME(3) NOT NULL,
+            INDEX idx_audit_target (target_type, target_id, created_at),
+            INDEX idx_audit_actor (actor_type, actor_id, created_at)
+        )
+    """)
+
+    # Append-only: refuse edits and deletes at the database level
+    for operation in ('UPDATE', 'DELETE'):
+        db.execute(f"DROP TRIGGER IF EXISTS audit_log_no_{operation.lower()}")
+        db.execute(f"""
+            CREATE TRIGGER audit_log_no_{operation.lower()} BEFORE {operation} ON audit_log
+            FOR EACH ROW SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'audit_log is append-only'
+        """)
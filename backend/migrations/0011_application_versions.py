@@ -0,0 +1,25 @@
+"""Row version on applications, bumped by triggers on any change to it, its documents or payments.
+
+Used to validate cached application details (application_cache.py).
+"""
+
+
+def up(db):
+    db.add_column('applications', 'version', 'INT NOT NULL DEFAULT 1')
+    db.add_column('applications_archive', 'version', 'INT NOT NULL DEFAULT 1 AFTER print_batch_id')
+
+    db.execute("DROP TRIGGER IF EXISTS applications_bump_version")
+    db.execute("""
+        CREATE TRIGGER applications_bump_version BEFORE UPDATE ON applications
+        FOR EACH ROW SET NEW.version = OLD.version + 1
+    """)
+
+    # Status history rows are written alongside an applications UPDATE, which already bumps it
+    for table, operation, row in (('documents', 'INSERT', 'NEW'), ('documents', 'DELETE', 'OLD'),
+                                  ('payments', 'INSERT', 'NEW'), ('payments', 'UPDATE', 'NEW')):
+        trigger = f"{table}_{operation.lower()}_bump_version"
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        db.execute(f"""
+            CREATE TRIGGER {trigger} AFTER {operation} ON {table}
+            FOR EACH ROW UPDATE applications SET version = version + 1 WHERE id = {row}.application_id
+        """)
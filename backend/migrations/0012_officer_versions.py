@@ -0,0 +1,11 @@
+"""Row version on officers for optimistic concurrency (If-Match on officer status routes)."""
+
+
+def up(db):
+    db.add_column('officers', 'version', 'INT NOT NULL DEFAULT 1')
+
+    db.execute("DROP TRIGGER IF EXISTS officers_bump_version")
+    db.execute("""
+        CREATE TRIGGER officers_bump_version BEFORE UPDATE ON officers
+        FOR EACH ROW SET NEW.version = OLD.version + 1
+    """)
@@ -0,0 +1,51 @@
+"""Status transitions recorded by trigger, plus hourly/daily stage-duration rollups (see analytics.py)."""
+
+
+def up(db):
+    # Every status change lands in status_history, whichever route or job made it
+    db.execute("DROP TRIGGER IF EXISTS applications_insert_status_history")
+    db.execute("""
+        CREATE TRIGGER applications_insert_status_history AFTER INSERT ON applications
+        FOR EACH ROW INSERT INTO status_history (application_id, old_status, new_status, changed_at)
+        VALUES (NEW.id, NULL, NEW.status, NOW())
+    """)
+    db.execute("DROP TRIGGER IF EXISTS applications_update_status_history")
+    db.execute("""
+        CREATE TRIGGER applications_update_status_history AFTER UPDATE ON applications
+        FOR EACH ROW BEGIN
+            IF NOT (OLD.status <=> NEW.status) THEN
+                INSERT INTO status_history (application_id, old_status, new_status, changed_at)
+                VALUES (NEW.id, OLD.status, NEW.status, NOW());
+            END IF;
+        END
+    """)
+
+    # Give applications that predate the trigger an entry time for their current stage
+    db.execute("""
+        INSERT INTO status_history (application_id, old_status, new_status, changed_at, notes)
+        SELECT a.id, NULL, a.status, a.updated_at, 'backfilled'
+        FROM applications a
+        WHERE NOT EXISTS (SELECT 1 FROM status_history h WHERE h.application_id = a.id)
+    """)
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS stage_duration_rollups (
+            period ENUM('hour', 'day') NOT NULL,
+            period_start DATETIME NOT NULL,
+            stage VARCHAR(50) NOT NULL,
+            constituency VARCHAR(100) NOT NULL DEFAULT '',
+            officer_id INT NOT NULL DEFAULT 0,
+            bucket SMALLINT NOT NULL,
+            count INT NOT NULL DEFAULT 0,
+            total_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, period_start, stage, constituency, officer_id, bucket)
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_progress (
+            name VARCHAR(50) PRIMARY KEY,
+            last_history_id BIGINT NOT NULL DEFAULT 0,
+            updated_at DATETIME NULL
+        )
+    """)
+    db.execute("INSERT IGNORE INTO rollup_progress (name, last_history_id) VALUES ('stage_durations', 0)")
@@ -0,0 +1,91 @@
+"""Constituency-to-shard map, global application directory and number sequences (see sharding.py).
+
+Also re-creates the row-version and status-history triggers so they stand
+down while sharding.py copies rows between shards (@shard_copy is set).
+"""
+
+
+def up(db):
+    db.add_column('constituencies', 'shard', "VARCHAR(32) NOT NULL DEFAULT 'main'")
+    db.add_column('constituencies', 'moving', 'TINYINT(1) NOT NULL DEFAULT 0')
+
+    # Application numbers and ID numbers come from here instead of COUNT/MAX over applications
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS number_sequences (
+            name VARCHAR(50) PRIMARY KEY,
+            last_value BIGINT NOT NULL
+        )
+    """)
+    for name, prefix in (('application', 'APP'), ('renewal', 'REP')):
+        db.execute(f"""
+            INSERT IGNORE INTO number_sequences (name, last_value)
+            SELECT '{name}', COALESCE(MAX(CAST(SUBSTRING(application_number, 8) AS UNSIGNED)), 0)
+            FROM (SELECT application_number FROM applications
+                  UNION ALL SELECT application_number FROM applications_archive) a
+            WHERE application_number LIKE '{prefix}%'
+        """)
+    db.execute("""
+        INSERT IGNORE INTO number_sequences (name, last_value)
+        SELECT CONCAT('id_number:', SUBSTRING(generated_id_number, 3, 4)),
+               MAX(CAST(SUBSTRING(generated_id_number, 7) AS UNSIGNED))
+        FROM (SELECT generated_id_number FROM applications
+              UNION ALL SELECT generated_id_number FROM applications_archive) a
+        WHERE generated_id_number LIKE 'ID%'
+        GROUP BY SUBSTRING(generated_id_number, 3, 4)
+    """)
+
+    # Every application id and number, and the shard holding it. Ids are
+    # allocated here so they are unique across shards.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS application_directory (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            application_number VARCHAR(50) NULL,
+            constituency VARCHAR(100) NULL,
+            shard VARCHAR(32) NOT NULL,
+            created_at DATETIME NOT NULL,
+            INDEX idx_directory_number (application_number),
+            INDEX idx_directory_constituency (constituency)
+        )
+    """)
+    db.execute("""
+        INSERT IGNORE INTO application_directory (id, application_number, constituency, shard, created_at)
+        SELECT id, application_number, TRIM(constituency), 'main', COALESCE(created_at, NOW())
+        FROM applications
+        UNION ALL
+        SELECT id, application_number, TRIM(constituency), 'main', COALESCE(created_at, NOW())
+        FROM applications_archive
+    """)
+
+    for table, operation, row in (('documents', 'INSERT', 'NEW'), ('documents', 'DELETE', 'OLD'),
+                                  ('payments', 'INSERT', 'NEW'), ('payments', 'UPDATE', 'NEW')):
+        trigger = f"{table}_{operation.lower()}_bump_version"
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        db.execute(f"""
+            CREATE TRIGGER {trigger} AFTER {operation} ON {table}
+            FOR EACH ROW BEGIN
+                IF @shard_copy IS NULL THEN
+                    UPDATE applications SET version = version + 1 WHERE id = {row}.application_id;
+                END IF;
+            END
+        """)
+
+    db.execute("DROP TRIGGER IF EXISTS applications_insert_status_history")
+    db.execute("""
+        CREATE TRIGGER applications_insert_status_history AFTER INSERT ON applications
+        FOR EACH ROW BEGIN
+            IF @shard_copy IS NULL THEN
+                INSERT INTO status_history (application_id, old_status, new_status, changed_at)
+                VALUES (NEW.id, NULL, NEW.status, NOW());
+            END IF;
+        END
+    """)
+    db.execute("DROP TRIGGER IF EXISTS applications_update_status_history")
+    db.execute("""
+        CREATE TRIGGER applications_update_status_history AFTER UPDATE ON applications
+        FOR EACH ROW BEGIN
+            IF @shard_copy IS NULL AND NOT (OLD.status <=> NEW.status) THEN
+                INSERT INTO status_history (application_id, old_status, new_status, changed_at)
+                VALUES (NEW.id, OLD.status, NEW.status, NOW());
+            END IF;
+        END
+    """)
@@ -0,0 +1,25 @@
+"""Maintenance run log and document retention (see maintenance.py)."""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            job VARCHAR(50) NOT NULL,
+            started_at DATETIME NOT NULL,
+            duration_ms INT NOT NULL,
+            result JSON NULL,
+            error VARCHAR(1000) NULL,
+            INDEX idx_maintenance_runs_job (job, started_at)
+        )
+    """)
+
+    # Files removed by retention keep their documents row, marked purged.
+    # documents_archive mirrors documents column for column.
+    for table in ('documents', 'documents_archive'):
+        db.add_column(table, 'purged_at', 'DATETIME NULL')
+        # The orphan-file sweep looks uploads up by path
+        db.add_index(table, f"idx_{table}_file_path", 'file_path')
+
+    db.add_index('applications_archive', 'idx_applications_archive_archived', 'archived_at')
+    db.add_index('officers', 'idx_officers_status_created', 'status, created_at')
@@ -0,0 +1,54 @@
+"""Issuance lineage per ID number: originals, replacements and pending requests (see lineage.py).
+
+Backfilled here from this database's applications; on a sharded setup run
+`python lineage.py rebuild` once afterwards to take in the other shards.
+"""
+
+
+def up(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS id_lineage (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            id_number VARCHAR(20) NOT NULL,
+            application_id INT NOT NULL,
+            application_number VARCHAR(50) NULL,
+            application_type ENUM('new', 'renewal') NOT NULL,
+            full_names VARCHAR(255) NULL,
+            status ENUM('pending', 'issued', 'rejected') NOT NULL,
+            sequence INT NULL,
+            requested_at DATETIME NOT NULL,
+            issued_at DATETIME NULL,
+            UNIQUE INDEX idx_id_lineage_application (application_id),
+            INDEX idx_id_lineage_chain (id_number, sequence)
+        )
+    """)
+
+    # Original issues are sequence 0; issued replacements are numbered in order
+    # of first approval, as lineage.py rebuild numbers them
+    db.execute("""
+        INSERT IGNORE INTO id_lineage (id_number, application_id, application_number, application_type,
+                                       full_names, status, sequence, requested_at, issued_at)
+        SELECT id_number, id, application_number, application_type, full_names,
+               IF(issued, 'issued', IF(status = 'rejected', 'rejected', 'pending')),
+               IF(NOT issued, NULL, IF(application_type = 'new', 0,
+                  ROW_NUMBER() OVER (PARTITION BY id_number, application_type, issued ORDER BY approved_at, id))),
+               COALESCE(created_at, NOW()), IF(issued, approved_at, NULL)
+        FROM (
+            SELECT id, application_number, application_type, full_names, status, created_at,
+                   COALESCE((SELECT MIN(h.changed_at) FROM status_history h
+                             WHERE h.application_id = applications.id AND h.new_status = 'approved'),
+                            updated_at) AS approved_at,
+                   UPPER(TRIM(IF(application_type = 'renewal', existing_id_number, generated_id_number))) AS id_number,
+                   status IN ('approved', 'ready_for_dispatch', 'dispatched', 'ready_for_collection', 'collected') AS issued
+            FROM applications
+            UNION ALL
+            SELECT id, application_number, application_type, full_names, status, created_at,
+                   COALESCE((SELECT MIN(h.changed_at) FROM status_history_archive h
+                             WHERE h.application_id = applications_archive.id AND h.new_status = 'approved'),
+                            updated_at),
+                   UPPER(TRIM(IF(application_type = 'renewal', existing_id_number, generated_id_number))),
+                   status IN ('approved', 'ready_for_dispatch', 'dispatched', 'ready_for_collection', 'collected')
+            FROM applications_archive
+        ) a
+        WHERE id_number IS NOT NULL AND id_number <> ''
+    """)
@@ -0,0 +1,7 @@
+"""Index documents by upload time for incremental backups (see backup.py)."""
+
+
+def up(db):
+    # documents_archive mirrors documents column for column
+    for table in ('documents', 'documents_archive'):
+        db.add_index(table, f"idx_{table}_uploaded", 'uploaded_at')
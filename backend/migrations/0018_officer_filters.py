@@ -0,0 +1,6 @@
+"""Indexes behind the paginated pending-officer list's station and constituency filters."""
+
+
+def up(db):
+    db.add_index('officers', 'idx_officers_status_station', 'status, station, created_at')
+    db.add_index('officers', 'idx_officers_status_constituency', 'status, constituency, created_at')
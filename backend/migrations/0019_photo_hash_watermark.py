@@ -0,0 +1,26 @@
+"""When each passport photo hash was written, so worker photo indexes pick up backfilled hashes."""
+
+
+def up(db):
+    # documents_archive mirrors documents column for column
+    for table in ('documents', 'documents_archive'):
+        db.add_column(table, 'hashed_at', 'DATETIME(6) NULL')
+    db.add_index('documents', 'idx_documents_type_hashed', 'document_type, hashed_at')
+
+    db.backfill('documents', 'hashed_at = COALESCE(uploaded_at, NOW(6))', where='phash IS NOT NULL AND hashed_at IS NULL')
+
+    # Set on every write of phash: uploads, photo_hash.py backfill and shard copies alike
+    db.execute("DROP TRIGGER IF EXISTS documents_insert_hashed_at")
+    db.execute("""
+        CREATE TRIGGER documents_insert_hashed_at BEFORE INSERT ON documents
+        FOR EACH ROW SET NEW.hashed_at = IF(NEW.phash IS NULL, NULL, NOW(6))
+    """)
+    db.execute("DROP TRIGGER IF EXISTS documents_update_hashed_at")
+    db.execute("""
+        CREATE TRIGGER documents_update_hashed_at BEFORE UPDATE ON documents
+        FOR EACH ROW BEGIN
+            IF NOT (OLD.phash <=> NEW.phash) THEN
+                SET NEW.hashed_at = IF(NEW.phash IS NULL, NULL, NOW(6));
+            END IF;
+        END
+    """)
@@ -0,0 +1,32 @@
+"""Bump applications.version only when a column an admin sees changes.
+
+Review-queue claims, manifest assignment and print batches are bookkeeping:
+bumping the version for them failed admins' If-Match with 412 although
+nothing they had loaded was out of date. get_application_details reads those
+columns fresh rather than from the cache.
+"""
+
+# Written by claims, maintenance, manifests and print_cards.py; updated_at
+# changes with every UPDATE
+BOOKKEEPING_COLUMNS = ('claimed_by_admin_id', 'claim_expires_at', 'manifest_id', 'print_batch_id',
+                       'updated_at', 'version')
+
+
+def up(db):
+    db.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = 'applications'
+        ORDER BY ordinal_position
+    """, (db.database,))
+    visible = [column for (column,) in db.cursor.fetchall() if column not in BOOKKEEPING_COLUMNS]
+    unchanged = ' AND '.join(f"NEW.{column} <=> OLD.{column}" for column in visible)
+
+    db.execute("DROP TRIGGER IF EXISTS applications_bump_version")
+    db.execute(f"""
+        CREATE TRIGGER applications_bump_version BEFORE UPDATE ON applications
+        FOR EACH ROW BEGIN
+            IF NOT ({unchanged}) THEN
+                SET NEW.version = OLD.version + 1;
+            END IF;
+        END
+    """)
@@ -0,0 +1,14 @@
+"""Store constituencies trimmed so lookups compare the column and use an index.
+
+Routes and shard moves used TRIM(constituency) = %s, which no index can
+serve. New rows are stripped on insert; this trims the existing ones.
+"""
+
+
+def up(db):
+    for table in ('applications', 'applications_archive', 'officers'):
+        db.backfill(table, 'constituency = TRIM(constituency)', where='constituency <> TRIM(constituency)')
+
+    # get_officer_applications: constituency = %s OR officer_id = %s merges
+    # this with idx_applications_officer
+    db.add_index('applications', 'idx_applications_constituency', 'constituency, created_at')
@@ -0,0 +1,12 @@
+"""Cards that failed to render (see print_cards.py).
+
+The error is kept on the application so later batches skip it instead of
+failing on the same photo again; clear print_error to have it printed.
+Bookkeeping like print_batch_id, so it is left out of the version trigger.
+"""
+
+
+def up(db):
+    db.add_column('applications', 'print_error', 'VARCHAR(255) NULL')
+    # Keep archive columns in the same order as applications (archived_at last)
+    db.add_column('applications_archive', 'print_error', 'VARCHAR(255) NULL AFTER version')
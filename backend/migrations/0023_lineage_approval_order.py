@@ -0,0 +1,31 @@
+"""Renumber issued replacements in order of first approval, as lineage.py rebuild does.
+
+0016 first numbered them by last update, so a replacement touched after a
+later one was approved (printed, dispatched, collected) came out of order.
+Like 0016 this sees only this database's applications; on a sharded setup
+run `python lineage.py rebuild` once afterwards.
+"""
+
+
+def up(db):
+    db.execute("""
+        UPDATE id_lineage l
+        JOIN (
+            SELECT l.id, a.approved_at,
+                   ROW_NUMBER() OVER (PARTITION BY l.id_number ORDER BY a.approved_at, l.application_id) AS sequence
+            FROM id_lineage l
+            JOIN (
+                SELECT a.id, COALESCE(MIN(h.changed_at), a.updated_at) AS approved_at
+                FROM applications a
+                LEFT JOIN status_history h ON h.application_id = a.id AND h.new_status = 'approved'
+                GROUP BY a.id
+                UNION ALL
+                SELECT a.id, COALESCE(MIN(h.changed_at), a.updated_at)
+                FROM applications_archive a
+                LEFT JOIN status_history_archive h ON h.application_id = a.id AND h.new_status = 'approved'
+                GROUP BY a.id
+            ) a ON a.id = l.application_id
+            WHERE l.application_type = 'renewal' AND l.status = 'issued'
+        ) ranked ON ranked.id = l.id
+        SET l.sequence = ranked.sequence, l.issued_at = ranked.approved_at
+    """)
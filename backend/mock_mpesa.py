@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Local mock payment gateway for testing the callback endpoint
+Fires a burst of callbacks (with duplicates, as real gateways retry) at
+/api/payments/callback for a range of payment IDs, then writes the matching
+statement CSV for reconcile_payments.py.
+
+Usage: python mock_mpesa.py <first_payment_id> <count> <amount> [duplicates] [base_url]
+"""
+
+import csv
+import json
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def send_callback(base_url, body):
+    request = urllib.request.Request(
+        f"{base_url}/api/payments/callback",
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+
+    first_id, count, amount = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+    duplicates = int(sys.argv[4]) if len(sys.argv) > 4 else 2
+    base_url = sys.argv[5] if len(sys.argv) > 5 else 'http://localhost:5000'
+
+    callbacks = [
+        {'transactionId': f"MOCK{payment_id:010d}", 'paymentId': payment_id, 'amount': amount, 'status': 'completed'}
+        for payment_id in range(first_id, first_id + count)
+    ]
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        statuses = list(pool.map(lambda body: send_callback(base_url, body), callbacks * duplicates))
+    elapsed = time.time() - started
+
+    with open('mock_statement.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['transaction_id', 'amount'])
+        for callback in callbacks:
+            writer.writerow([callback['transactionId'], amount])
+
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"✅ Sent {len(statuses)} callbacks ({ok} acknowledged) in {elapsed:.2f}s "
+          f"({len(statuses) / elapsed:.0f}/s); statement written to mock_statement.csv")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Bulk officer onboarding for the Digital ID system
+Imports officers from a CSV file (one row per officer, header
+id_number,email,phone_number,full_name,station,constituency,password) and
+approves or suspends lists of officers, for rolling out a new station
+without signing up and approving each officer by hand.
+
+Passwords are hashed on a thread pool before any rows are locked. Officers
+are written with one multi-row INSERT per batch, all in one transaction: a row whose ID number
+is already registered updates that officer's details (and password, unless
+the cell is blank) and keeps their status; new officers start pending, or
+approved with --approve.
+
+Usage:
+    python officers_bulk.py import FILE.csv [--approve]
+    python officers_bulk.py approve OFFICER_ID [OFFICER_ID ...]
+    python officers_bulk.py suspend OFFICER_ID [OFFICER_ID ...]
+"""
+
+import csv
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+CSV_COLUMNS = ('id_number', 'email', 'phone_number', 'full_name', 'station', 'constituency', 'password')
+REQUIRED_COLUMNS = CSV_COLUMNS[:-1]  # Password may be blank for officers already registered
+
+# Bulk action -> (new status, statuses it applies to)
+STATUS_ACTIONS = {
+    'approve': ('approved', ('pending',)),
+    'suspend': ('suspended', ('approved',)),
+}
+
+
+class ImportRejected(Exception):
+    """The file has rows that cannot be imported; nothing was written."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} rows rejected")
+        self.errors = errors
+
+
+def read_officers(lines, is_known_constituency):
+    """Parse and check CSV lines. Returns the officer rows; raises ImportRejected listing bad lines."""
+    reader = csv.DictReader(lines)
+    missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ImportRejected([{'line': 1, 'error': f"Missing columns: {', '.join(missing)}"}])
+
+    officers, errors = [], []
+    seen_ids, seen_emails = {}, {}
+    for row in reader:
+        line = reader.line_num  # Physical line the row ends on; quoted fields may span lines
+        officer = {column: (row.get(column) or '').strip() for column in CSV_COLUMNS}
+        officer['email'] = officer['email'].lower()
+        officer['id_number'] = officer['id_number'].upper()
+        officer['line'] = line
+
+        blank = [column for column in REQUIRED_COLUMNS if not officer[column]]
+        if blank:
+            errors.append({'line': line, 'error': f"{', '.join(blank)} required"})
+        elif not is_known_constituency(officer['constituency']):
+            errors.append({'line': line, 'error': f"Unknown constituency {officer['constituency']}"})
+        elif officer['id_number'] in seen_ids:
+            errors.append({'line': line, 'error': f"ID number repeats line {seen_ids[officer['id_number']]}"})
+        elif officer['email'] in seen_emails:
+            errors.append({'line': line, 'error': f"Email repeats line {seen_emails[officer['email']]}"})
+        else:
+            seen_ids[officer['id_number']] = seen_emails[officer['email']] = line
+            officers.append(officer)
+
+    if errors:
+        raise ImportRejected(errors)
+    return officers
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def _hasher(workers):
+    # One pool per process, started on first use and kept for later imports
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count(),
+                                            thread_name_prefix='password-hash')
+        return _hash_pool
+
+
+def hash_passwords(passwords, workers=None):
+    """Hashes in parallel; each one is deliberately slow.
+
+    hashlib's scrypt and PBKDF2 release the GIL while they run, so threads
+    hash in parallel without the API starting processes, each of which
+    would import the app again.
+    """
+    if not passwords:
+        return []
+    return list(_hasher(workers).map(generate_password_hash, passwords))
+
+
+def _registered(cursor, officers, batch_size, lock=False):
+    """Officers already holding these ID numbers or emails.
+
+    With lock, the rows are locked until commit; the locking read also takes
+    the gap locks on both unique indexes, so a signup for one of these
+    officers waits for the import instead of racing it.
+    """
+    by_id, by_email = {}, {}
+    for start in range(0, len(officers), batch_size):
+        batch = officers[start:start + batch_size]
+        placeholders = ', '.join(['%s'] * len(batch))
+        cursor.execute(f"""
+            SELECT id, id_number, email FROM officers
+            WHERE id_number IN ({placeholders}) OR email IN ({placeholders})
+            {'FOR UPDATE' if lock else ''}
+        """, [o['id_number'] for o in batch] + [o['email'] for o in batch])
+        for officer_id, id_number, email in cursor.fetchall():
+            by_id[id_number.upper()] = officer_id
+            by_email[email.lower()] = id_number.upper()
+    return by_id, by_email
+
+
+def _check_registered(officers, by_id, by_email):
+    errors = []
+    for officer in officers:
+        owner = by_email.get(officer['email'])
+        if owner is not None and owner != officer['id_number']:
+            errors.append({'line': officer['line'], 'error': f"Email is registered to ID number {owner}"})
+        elif officer['id_number'] not in by_id and not officer['password']:
+            errors.append({'line': officer['line'], 'error': 'password required for a new officer'})
+    if errors:
+        raise ImportRejected(errors)
+
+
+def import_officers(conn, officers, approve=False, workers=None, batch_size=500):
+    """Upsert checked officer rows in one transaction. Returns {'created': n, 'updated': n}.
+
+    Raises ImportRejected, writing nothing, if a row's email belongs to an
+    officer with another ID number or a new officer has no password.
+    """
+    cursor = conn.cursor()
+    try:
+        # Checked once up front so a bad file fails fast, then hashed with
+        # nothing locked; the check is repeated under the locks below
+        _check_registered(officers, *_registered(cursor, officers, batch_size))
+        conn.rollback()
+        to_hash = [o for o in officers if o['password']]
+        for officer, password_hash in zip(to_hash, hash_passwords([o['password'] for o in to_hash], workers)):
+            officer['password_hash'] = password_hash
+
+        by_id, by_email = _registered(cursor, officers, batch_size, lock=True)
+        _check_registered(officers, by_id, by_email)
+
+        status = 'approved' if approve else 'pending'
+        now = datetime.now()
+        for start in range(0, len(officers), batch_size):
+            batch = officers[start:start + batch_size]
+            params = []
+            for o in batch:
+                # '' keeps an existing officer's password; new officers always have one
+                params.extend((o['id_number'], o['email'], o['phone_number'], o['full_name'], o['station'],
+                               o['constituency'], o.get('password_hash', ''), status, now))
+            cursor.execute(f"""
+                INSERT INTO officers (id_number, email, phone_number, full_name, station, constituency,
+                                      password_hash, status, created_at)
+                VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(batch))}
+                ON DUPLICATE KEY UPDATE email = VALUES(email), phone_number = VALUES(phone_number),
+                                        full_name = VALUES(full_name), station = VALUES(station),
+                                        constituency = VALUES(constituency),
+                                        password_hash = IF(VALUES(password_hash) = '', password_hash,
+                                                           VALUES(password_hash))
+            """, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    updated = sum(1 for o in officers if o['id_number'] in by_id)
+    return {'created': len(officers) - updated, 'updated': updated}
+
+
+def set_status(conn, officer_ids, action):
+    """Approve or suspend officers in one transaction.
+
+    Officers not in a state the action applies to are left as they are.
+    Returns (changed ids, {skipped id: current status, or None if there is no such officer}).
+    """
+    status, applies_to = STATUS_ACTIONS[action]
+    officer_ids = sorted(set(officer_ids))
+    if not officer_ids:
+        return [], {}
+
+    cursor = conn.cursor()
+    try:
+        placeholders = ', '.join(['%s'] * len(officer_ids))
+        cursor.execute(f"SELECT id, status FROM officers WHERE id IN ({placeholders}) FOR UPDATE", officer_ids)
+        current = dict(cursor.fetchall())
+
+        changed = [officer_id for officer_id in officer_ids if current.get(officer_id) in applies_to]
+        skipped = {officer_id: current.get(officer_id) for officer_id in officer_ids if officer_id not in changed}
+        if changed:
+            placeholders = ', '.join(['%s'] * len(changed))
+            cursor.execute(f"UPDATE officers SET status = %s WHERE id IN ({placeholders})", (status, *changed))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return changed, skipped
+
+
+if __name__ == "__main__":
+    from config import OFFICER_IMPORT_CONFIG, connect
+    from constituencies import ConstituencyRegistry
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('import', *STATUS_ACTIONS):
+        print(__doc__)
+        sys.exit(1)
+
+    conn = connect()
+    if sys.argv[1] == 'import':
+        try:
+            with open(sys.argv[2], newline='', encoding='utf-8-sig') as f:
+                officers = read_officers(f, ConstituencyRegistry(connect).contains)
+            counts = import_officers(conn, officers, approve='--approve' in sys.argv[3:],
+                                     workers=OFFICER_IMPORT_CONFIG['workers'],
+                                     batch_size=OFFICER_IMPORT_CONFIG['batch_size'])
+            print(f"✅ {counts['created']} officers added, {counts['updated']} updated")
+        except ImportRejected as e:
+            print(f"❌ Nothing imported, {len(e.errors)} rows rejected:")
+            for error in e.errors:
+                print(f"  line {error['line']}: {error['error']}")
+            sys.exit(1)
+    else:
+        changed, skipped = set_status(conn, [int(officer_id) for officer_id in sys.argv[2:]], sys.argv[1])
+        print(f"✅ {len(changed)} officers {STATUS_ACTIONS[sys.argv[1]][0]}")
+        for officer_id, status in skipped.items():
+            print(f"❌ Officer {officer_id}: {status or 'not found'}")
+    conn.close()
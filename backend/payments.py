@@ -0,0 +1,178 @@
+"""
+Payment callbacks and reconciliation for the Digital ID system
+Gateway callbacks are written to the payment_callbacks inbox (deduplicated by
+transaction ID) and acknowledged straight away. A background worker applies
+them to payments in batches, so a burst of callbacks after an outage queues
+in the inbox instead of contending for payment rows.
+"""
+
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sharding import excluding
+
+CALLBACK_STATUSES = {'completed', 'failed'}
+
+
+def parse_callback(data):
+    """Validate a callback payload. Returns (fields, error)."""
+    if not data:
+        return None, 'Callback body is required'
+
+    transaction_id = str(data.get('transactionId') or '').strip()
+    if not transaction_id:
+        return None, 'transactionId is required'
+    if not data.get('paymentId') and not data.get('applicationNumber'):
+        return None, 'paymentId or applicationNumber is required'
+
+    status = data.get('status', 'completed')
+    if status not in CALLBACK_STATUSES:
+        return None, f'status must be one of: {", ".join(sorted(CALLBACK_STATUSES))}'
+
+    try:
+        amount = Decimal(str(data.get('amount')))
+    except (InvalidOperation, TypeError):
+        return None, 'amount must be a number'
+
+    return {
+        'transaction_id': transaction_id,
+        'payment_id': data.get('paymentId'),
+        'application_number': data.get('applicationNumber'),
+        'amount': amount,
+        'status': status
+    }, None
+
+
+def record_callback(cursor, callback):
+    """Insert into the inbox. Returns False if this transaction ID was already received."""
+    cursor.execute("""
+        INSERT IGNORE INTO payment_callbacks
+            (transaction_id, payment_id, application_number, amount, status, received_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (callback['transaction_id'], callback['payment_id'], callback['application_number'],
+          callback['amount'], callback['status'], datetime.now()))
+    return cursor.rowcount == 1
+
+
+def _find_payment(cursor, callback):
+    if callback['payment_id']:
+        cursor.execute("""
+            SELECT id, amount, status, mpesa_transaction_id FROM payments WHERE id = %s
+        """, (callback['payment_id'],))
+    else:
+        cursor.execute("""
+            SELECT p.id, p.amount, p.status, p.mpesa_transaction_id
+            FROM payments p
+            JOIN applications a ON a.id = p.application_id
+            WHERE a.application_number = %s AND p.payment_method = 'mpesa' AND p.status = 'pending'
+            ORDER BY p.created_at DESC
+            LIMIT 1
+        """, (callback['application_number'],))
+    return cursor.fetchone()
+
+
+def apply_callbacks(conn, batch_size=200, excluded=()):
+    """Apply one batch of unprocessed callbacks to payments. Returns the number processed.
+
+    Callbacks for applications in the excluded constituencies (being moved
+    to another shard) are left in the inbox; the move hands them over.
+    """
+    excluded_sql, excluded_params = excluding('COALESCE(a.constituency, n.constituency)', excluded)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT c.id, c.transaction_id, c.payment_id, c.application_number, c.amount, c.status
+            FROM payment_callbacks c
+            LEFT JOIN payments p ON p.id = c.payment_id
+            LEFT JOIN applications a ON a.id = p.application_id
+            LEFT JOIN applications n ON c.payment_id IS NULL AND n.application_number = c.application_number
+            WHERE c.processed_at IS NULL {excluded_sql}
+            ORDER BY c.id
+            LIMIT %s
+            FOR UPDATE OF c SKIP LOCKED
+        """, (*excluded_params, batch_size))
+        callbacks = cursor.fetchall()
+
+        now = datetime.now()
+        for callback in callbacks:
+            payment = _find_payment(cursor, callback)
+            if not payment:
+                outcome = 'unmatched'
+            elif payment['mpesa_transaction_id'] == callback['transaction_id']:
+                outcome = 'duplicate'
+            elif payment['status'] != 'pending':
+                outcome = 'already_settled'
+            elif callback['status'] == 'completed' and payment['amount'] != callback['amount']:
+                outcome = 'amount_mismatch'
+            else:
+                cursor.execute("""
+                    UPDATE payments SET status = %s, mpesa_transaction_id = %s
+                    WHERE id = %s AND status = 'pending'
+                """, (callback['status'], callback['transaction_id'], payment['id']))
+                outcome = 'applied'
+
+            cursor.execute("""
+                UPDATE payment_callbacks SET processed_at = %s, outcome = %s, matched_payment_id = %s
+                WHERE id = %s
+            """, (now, outcome, payment['id'] if payment else None, callback['id']))
+
+        conn.commit()
+        return len(callbacks)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def start_callback_worker(get_connection, batch_size=200, idle_seconds=1, excluded=lambda: ()):
+    """Drain the callback inbox on a daemon thread; excluded() names constituencies to leave alone."""
+    def run():
+        while True:
+            processed = 0
+            try:
+                conn = get_connection()
+                try:
+                    processed = apply_callbacks(conn, batch_size, excluded())
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"[payments] Error applying callbacks: {e}")
+            if processed < batch_size:
+                time.sleep(idle_seconds)
+
+    thread = threading.Thread(target=run, name='payment-callbacks', daemon=True)
+    thread.start()
+    return thread
+
+
+def reconcile(statement, payments):
+    """Match statement lines to payments by transaction ID with a sorted merge.
+
+    Both inputs are lists of dicts with 'transaction_id' and 'amount'; sorting
+    dominates, so this is O(n log n) in the number of lines. Returns a dict of
+    matched, amount_mismatch, missing_in_db and missing_in_statement lists.
+    """
+    statement = sorted(statement, key=lambda row: row['transaction_id'])
+    payments = sorted(payments, key=lambda row: row['transaction_id'])
+
+    result = {'matched': [], 'amount_mismatch': [], 'missing_in_db': [], 'missing_in_statement': []}
+    i = j = 0
+    while i < len(statement) and j < len(payments):
+        line, payment = statement[i], payments[j]
+        if line['transaction_id'] == payment['transaction_id']:
+            key = 'matched' if Decimal(str(line['amount'])) == Decimal(str(payment['amount'])) else 'amount_mismatch'
+            result[key].append((line, payment))
+            i += 1
+            j += 1
+        elif line['transaction_id'] < payment['transaction_id']:
+            result['missing_in_db'].append(line)
+            i += 1
+        else:
+            result['missing_in_statement'].append(payment)
+            j += 1
+    result['missing_in_db'].extend(statement[i:])
+    result['missing_in_statement'].extend(payments[j:])
+    return result
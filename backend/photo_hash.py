@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Passport photo perceptual hashes for duplicate-person detection
+Each passport photo gets a 64-bit difference hash (dHash) stored on its
+documents row. Hashes are kept in an in-memory BK-tree per worker, so photos
+within a small Hamming distance of a given photo are found without scanning.
+
+Run this script from terminal to backfill hashes for existing uploads:
+    python photo_hash.py backfill
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+HASH_SIZE = 8
+DEFAULT_RADIUS = 8  # Bits out of 64; re-encoded or re-cropped copies of one photo land well inside this
+BACKFILL_BATCH_SIZE = 500
+
+
+def dhash(path):
+    """64-bit difference hash: compare neighbouring pixels of a 9x8 greyscale thumbnail."""
+    with Image.open(path) as image:
+        pixels = list(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def safe_dhash(path):
+    """dhash() for upload paths: None when Pillow is missing or the file is not an image."""
+    if Image is None:
+        return None
+    try:
+        return dhash(path)
+    except Exception as e:
+        print(f"[photo_hash] Could not hash {path}: {e}")
+        return None
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Metric tree over Hamming distance. Each node is [hash, items, {distance: child}]."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Return [(distance, item)] for every stored hash within radius of value."""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                results.extend((distance, item) for item in node[1])
+            # Triangle inequality: only children at distance-radius..distance+radius can match
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class PhotoIndex:
+    """Per-worker BK-tree of passport photo hashes, topped up incrementally by documents.hashed_at.
+
+    Each check re-reads the last overlap_seconds of hashes, so a hash written
+    by a transaction that committed late (or by photo_hash.py backfill, under
+    an old document id) is still picked up; documents already in the tree are
+    skipped.
+    """
+
+    def __init__(self, get_connection, check_interval_seconds=5, overlap_seconds=120):
+        self.get_connection = get_connection
+        self.check_interval_seconds = check_interval_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.tree = BKTree()
+        self.indexed = set()  # Document ids in the tree
+        self.hashed_until = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        if time.monotonic() - self.checked_at < self.check_interval_seconds:
+            return
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                since = self.hashed_until - self.overlap if self.hashed_until else datetime.min
+                cursor.execute("""
+                    SELECT id, application_id, phash, hashed_at FROM documents
+                    WHERE document_type = 'passport_photo' AND hashed_at >= %s
+                    ORDER BY hashed_at
+                """, (since,))
+                for document_id, application_id, value, hashed_at in cursor.fetchall():
+                    self.hashed_until = max(self.hashed_until or hashed_at, hashed_at)
+                    if document_id not in self.indexed and value is not None:
+                        self.indexed.add(document_id)
+                        self.tree.add(value, application_id)
+                self.checked_at = time.monotonic()
+            finally:
+                cursor.close()
+                conn.close()
+
+    def find(self, value, radius=DEFAULT_RADIUS):
+        self.refresh()
+        return self.tree.search(value, radius)
+
+
+def _hash_document(document):
+    document_id, file_path = document
+    return document_id, safe_dhash(file_path) if os.path.exists(file_path) else None
+
+
+def backfill(get_connection, workers=None):
+    """Hash every passport photo that has no hash yet, across a process pool."""
+    if Image is None:
+        raise RuntimeError("Pillow is required for photo hashing: pip install Pillow")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, file_path FROM documents
+        WHERE document_type = 'passport_photo' AND phash IS NULL
+        ORDER BY id
+    """)
+    documents = cursor.fetchall()
+
+    hashed = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for start in range(0, len(documents), BACKFILL_BATCH_SIZE):
+            batch = documents[start:start + BACKFILL_BATCH_SIZE]
+            updates = [(value, document_id)
+                       for document_id, value in pool.map(_hash_document, batch, chunksize=16)
+                       if value is not None]
+            if updates:
+                cursor.executemany("UPDATE documents SET phash = %s WHERE id = %s", updates)
+                conn.commit()
+            hashed += len(updates)
+            print(f"  {start + len(batch)}/{len(documents)} checked, {hashed} hashed")
+
+    cursor.close()
+    conn.close()
+    return hashed, len(documents)
+
+
+if __name__ == "__main__":
+    from config import SHARDS, connect
+
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        for shard in SHARDS:
+            hashed, total = backfill(lambda: connect(shard))
+            print(f"✅ {shard}: hashed {hashed} of {total} passport photos")
+    else:
+        print(__doc__)
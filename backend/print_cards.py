@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Card print batches for the Digital ID system
+Takes approved applications, renders each card's front and back from the
+application fields and passport photo across a process pool, lays them out
+on print-ready PDF sheets, then marks the whole batch printed
+(ready_for_dispatch) in one transaction.
+
+A batch that was interrupted is resumed on the next run: cards already
+rendered to disk are not rendered again. A card that fails to render is
+dropped from its batch with the error recorded in applications.print_error,
+and later batches skip it until that is cleared.
+
+Usage: python print_cards.py [batch_size]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sharding import excluding
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+OUTPUT_DIR = 'print_batches'
+
+# ID-1 card at 300 dpi, ten to an A4 sheet
+CARD_SIZE = (1012, 638)
+SHEET_SIZE = (2480, 3508)
+SHEET_COLUMNS, SHEET_ROWS = 2, 5
+SHEET_MARGIN = (200, 150)
+PHOTO_BOX = (40, 120, 320, 480)
+
+
+def _font(size):
+    try:
+        return ImageFont.truetype('DejaVuSans.ttf', size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _draw_fields(draw, x, y, fields, label_font, value_font):
+    for label, value in fields:
+        draw.text((x, y), label.upper(), fill=(90, 90, 90), font=label_font)
+        draw.text((x, y + 24), str(value or '-'), fill=(0, 0, 0), font=value_font)
+        y += 70
+
+
+def render_card(record, batch_dir):
+    """Render one card's front and back PNGs. Runs in a worker process."""
+    started = time.perf_counter()
+    front_path = os.path.join(batch_dir, f"{record['application_number']}_front.png")
+    back_path = os.path.join(batch_dir, f"{record['application_number']}_back.png")
+    if os.path.exists(front_path) and os.path.exists(back_path):
+        return record['id'], 0
+
+    title_font, label_font, value_font = _font(36), _font(18), _font(28)
+
+    front = Image.new('RGB', CARD_SIZE, (255, 255, 255))
+    draw = ImageDraw.Draw(front)
+    draw.rectangle((0, 0, CARD_SIZE[0], 90), fill=(0, 102, 51))
+    draw.text((40, 25), 'REPUBLIC OF KENYA', fill=(255, 255, 255), font=title_font)
+
+    photo_path = record.get('photo_path')
+    if photo_path and os.path.exists(photo_path):
+        with Image.open(photo_path) as photo:
+            photo = photo.convert('RGB')
+            photo.thumbnail((PHOTO_BOX[2] - PHOTO_BOX[0], PHOTO_BOX[3] - PHOTO_BOX[1]))
+            front.paste(photo, PHOTO_BOX[:2])
+    else:
+        draw.rectangle(PHOTO_BOX, outline=(150, 150, 150), width=3)
+
+    _draw_fields(draw, 360, 120, [
+        ('ID Number', record['generated_id_number']),
+        ('Full Names', record['full_names']),
+        ('Date of Birth', record['date_of_birth']),
+        ('Sex', record['gender']),
+        ('District of Birth', record['district_of_birth']),
+        ('Date of Issue', record['issued_on']),
+    ], label_font, value_font)
+    _save(front, front_path)
+
+    back = Image.new('RGB', CARD_SIZE, (255, 255, 255))
+    draw = ImageDraw.Draw(back)
+    _draw_fields(draw, 40, 40, [
+        ('Serial Number', record['application_number']),
+        ('Home District', record['home_district']),
+        ('Division', record['division']),
+        ('Location', record['location']),
+        ('Sub-Location', record['sub_location']),
+        ('Place of Issue', record['constituency']),
+    ], label_font, value_font)
+    _save(back, back_path)
+
+    return record['id'], int((time.perf_counter() - started) * 1000)
+
+
+def _save(image, path):
+    # Written whole or not at all: a resumed batch trusts any card already on disk
+    partial = path + '.part'
+    image.save(partial, format='PNG', dpi=(300, 300))
+    os.replace(partial, path)
+
+
+def render_card_or_error(record, batch_dir):
+    """render_card, returning (id, ms, error) instead of raising, so one bad photo can't fail a batch."""
+    try:
+        return (*render_card(record, batch_dir), None)
+    except Exception as e:
+        return record['id'], 0, f"{type(e).__name__}: {e}"[:255]
+
+
+def compose_sheets(card_paths, sheet_path, mirror_columns=False):
+    """Lay card images out on A4 pages and save them as one PDF."""
+    per_sheet = SHEET_COLUMNS * SHEET_ROWS
+    sheets = []
+    for start in range(0, len(card_paths), per_sheet):
+        sheet = Image.new('RGB', SHEET_SIZE, (255, 255, 255))
+        for slot, path in enumerate(card_paths[start:start + per_sheet]):
+            column, row = slot % SHEET_COLUMNS, slot // SHEET_COLUMNS
+            if mirror_columns:
+                # Backs are mirrored so they line up with their fronts when printed duplex
+                column = SHEET_COLUMNS - 1 - column
+            with Image.open(path) as card:
+                sheet.paste(card, (SHEET_MARGIN[0] + column * CARD_SIZE[0],
+                                   SHEET_MARGIN[1] + row * CARD_SIZE[1]))
+        sheets.append(sheet)
+
+    if sheets:
+        sheets[0].save(sheet_path, save_all=True, append_images=sheets[1:], resolution=300)
+
+
+def open_batch(conn, batch_size, excluded=()):
+    """Resume an unfinished batch, or claim up to batch_size approved applications for a new one.
+
+    Applications in the excluded constituencies (mid-move, or owned by another shard) are not claimed.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM print_batches WHERE status = 'rendering' ORDER BY id LIMIT 1")
+    row = cursor.fetchone()
+    if row:
+        cursor.close()
+        return row[0], True
+
+    cursor.execute("""
+        INSERT INTO print_batches (status, started_at) VALUES ('rendering', %s)
+    """, (datetime.now(),))
+    batch_id = cursor.lastrowid
+
+    excluded_sql, excluded_params = excluding('constituency', excluded)
+    cursor.execute(f"""
+        UPDATE applications SET print_batch_id = %s
+        WHERE status = 'approved' AND print_batch_id IS NULL AND generated_id_number IS NOT NULL
+          AND print_error IS NULL {excluded_sql}
+        ORDER BY updated_at
+        LIMIT %s
+    """, (batch_id, *excluded_params, batch_size))
+
+    if cursor.rowcount == 0:
+        conn.rollback()
+        cursor.close()
+        return None, False
+
+    conn.commit()
+    cursor.close()
+    return batch_id, False
+
+
+def load_records(conn, batch_id):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT a.id, a.application_number, a.generated_id_number, a.full_names,
+               a.date_of_birth, a.gender, a.district_of_birth, a.home_district,
+               a.division, a.location, a.sub_location, a.constituency,
+               DATE(a.updated_at) AS issued_on, d.file_path AS photo_path
+        FROM applications a
+        LEFT JOIN documents d ON d.application_id = a.id AND d.document_type = 'passport_photo'
+        WHERE a.print_batch_id = %s AND a.status = 'approved'
+        ORDER BY a.application_number
+    """, (batch_id,))
+    records = {}
+    for row in cursor.fetchall():
+        records.setdefault(row['id'], row)  # First photo wins if several were uploaded
+    cursor.close()
+    return list(records.values())
+
+
+def run_print_batch(get_connection, batch_size=500, output_dir=OUTPUT_DIR, workers=None, excluded=lambda: ()):
+    """Render and mark printed one batch; excluded() names constituencies to leave alone."""
+    if Image is None:
+        raise RuntimeError("Pillow is required for card rendering: pip install Pillow")
+
+    conn = get_connection()
+    batch_id, resumed = open_batch(conn, batch_size, excluded())
+    if batch_id is None:
+        conn.close()
+        return None
+
+    started = time.perf_counter()
+    records = load_records(conn, batch_id)
+    batch_dir = os.path.join(output_dir, f"batch_{batch_id:06d}")
+    os.makedirs(batch_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = list(pool.map(render_card_or_error, records, [batch_dir] * len(records), chunksize=8))
+    render_ms = int((time.perf_counter() - started) * 1000)
+    failed = {card_id: error for card_id, _, error in results if error}
+    records = [r for r in records if r['id'] not in failed]
+
+    sheet_started = time.perf_counter()
+    fronts = [os.path.join(batch_dir, f"{r['application_number']}_front.png") for r in records]
+    backs = [os.path.join(batch_dir, f"{r['application_number']}_back.png") for r in records]
+    compose_sheets(fronts, os.path.join(batch_dir, 'fronts.pdf'))
+    compose_sheets(backs, os.path.join(batch_dir, 'backs.pdf'), mirror_columns=True)
+    sheet_ms = int((time.perf_counter() - sheet_started) * 1000)
+
+    # Mark every card in the batch printed together. A constituency that
+    # started moving while the batch rendered is left out, and its cards are
+    # released from the batch to be printed where they end up.
+    now = datetime.now()
+    excluded_sql, excluded_params = excluding('constituency', excluded())
+    cursor = conn.cursor()
+    cursor.executemany("""
+        UPDATE applications SET print_batch_id = NULL, print_error = %s
+        WHERE id = %s AND print_batch_id = %s
+    """, [(error, card_id, batch_id) for card_id, error in failed.items()])
+    cursor.execute(f"""
+        UPDATE applications
+        SET status = 'ready_for_dispatch', updated_at = %s
+        WHERE print_batch_id = %s AND status = 'approved' {excluded_sql}
+    """, (now, batch_id, *excluded_params))
+    printed = cursor.rowcount
+    cursor.execute("""
+        UPDATE applications SET print_batch_id = NULL
+        WHERE print_batch_id = %s AND status = 'approved'
+    """, (batch_id,))
+    cursor.execute("""
+        UPDATE print_batches
+        SET status = 'printed', card_count = %s, output_path = %s,
+            render_ms = %s, sheet_ms = %s, finished_at = %s
+        WHERE id = %s
+    """, (printed, batch_dir, render_ms, sheet_ms, now, batch_id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    rendered = sum(1 for _, ms, _ in results if ms)
+    return {
+        'batch_id': batch_id,
+        'resumed': resumed,
+        'cards': printed,
+        'rendered': rendered,
+        'failed': failed,
+        'render_ms': render_ms,
+        'sheet_ms': sheet_ms,
+        'output_path': batch_dir
+    }
+
+
+if __name__ == "__main__":
+    from config import SHARDS, connect
+    from sharding import standalone_router
+
+    shard_router = standalone_router()
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    for shard in SHARDS:
+        while True:
+            result = run_print_batch(lambda: connect(shard), batch_size,
+                                     excluded=lambda: shard_router.elsewhere(shard))
+            if result is None:
+                print(f"{shard}: no approved applications waiting to be printed.")
+                break
+            print(f"✅ {shard} batch {result['batch_id']}{' (resumed)' if result['resumed'] else ''}: "
+                  f"{result['cards']} cards, {result['rendered']} rendered in {result['render_ms']} ms, "
+                  f"sheets in {result['sheet_ms']} ms -> {result['output_path']}")
+            for card_id, error in result['failed'].items():
+                print(f"❌ Application {card_id} not printed: {error}")
+            if result['cards'] + len(result['failed']) < batch_size:
+                break
@@ -0,0 +1,203 @@
+"""
+Rate limiting and admission control for the Digital ID API
+Token buckets per client IP (anonymous traffic) and per token (signed-in
+officers/admins), kept in process or, when a Redis URL is configured, shared
+across workers. On top of that, requests are shed by priority when the
+database is under pressure: public reads go first, officer traffic next,
+admin traffic never.
+"""
+
+import threading
+import time
+
+from flask import g, jsonify, request
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PRIORITY_PUBLIC = 'public'
+PRIORITY_OFFICER = 'officer'
+PRIORITY_ADMIN = 'admin'
+
+# Unauthenticated endpoints that read from MySQL
+PUBLIC_ENDPOINTS = {'track_application', 'search_application_by_id', 'get_constituencies'}
+
+# Not limited: document images load in bulk on review screens, and gateway
+# callbacks arrive in bursts by design (each is one inbox insert)
+EXEMPT_ENDPOINTS = {'serve_uploaded_file', 'payment_callback'}
+
+# Atomic refill-and-take for the shared backend; returns {allowed, retry_after_ms}
+REDIS_TOKEN_BUCKET = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or ARGV[3])
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+tokens = math.min(burst, tokens + (now - updated) * rate / 1000)
+local allowed = 0
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {allowed, retry}
+"""
+
+
+def retry_after_header(seconds):
+    return str(max(1, int(seconds + 0.999)))
+
+
+def classify(payload, remote_addr):
+    """(priority, bucket key) for a caller, from its decoded token if any."""
+    if payload and payload.get('admin_id'):
+        return PRIORITY_ADMIN, f"admin:{payload['admin_id']}"
+    if payload and payload.get('officer_id'):
+        return PRIORITY_OFFICER, f"officer:{payload['officer_id']}"
+    return PRIORITY_PUBLIC, f"ip:{remote_addr}"
+
+
+class LocalBuckets:
+    """In-process token buckets. Idle buckets are pruned as the table grows."""
+
+    def __init__(self, max_keys=100000):
+        self.buckets = {}
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token. Returns seconds to wait, or 0 if allowed."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self.buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+
+            if len(self.buckets) > self.max_keys:
+                # A bucket idle for burst/rate seconds is full again, so it can go
+                self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < burst / rate}
+        return wait
+
+
+class RedisBuckets:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+
+    def take(self, key, rate, burst):
+        allowed, retry_ms = self.script(keys=[f"ratelimit:{key}"],
+                                        args=[rate, burst, int(time.time() * 1000)])
+        return 0 if allowed else retry_ms / 1000
+
+
+class AdmissionController:
+    def __init__(self, config, token_payload):
+        self.config = config
+        self.token_payload = token_payload
+        if config.get('redis_url') and redis is not None:
+            self.buckets = RedisBuckets(config['redis_url'])
+        else:
+            self.buckets = LocalBuckets()
+
+        self.lock = threading.Lock()
+        self.connect_ms = 0.0  # EWMA of time spent waiting for a DB connection
+        self.sampled_at = time.monotonic()
+        self.in_flight = 0
+        self.metrics = {
+            'admitted': {PRIORITY_PUBLIC: 0, PRIORITY_OFFICER: 0, PRIORITY_ADMIN: 0},
+            'rate_limited': {PRIORITY_PUBLIC: 0, PRIORITY_OFFICER: 0, PRIORITY_ADMIN: 0},
+            'shed': {PRIORITY_PUBLIC: 0, PRIORITY_OFFICER: 0, PRIORITY_ADMIN: 0}
+        }
+
+    def record_connect(self, seconds):
+        """Feed the DB-pressure signal; call with the time each connection took to obtain."""
+        alpha = self.config['ewma_alpha']
+        with self.lock:
+            self.connect_ms = (1 - alpha) * self.connect_ms + alpha * seconds * 1000
+            self.sampled_at = time.monotonic()
+
+    def pressure_ms(self):
+        """Connect-time EWMA, decayed while no samples arrive so shedding cannot latch on."""
+        idle = time.monotonic() - self.sampled_at
+        return self.connect_ms * 0.5 ** (idle / self.config['pressure_half_life'])
+
+    def classify(self):
+        return classify(self.token_payload(), request.remote_addr)
+
+    def _reject(self, status, message, retry_after):
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = retry_after_header(retry_after)
+        return response
+
+    def _count(self, kind, priority, status, message, retry_after):
+        with self.lock:
+            self.metrics[kind][priority] += 1
+        return status, message, retry_after
+
+    def check(self, priority, key, method, endpoint):
+        """Admission decision for one request: None if admitted (call release() when done),
+        otherwise (status, message, retry_after) for the rejection."""
+        # Shed lower priorities first as DB pressure climbs
+        shed_at = self.config['shed_connect_ms'].get(priority)
+        if shed_at is not None and (self.pressure_ms() >= shed_at
+                                    or self.in_flight >= self.config['max_in_flight'][priority]):
+            return self._count('shed', priority, 503, 'Server busy, please retry shortly',
+                               self.config['shed_retry_after'])
+
+        is_public = priority == PRIORITY_PUBLIC
+        rate, burst = self.config['public_rate'] if is_public else self.config['token_rate']
+        if is_public and method != 'GET' and endpoint not in PUBLIC_ENDPOINTS:
+            rate, burst = self.config['anonymous_write_rate']
+        wait = self.buckets.take(key, rate, burst)
+        if wait:
+            return self._count('rate_limited', priority, 429, 'Too many requests', wait)
+
+        with self.lock:
+            self.in_flight += 1
+            self.metrics['admitted'][priority] += 1
+        return None
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def before_request(self):
+        if request.method == 'OPTIONS' or request.endpoint in (None, 'static') or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+
+        priority, key = self.classify()
+        rejection = self.check(priority, key, request.method, request.endpoint)
+        if rejection:
+            return self._reject(*rejection)
+        g.admitted = True
+        return None
+
+    def teardown_request(self, exc=None):
+        if g.pop('admitted', False):
+            self.release()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'connect_ms_ewma': round(self.pressure_ms(), 2),
+                'in_flight': self.in_flight,
+                'shared_backend': isinstance(self.buckets, RedisBuckets),
+                **{kind: dict(counts) for kind, counts in self.metrics.items()}
+            }
+
+
+def init_admission(app, config, token_payload):
+    controller = AdmissionController(config, token_payload)
+    app.before_request(controller.before_request)
+    app.teardown_request(controller.teardown_request)
+    return controller
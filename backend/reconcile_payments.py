@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Reconcile an M-Pesa statement against recorded payments
+Reads a CSV statement (transaction_id,amount[,completed_at]), matches it to
+payments by transaction ID and marks matched payments as reconciled.
+
+Usage: python reconcile_payments.py statement.csv
+"""
+
+import csv
+import sys
+from datetime import datetime
+
+from payments import reconcile
+
+CHUNK_SIZE = 1000
+
+
+def load_statement(path):
+    with open(path, newline='') as f:
+        return [
+            {'transaction_id': row['transaction_id'].strip(), 'amount': row['amount']}
+            for row in csv.DictReader(f)
+        ]
+
+
+def load_payments(conn):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT id, mpesa_transaction_id AS transaction_id, amount, status
+        FROM payments
+        WHERE mpesa_transaction_id IS NOT NULL AND reconciled_at IS NULL
+    """)
+    payments = cursor.fetchall()
+    cursor.close()
+    return payments
+
+
+def mark_reconciled(conn, payment_ids):
+    cursor = conn.cursor()
+    now = datetime.now()
+    for start in range(0, len(payment_ids), CHUNK_SIZE):
+        chunk = payment_ids[start:start + CHUNK_SIZE]
+        cursor.execute(f"""
+            UPDATE payments SET reconciled_at = %s
+            WHERE id IN ({', '.join(['%s'] * len(chunk))})
+        """, (now, *chunk))
+        conn.commit()
+    cursor.close()
+
+
+if __name__ == "__main__":
+    from config import SHARDS, connect
+
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    # Payments are spread over the shards; match the statement against all of them
+    statement = load_statement(sys.argv[1])
+    connections = {shard: connect(shard) for shard in SHARDS}
+    payments = []
+    for shard, conn in connections.items():
+        payments.extend({**payment, 'shard': shard} for payment in load_payments(conn))
+    result = reconcile(statement, payments)
+    for shard, conn in connections.items():
+        mark_reconciled(conn, [payment['id'] for _, payment in result['matched'] if payment['shard'] == shard])
+        conn.close()
+
+    print("=== Reconciliation ===")
+    print(f"Matched:              {len(result['matched'])}")
+    print(f"Amount mismatch:      {len(result['amount_mismatch'])}")
+    print(f"In statement, not DB: {len(result['missing_in_db'])}")
+    print(f"In DB, not statement: {len(result['missing_in_statement'])}")
+    for line, payment in result['amount_mismatch']:
+        print(f"  {line['transaction_id']}: statement {line['amount']} vs payment #{payment['id']} {payment['amount']}")
+    for line in result['missing_in_db']:
+        print(f"  {line['transaction_id']}: not recorded")
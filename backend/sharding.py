@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Regional sharding of applications for the Digital ID system
+Each constituency is owned by one shard (constituencies.shard). Applications,
+with their documents, payments, status history and dispatch manifests, live
+on the shard that owns their constituency. Officers, admins, constituencies
+and the application directory stay on the main database (DB_CONFIG).
+
+The directory maps every application id and number to its shard and hands
+out the ids, so application ids are unique across shards. The other sharded
+tables start their AUTO_INCREMENT at the shard's id_base, so their ids never
+collide either.
+
+A constituency moves between shards online: its rows are copied while it
+stays writable, writes to it pause (503) for a final catch-up, and the map
+then flips to the new shard.
+
+Run this script from terminal:
+    python sharding.py init-shard SHARD               Create the schema on a new shard
+    python sharding.py move CONSTITUENCY SHARD        Move a constituency's applications
+    python sharding.py status                         Applications per shard
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from archive import CHILD_TABLES
+from constituencies import ConstituencyRegistry, bump_version
+
+# Tables whose rows live on the shards, besides applications
+SHARD_ID_TABLES = CHILD_TABLES + ('dispatch_manifests', 'print_batches', 'payment_callbacks')
+
+# Foreign keys from shard tables into tables that only exist on the main database
+GLOBAL_REFERENCES = ('officers', 'admins')
+
+COPY_BATCH_SIZE = 500
+
+
+def id_range(shards, shard):
+    """[start, limit) of the row ids a shard allocates itself; limit is None for the highest base."""
+    start = shards[shard]['id_base']
+    above = [config['id_base'] for config in shards.values() if config['id_base'] > start]
+    return start, min(above) if above else None
+
+
+class ShardMoving(Exception):
+    """The constituency is switching shards; writes to it resume in a few seconds."""
+
+
+def next_sequence(cursor, name):
+    """Atomically take the next value of a number sequence (on the main database)."""
+    cursor.execute("""
+        INSERT INTO number_sequences (name, last_value) VALUES (%s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE last_value = LAST_INSERT_ID(last_value + 1)
+    """, (name,))
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    return cursor.fetchone()[0]
+
+
+class ShardRouter:
+    def __init__(self, shards, registry, get_global_connection, get_shard_connection,
+                 default_shard='main', max_workers=8, directory_cache_size=100000,
+                 get_session_connection=None):
+        self.shards = shards
+        self.registry = registry
+        self.get_global_connection = get_global_connection
+        self.connect = get_shard_connection
+        # Unpooled, for sessions that set variables (shard copies)
+        self.connect_session = get_session_connection or get_shard_connection
+        self.default_shard = default_shard
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard-scatter')
+        self.directory = OrderedDict()  # application id -> (shard, constituency), LRU
+        self.directory_cache_size = directory_cache_size
+        self.directory_version = None
+        self.lock = threading.Lock()
+
+    def names(self):
+        return list(self.shards)
+
+    def moving(self):
+        """Constituencies whose writes are paused for a shard move."""
+        self.registry.refresh()
+        return [name for name, (_, moving) in self.registry.shards.items() if moving]
+
+    def elsewhere(self, shard):
+        """Constituencies a shard's background jobs must leave alone.
+
+        Those mid-move, and those another shard owns: after a move their rows
+        stay on the old shard until purged, and writes there would be lost.
+        """
+        self.registry.refresh()
+        return [name for name, (owner, moving) in self.registry.shards.items()
+                if moving or (owner or self.default_shard) != shard]
+
+    def shard_for_constituency(self, constituency, for_write=False):
+        shard, moving = self.registry.shard_for((constituency or '').strip())
+        if for_write and moving:
+            raise ShardMoving(constituency)
+        return shard or self.default_shard
+
+    def _cached(self, application_id):
+        # A shard move bumps the registry version, which empties this cache
+        self.registry.refresh()
+        with self.lock:
+            if self.directory_version != self.registry.version:
+                self.directory.clear()
+                self.directory_version = self.registry.version
+            entry = self.directory.get(application_id)
+            if entry:
+                self.directory.move_to_end(application_id)
+            return entry
+
+    def _remember(self, application_id, entry):
+        with self.lock:
+            self.directory[application_id] = entry
+            if len(self.directory) > self.directory_cache_size:
+                self.directory.popitem(last=False)
+
+    def locate(self, application_id, for_write=False):
+        """Shard holding an application, or None if there is no such application."""
+        entry = self._cached(application_id)
+        if entry is None:
+            conn = self.get_global_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT shard, constituency FROM application_directory WHERE id = %s",
+                           (application_id,))
+            entry = cursor.fetchone()
+            cursor.close()
+            conn.close()
+            if entry is None:
+                return None
+            self._remember(application_id, tuple(entry))
+
+        shard, constituency = entry
+        if for_write and self.registry.shard_for(constituency or '')[1]:
+            raise ShardMoving(constituency)
+        return shard
+
+    def locate_number(self, application_number):
+        """Shards that may hold an application number (several if the number was ever reused)."""
+        conn = self.get_global_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT shard FROM application_directory WHERE application_number = %s",
+                       (application_number,))
+        shards = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+        return shards
+
+    def register(self, sequence, prefix, constituency):
+        """Allocate an id and number for a new application on its constituency's shard.
+
+        Returns (application_id, application_number, shard).
+        """
+        constituency = (constituency or '').strip() or None
+        shard = self.shard_for_constituency(constituency, for_write=True)
+
+        conn = self.get_global_connection()
+        cursor = conn.cursor()
+        try:
+            application_number = f"{prefix}{datetime.now().year}{next_sequence(cursor, sequence):06d}"
+            cursor.execute("""
+                INSERT INTO application_directory (application_number, constituency, shard, created_at)
+                VALUES (%s, %s, %s, %s)
+            """, (application_number, constituency, shard, datetime.now()))
+            application_id = cursor.lastrowid
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+        self._remember(application_id, (shard, constituency))
+        return application_id, application_number, shard
+
+    def unregister(self, application_id):
+        """Drop a directory entry whose application insert failed on the shard."""
+        conn = self.get_global_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM application_directory WHERE id = %s", (application_id,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        with self.lock:
+            self.directory.pop(application_id, None)
+
+    def next_id_number(self):
+        year = datetime.now().year
+        conn = self.get_global_connection()
+        cursor = conn.cursor()
+        try:
+            value = next_sequence(cursor, f"id_number:{year}")
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        return f"ID{year}{value:08d}"
+
+    def scatter(self, fn, shards=None):
+        """Run fn(shard, conn) on each shard in parallel. Returns {shard: result}."""
+        shards = list(self.shards if shards is None else shards)
+        if not shards:
+            return {}
+
+        def run(shard):
+            conn = self.connect(shard)
+            try:
+                return fn(shard, conn)
+            finally:
+                conn.close()
+
+        if len(shards) == 1:
+            return {shards[0]: run(shards[0])}
+        return dict(zip(shards, self.executor.map(run, shards)))
+
+    def find_row(self, table, row_id):
+        """Shard holding a row of a sharded table (ids never collide across shards)."""
+        def probe(shard, conn):
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT 1 FROM {table} WHERE id = %s", (row_id,))
+            found = cursor.fetchone() is not None
+            cursor.close()
+            return found
+
+        for shard, found in self.scatter(probe).items():
+            if found:
+                return shard
+        return None
+
+
+# Columns a shard copy rewrites on purpose: print batches stay behind, and the
+# target's photo indexes pick copied hashes up by hashed_at
+UNCOMPARED_COLUMNS = {
+    'applications': ('print_batch_id',),
+    'applications_archive': ('print_batch_id',),
+    'documents': ('hashed_at',),
+}
+
+
+def _row_digest(conn, table, alias):
+    """SQL for an MD5 over every compared column of a row; QUOTE keeps NULL apart from ''."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY column_name
+    """, (table,))
+    columns = [column for (column,) in cursor.fetchall() if column not in UNCOMPARED_COLUMNS.get(table, ())]
+    cursor.close()
+    return f"MD5(CONCAT_WS(',', {', '.join(f'QUOTE({alias}.`{column}`)' for column in columns)}))"
+
+
+def _fingerprints(conn, table, children, constituency):
+    """id -> digest of each of a constituency's rows, covering every column of the row and its child rows.
+
+    Versions alone miss bookkeeping columns and child rows (payments, photo
+    hashes), and a row the catch-up misses is lost when the source is purged.
+    Child rows are added up as 60-bit slices of their digests, so their order doesn't matter.
+    """
+    digests = [_row_digest(conn, table, 'p')]
+    for child in children:
+        digests.append(f"""
+            (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CONV(LEFT({_row_digest(conn, child, 'c')}, 15), 16, 10)), 0))
+             FROM {child} c WHERE c.application_id = p.id)""")
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT p.id, CONCAT_WS('/', {', '.join(digests)}) FROM {table} p WHERE p.constituency = %s",
+                   (constituency,))
+    rows = dict(cursor.fetchall())
+    cursor.close()
+    conn.rollback()  # End the read so the next pass sees fresh data
+    return rows
+
+
+def _ids(conn, table, constituency):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id FROM {table} WHERE constituency = %s", (constituency,))
+    ids = [row_id for (row_id,) in cursor.fetchall()]
+    cursor.close()
+    conn.rollback()
+    return ids
+
+
+def _table_sets():
+    """(parent, children) pairs that move together: live rows, archived rows and manifests."""
+    return (('applications', CHILD_TABLES),
+            ('applications_archive', tuple(f"{table}_archive" for table in CHILD_TABLES)),
+            ('dispatch_manifests', ()))
+
+
+def excluding(column, constituencies):
+    """SQL condition (with its params) leaving out rows of the given constituencies."""
+    if not constituencies:
+        return '', ()
+    placeholders = ', '.join(['%s'] * len(constituencies))
+    return f"AND COALESCE({column}, '') NOT IN ({placeholders})", tuple(constituencies)
+
+
+def _delete(cursor, parent, children, ids):
+    if not ids:
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    for child in children:
+        cursor.execute(f"DELETE FROM {child} WHERE application_id IN ({placeholders})", ids)
+    cursor.execute(f"DELETE FROM {parent} WHERE id IN ({placeholders})", ids)
+
+
+def _copy(source, target, parent, children, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    # One snapshot, so a row and its children are copied as of the same moment
+    source.start_transaction(consistent_snapshot=True, readonly=True)
+    read = source.cursor()
+    write = target.cursor()
+    try:
+        for table, key in ((parent, 'id'), *((child, 'application_id') for child in children)):
+            read.execute(f"SELECT * FROM {table} WHERE {key} IN ({placeholders})", ids)
+            rows = read.fetchall()
+            if rows and 'print_batch_id' in read.column_names:
+                # Print batches stay on the shard that ran them; the target prints unprinted cards itself
+                batch_column = read.column_names.index('print_batch_id')
+                rows = [row[:batch_column] + (None,) + row[batch_column + 1:] for row in rows]
+            if rows:
+                columns = ', '.join(f"`{column}`" for column in read.column_names)
+                write.executemany(f"""
+                    INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(read.column_names))})
+                """, rows)
+        source.rollback()
+    finally:
+        read.close()
+        write.close()
+
+
+def sync_constituency(source, target, constituency, batch_size=COPY_BATCH_SIZE):
+    """Make the target's copy of a constituency match the source. Returns the rows (re)copied or removed."""
+    changed = 0
+    for parent, children in _table_sets():
+        wanted = _fingerprints(source, parent, children, constituency)
+        present = _fingerprints(target, parent, children, constituency)
+        stale = [row_id for row_id, fingerprint in wanted.items() if present.get(row_id) != fingerprint]
+        removed = [row_id for row_id in present if row_id not in wanted]
+
+        cursor = target.cursor()
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            _delete(cursor, parent, children, [row_id for row_id in batch if row_id in present])
+            _copy(source, target, parent, children, batch)
+            target.commit()
+        for start in range(0, len(removed), batch_size):
+            _delete(cursor, parent, children, removed[start:start + batch_size])
+            target.commit()
+        cursor.close()
+        changed += len(stale) + len(removed)
+    return changed
+
+
+def move_callbacks(source, target, constituency):
+    """Hand a moved constituency's unprocessed payment callbacks to the target's inbox. Returns how many."""
+    cursor = target.cursor()
+    cursor.execute("""
+        SELECT a.application_number, p.id FROM applications a
+        LEFT JOIN payments p ON p.application_id = a.id
+        WHERE a.constituency = %s
+    """, (constituency,))
+    rows = cursor.fetchall()
+    target.rollback()
+    numbers = {number for number, _ in rows}
+    payment_ids = {payment_id for _, payment_id in rows if payment_id is not None}
+
+    # Matched as the callback worker matches them: by payment id, else by application number
+    read = source.cursor()
+    read.execute("""
+        SELECT transaction_id, payment_id, application_number, amount, status, received_at
+        FROM payment_callbacks WHERE processed_at IS NULL
+    """)
+    pending = [row for row in read.fetchall()
+               if (row[1] in payment_ids if row[1] is not None else row[2] in numbers)]
+    if pending:
+        cursor.executemany("""
+            INSERT IGNORE INTO payment_callbacks
+                (transaction_id, payment_id, application_number, amount, status, received_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, pending)
+        target.commit()
+        read.execute(f"""
+            DELETE FROM payment_callbacks
+            WHERE processed_at IS NULL AND transaction_id IN ({', '.join(['%s'] * len(pending))})
+        """, [row[0] for row in pending])
+        source.commit()
+    read.close()
+    cursor.close()
+    return len(pending)
+
+
+def purge_constituency(conn, constituency, batch_size=COPY_BATCH_SIZE):
+    """Delete a constituency's rows from a shard that no longer owns it."""
+    cursor = conn.cursor()
+    for parent, children in _table_sets():
+        ids = _ids(conn, parent, constituency)
+        for start in range(0, len(ids), batch_size):
+            _delete(cursor, parent, children, ids[start:start + batch_size])
+            conn.commit()
+    cursor.close()
+
+
+def _set_moving(router, constituency, moving, shard=None):
+    conn = router.get_global_connection()
+    cursor = conn.cursor()
+    if shard:
+        cursor.execute("UPDATE constituencies SET shard = %s, moving = %s WHERE name = %s",
+                       (shard, moving, constituency))
+        cursor.execute("UPDATE application_directory SET shard = %s WHERE constituency = %s",
+                       (shard, constituency))
+    else:
+        cursor.execute("UPDATE constituencies SET moving = %s WHERE name = %s", (moving, constituency))
+    bump_version(cursor)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    router.registry.invalidate()
+
+
+def _copy_session(router, shard):
+    # Triggers stand down for copied rows: versions and history are copied, not regenerated
+    conn = router.connect_session(shard)
+    cursor = conn.cursor()
+    cursor.execute("SET @shard_copy = 1")
+    cursor.close()
+    return conn
+
+
+def move_constituency(router, constituency, target, max_passes=10, log=print):
+    """Move a constituency's applications to another shard while the API stays up."""
+    if not router.registry.contains(constituency):
+        raise ValueError(f"Unknown constituency: {constituency}")
+    source = router.shard_for_constituency(constituency)
+    if target not in router.shards:
+        raise ValueError(f"Unknown shard: {target}")
+    if source == target:
+        log(f"{constituency} is already on {target}")
+        return
+
+    # Workers notice map changes within one registry check interval
+    settle_seconds = router.registry.check_interval_seconds + 1
+    source_conn = _copy_session(router, source)
+    target_conn = _copy_session(router, target)
+    try:
+        # Copy and catch up while the constituency stays writable
+        for attempt in range(max_passes):
+            changed = sync_constituency(source_conn, target_conn, constituency)
+            log(f"  pass {attempt + 1}: {changed} rows copied to {target}")
+            if changed < COPY_BATCH_SIZE:
+                break
+
+        # Pause writes for the final catch-up, then switch the map over
+        _set_moving(router, constituency, True)
+        try:
+            time.sleep(settle_seconds)
+            changed = sync_constituency(source_conn, target_conn, constituency)
+            log(f"  final pass: {changed} rows copied with writes paused")
+            _set_moving(router, constituency, False, shard=target)
+        except Exception:
+            _set_moving(router, constituency, False)
+            raise
+
+        # Reads may still reach the old shard until every worker has reloaded the map.
+        # Callbacks received there meanwhile are handed over before and after the
+        # purge; the old shard's callback worker leaves them alone until then.
+        time.sleep(settle_seconds)
+        handed_over = move_callbacks(source_conn, target_conn, constituency)
+        purge_constituency(source_conn, constituency)
+        handed_over += move_callbacks(source_conn, target_conn, constituency)
+        log(f"  removed {constituency} from {source}, {handed_over} pending payment callbacks handed over")
+    finally:
+        source_conn.close()
+        target_conn.close()
+
+
+def init_shard(shards, shard, migrate):
+    """Create the schema on a new shard and start its ids at the shard's id_base."""
+    config = shards[shard]['config']
+    if config is None:
+        raise ValueError(f"{shard} is the main database; run migrate.py instead")
+    migrate(config)
+
+    import mysql.connector
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+
+    # Officers and admins are only on the main database, so shard rows cannot reference them
+    cursor.execute("""
+        SELECT table_name, constraint_name FROM information_schema.referential_constraints
+        WHERE constraint_schema = %s AND referenced_table_name IN (%s, %s)
+    """, (config['database'], *GLOBAL_REFERENCES))
+    for table, constraint in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {constraint}")
+
+    id_base = shards[shard]['id_base']
+    for table in SHARD_ID_TABLES + tuple(f"{table}_archive" for table in CHILD_TABLES):
+        cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {id_base + 1}")
+    cursor.execute("UPDATE rollup_progress SET last_history_id = %s", (id_base,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def standalone_router():
+    """A ShardRouter for command-line tools, on unpooled connections from config.py."""
+    from config import DEFAULT_SHARD, SHARDS, connect
+    return ShardRouter(SHARDS, ConstituencyRegistry(connect), connect, connect, DEFAULT_SHARD,
+                       get_session_connection=connect)
+
+
+def shard_status(router):
+    def count(shard, conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT constituency, COUNT(*) FROM applications GROUP BY constituency
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    for shard, rows in router.scatter(count).items():
+        print(f"{shard}: {sum(n for _, n in rows)} applications")
+        for constituency, n in sorted(rows, key=lambda row: -row[1]):
+            print(f"    {constituency or '(none)'}: {n}")
+
+
+if __name__ == "__main__":
+    from config import SHARDS
+    from migrate import migrate
+
+    shard_router = standalone_router()
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "init-shard" and len(sys.argv) == 3:
+        init_shard(SHARDS, sys.argv[2], migrate)
+        print(f"✅ Shard {sys.argv[2]} is ready")
+    elif command == "move" and len(sys.argv) == 4:
+        move_constituency(shard_router, sys.argv[2], sys.argv[3])
+        print(f"✅ {sys.argv[2]} now lives on {sys.argv[3]}")
+    elif command == "status":
+        shard_status(shard_router)
+    else:
+        print(__doc__)
@@ -0,0 +1,262 @@
+"""
+Streaming validation of application uploads for the Digital ID system
+Multipart bodies are parsed as they arrive instead of being buffered by
+request.form/request.files. Every file part is checked against its document
+type's rules (allowed types by magic bytes, size limit) and fed to an
+optional local virus scanner chunk by chunk, so an oversized or mislabelled
+upload is rejected within its first kilobytes. Accepted files stream into
+temporary files in the upload directory and are moved into place once the
+application is recorded.
+"""
+
+import os
+import socket
+import struct
+import tempfile
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+# Leading bytes of each accepted file type
+SIGNATURES = {
+    'image/jpeg': b'\xff\xd8\xff',
+    'image/png': b'\x89PNG\r\n\x1a\n',
+    'application/pdf': b'%PDF-'
+}
+SNIFF_BYTES = max(len(signature) for signature in SIGNATURES.values())
+
+
+class UploadRejected(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def sniff(head):
+    """File type from its leading bytes, or None if it is not an accepted type."""
+    return next((content_type for content_type, signature in SIGNATURES.items()
+                 if head.startswith(signature)), None)
+
+
+def megabytes(size):
+    return f"{size / (1024 * 1024):g} MB"
+
+
+class ClamdScanner:
+    """Stream uploads to a local clamd over its Unix socket (INSTREAM) as they arrive."""
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def open(self, field, filename):
+        return ClamdSession(self.socket_path, self.timeout)
+
+
+class ClamdSession:
+    def __init__(self, socket_path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.sock.sendall(b'zINSTREAM\0')
+
+    def feed(self, chunk):
+        self.sock.sendall(struct.pack('!L', len(chunk)) + chunk)
+
+    def finish(self):
+        """Raise UploadRejected unless clamd reports the stream clean."""
+        try:
+            self.sock.sendall(struct.pack('!L', 0))
+            reply = b''
+            while not reply.endswith(b'\0'):
+                data = self.sock.recv(4096)
+                if not data:
+                    break
+                reply += data
+        finally:
+            self.close()
+
+        reply = reply.rstrip(b'\0').decode(errors='replace')
+        if not reply.endswith('OK'):
+            raise UploadRejected(422, 'Upload was rejected by the virus scan')
+
+    def close(self):
+        self.sock.close()
+
+
+class StoredUpload:
+    """A file part, written to a temporary path while it streamed in."""
+
+    def __init__(self, field, filename, path):
+        self.field = field
+        self.filename = filename
+        self.path = path
+        self.content_type = None
+        self.size = 0
+        self.saved = False
+
+    def save(self, path):
+        os.replace(self.path, path)
+        self.path = path
+        self.saved = True
+
+    def discard(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MultipartUploadParser:
+    """Push-based multipart parser: feed() body chunks, then finish() for (form, uploads).
+
+    fields maps each accepted file field to its document type; rules are
+    config['document_types'][document_type] = {'types': (...), 'max_bytes': n}.
+    """
+
+    def __init__(self, boundary, config, upload_dir, fields, scanner=None):
+        self.decoder = MultipartDecoder(boundary)
+        self.config = config
+        self.upload_dir = upload_dir
+        self.fields = fields
+        self.scanner = scanner
+        self.form = {}
+        self.uploads = []
+        self.received = 0
+        self.part = None
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        self.received += len(chunk)
+        if self.received > self.config['max_total_bytes']:
+            raise UploadRejected(413, f"Upload exceeds {megabytes(self.config['max_total_bytes'])}")
+        self.decoder.receive_data(chunk)
+        self._drain()
+
+    def finish(self):
+        self.decoder.receive_data(None)
+        self._drain()
+        if self.part is not None:
+            raise UploadRejected(400, 'Upload ended before the form was complete')
+        return self.form, self.uploads
+
+    def discard(self):
+        """Remove everything written so far (on rejection or a failed insert)."""
+        if self.part and self.part['kind'] == 'file':
+            self.part['handle'].close()
+            if self.part['scan']:
+                self.part['scan'].close()
+            self.part['upload'].discard()
+        for upload in self.uploads:
+            upload.discard()
+
+    def _next_event(self):
+        try:
+            return self.decoder.next_event()
+        except ValueError:
+            raise UploadRejected(400, 'Malformed or incomplete multipart upload')
+
+    def _drain(self):
+        event = self._next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                self._open_file(event)
+            elif isinstance(event, Field):
+                self.part = {'kind': 'field', 'name': event.name, 'value': bytearray()}
+            elif isinstance(event, Data):
+                if self.part['kind'] == 'field':
+                    self._field_data(event)
+                else:
+                    self._file_data(event)
+            event = self._next_event()
+
+    def _open_file(self, event):
+        if event.name not in self.fields:
+            raise UploadRejected(400, f"Unexpected file field: {event.name}")
+        if any(upload.field == event.name for upload in self.uploads):
+            raise UploadRejected(400, f"Only one file may be sent as {event.name}")
+        if not event.filename:
+            # An empty file input; browsers still send the part
+            self.part = {'kind': 'skip'}
+            return
+
+        rules = self.config['document_types'][self.fields[event.name]]
+        fd, path = tempfile.mkstemp(dir=self.upload_dir, prefix='.upload-', suffix='.part')
+        upload = StoredUpload(event.name, event.filename, path)
+        self.part = {
+            'kind': 'file',
+            'upload': upload,
+            'rules': rules,
+            'handle': os.fdopen(fd, 'wb'),
+            'head': b'',
+            'scan': self.scanner.open(event.name, event.filename) if self.scanner else None
+        }
+
+    def _field_data(self, event):
+        part = self.part
+        part['value'] += event.data
+        if len(part['value']) > self.config['max_field_bytes']:
+            raise UploadRejected(413, f"Field {part['name']} is too long")
+        if not event.more_data:
+            self.form[part['name']] = part['value'].decode('utf-8', errors='replace')
+            self.part = None
+
+    def _file_data(self, event):
+        part = self.part
+        if part['kind'] == 'skip':
+            if not event.more_data:
+                self.part = None
+            return
+
+        upload, rules = part['upload'], part['rules']
+        upload.size += len(event.data)
+        if upload.size > rules['max_bytes']:
+            raise UploadRejected(413, f"{upload.field} exceeds {megabytes(rules['max_bytes'])}")
+
+        # Decide the type as soon as the signature bytes are in
+        if upload.content_type is None:
+            part['head'] += event.data[:SNIFF_BYTES]
+            if len(part['head']) >= SNIFF_BYTES or not event.more_data:
+                upload.content_type = sniff(part['head'])
+                if upload.content_type not in rules['types']:
+                    raise UploadRejected(415, f"{upload.field} must be one of: {', '.join(rules['types'])}")
+
+        part['handle'].write(event.data)
+        if part['scan'] and event.data:
+            part['scan'].feed(event.data)
+
+        if not event.more_data:
+            part['handle'].close()
+            if upload.size == 0:
+                raise UploadRejected(400, f"{upload.field} is empty")
+            if part['scan']:
+                scan, part['scan'] = part['scan'], None
+                scan.finish()
+            self.uploads.append(upload)
+            self.part = None
+
+
+def open_parser(content_type, content_length, config, upload_dir, fields, scanner=None):
+    """Start parsing a request body; rejects a declared oversized body before any of it is read."""
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
+        raise UploadRejected(400, 'Expected a multipart/form-data upload')
+    if content_length and content_length > config['max_total_bytes']:
+        raise UploadRejected(413, f"Upload exceeds {megabytes(config['max_total_bytes'])}")
+
+    os.makedirs(upload_dir, exist_ok=True)
+    return MultipartUploadParser(options['boundary'].encode('latin-1'), config, upload_dir, fields, scanner)
+
+
+def parse_stream(stream, content_type, content_length, config, upload_dir, fields, scanner=None):
+    """Parse a WSGI input stream. Returns (form, uploads); temporary files are removed on rejection."""
+    parser = open_parser(content_type, content_length, config, upload_dir, fields, scanner)
+    try:
+        while True:
+            chunk = stream.read(config['chunk_bytes'])
+            if not chunk:
+                return parser.finish()
+            parser.feed(chunk)
+    except Exception:
+        parser.discard()
+        raise
@@ -4,6 +4,7 @@ import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
 import { useToast } from '@/hooks/use-toast';
+import { adminAuthHeaders, ifMatchHeaders } from '@/lib/auth';
 import { Check, X, User, Calendar, MapPin, Phone, Mail, FileText, Image } from 'lucide-react';
 import { generateWaitingCard } from '@/lib/pdfGenerator';
 
@@ -42,6 +43,7 @@ interface Application {
   generated_id_number?: string;
   created_at: string;
   officer_name: string;
+  version: number;
   documents: Array<{
     document_type: string;
     file_path: string;
@@ -92,6 +94,8 @@ const ApplicationDetails = ({ applicationId, open, onClose, onUpdate }: Applicat
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
+          ...ifMatchHeaders(application?.version),
         },
       });
 
@@ -126,6 +130,8 @@ const ApplicationDetails = ({ applicationId, open, onClose, onUpdate }: Applicat
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
+          ...ifMatchHeaders(application?.version),
         },
       });
 
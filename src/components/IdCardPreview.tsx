@@ -3,6 +3,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/u
 import { Button } from '@/components/ui/button';
 import { Card, CardContent } from '@/components/ui/card';
 import { useToast } from '@/hooks/use-toast';
+import { adminAuthHeaders, ifMatchHeaders } from '@/lib/auth';
 import { Printer, X } from 'lucide-react';
 
 interface IdCardPreviewProps {
@@ -28,6 +29,7 @@ interface Application {
   village_estate: string;
   generated_id_number: string;
   created_at: string;
+  version: number;
   documents?: Array<{
     document_type: string;
     file_path: string;
@@ -83,6 +85,8 @@ const IdCardPreview = ({ applicationId, open, onClose, onPrint }: IdCardPreviewP
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
+          ...ifMatchHeaders(application?.version),
         },
       });
 
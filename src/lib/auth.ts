@@ -0,0 +1,18 @@
+// Authorization headers for API calls, so the backend can identify (and audit) the caller
+
+function bearer(token: string | null): Record<string, string> {
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
+export function adminAuthHeaders(): Record<string, string> {
+  return bearer(localStorage.getItem('adminToken'));
+}
+
+export function officerAuthHeaders(): Record<string, string> {
+  return bearer(localStorage.getItem('officerToken'));
+}
+
+// Conditional-write header: the request fails with 412 if the record changed since `version` was read
+export function ifMatchHeaders(version?: number): Record<string, string> {
+  return version === undefined ? {} : { 'If-Match': `"${version}"` };
+}
@@ -7,6 +7,7 @@ import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@
 import { Badge } from '@/components/ui/badge';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { useToast } from '@/hooks/use-toast';
+import { adminAuthHeaders, ifMatchHeaders } from '@/lib/auth';
 import { Check, X, User, Phone, Mail, Building, FileText, Calendar, Eye, Truck, LogOut, Trash2, Pause, Printer } from 'lucide-react';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
@@ -21,6 +22,7 @@ interface PendingOfficer {
   full_name: string;
   station: string;
   created_at: string;
+  version: number;
 }
 
 interface Application {
@@ -33,6 +35,7 @@ interface Application {
   updated_at: string;
   officer_name: string;
   generated_id_number?: string;
+  version: number;
 }
 
 interface ApprovedOfficer {
@@ -44,6 +47,7 @@ interface ApprovedOfficer {
   station: string;
   status: string;
   created_at: string;
+  version: number;
 }
 
 interface Constituency {
@@ -52,8 +56,12 @@ interface Constituency {
   created_at: string;
 }
 
+const PENDING_OFFICERS_PAGE_SIZE = 50;
+
 const AdminDashboard = () => {
   const [pendingOfficers, setPendingOfficers] = useState<PendingOfficer[]>([]);
+  const [pendingPage, setPendingPage] = useState(1);
+  const [pendingTotal, setPendingTotal] = useState(0);
   const [applications, setApplications] = useState<Application[]>([]);
   const [approvedApplications, setApprovedApplications] = useState<Application[]>([]);
   const [approvedOfficers, setApprovedOfficers] = useState<ApprovedOfficer[]>([]);
@@ -78,13 +86,22 @@ const AdminDashboard = () => {
     fetchPreviewApplications();
   }, []);
 
-  const fetchPendingOfficers = async () => {
+  const fetchPendingOfficers = async (page = pendingPage) => {
     try {
-      const response = await fetch('http://localhost:5000/api/admin/officers/pending');
+      const response = await fetch(
+        `http://localhost:5000/api/admin/officers/pending?page=${page}&pageSize=${PENDING_OFFICERS_PAGE_SIZE}`
+      );
       const data = await response.json();
       
       if (response.ok) {
+        // The last officer on a later page was just approved or rejected: step back a page
+        if (data.officers.length === 0 && page > 1) {
+          fetchPendingOfficers(page - 1);
+          return;
+        }
         setPendingOfficers(data.officers);
+        setPendingTotal(data.total);
+        setPendingPage(data.page);
       } else {
         toast({
           title: "Error",
@@ -126,12 +143,14 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleApprove = async (officerId: number) => {
+  const handleApprove = async (officerId: number, version: number) => {
     try {
       const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}/approve`, {
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
+          ...ifMatchHeaders(version),
         },
       });
 
@@ -142,8 +161,8 @@ const AdminDashboard = () => {
           title: "Success",
           description: "Officer approved successfully",
         });
-        // Remove approved officer from the list
-        setPendingOfficers(prev => prev.filter(officer => officer.id !== officerId));
+        // Reload the page so the next pending officers move up into it
+        fetchPendingOfficers();
       } else {
         toast({
           title: "Error",
@@ -160,12 +179,14 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleReject = async (officerId: number) => {
+  const handleReject = async (officerId: number, version: number) => {
     try {
       const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}/reject`, {
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
+          ...ifMatchHeaders(version),
         },
       });
 
@@ -176,8 +197,8 @@ const AdminDashboard = () => {
           title: "Success",
           description: "Officer rejected",
         });
-        // Remove rejected officer from the list
-        setPendingOfficers(prev => prev.filter(officer => officer.id !== officerId));
+        // Reload the page so the next pending officers move up into it
+        fetchPendingOfficers();
       } else {
         toast({
           title: "Error",
@@ -222,12 +243,14 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleDispatch = async (applicationId: number) => {
+  const handleDispatch = async (applicationId: number, version: number) => {
     try {
       const response = await fetch(`http://localhost:5000/api/admin/applications/${applicationId}/dispatch`, {
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
+          ...ifMatchHeaders(version),
         },
       });
 
@@ -343,9 +366,9 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleSuspendOfficer = async (officerId: number) => {
+  const handleSuspendOfficer = async (officerId: number, version: number) => {
     try {
-      const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}/suspend`, { method: 'PUT' });
+      const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}/suspend`, { method: 'PUT', headers: { ...adminAuthHeaders(), ...ifMatchHeaders(version) } });
       const data = await response.json();
       if (response.ok) {
         toast({ title: 'Officer Suspended', description: 'The officer has been suspended.' });
@@ -358,9 +381,9 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleUnsuspendOfficer = async (officerId: number) => {
+  const handleUnsuspendOfficer = async (officerId: number, version: number) => {
     try {
-      const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}/unsuspend`, { method: 'PUT' });
+      const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}/unsuspend`, { method: 'PUT', headers: { ...adminAuthHeaders(), ...ifMatchHeaders(version) } });
       const data = await response.json();
       if (response.ok) {
         toast({ title: 'Officer Unsuspended', description: 'The officer has been reactivated.' });
@@ -373,9 +396,9 @@ const AdminDashboard = () => {
     }
   };
 
-  const handleDeleteOfficer = async (officerId: number) => {
+  const handleDeleteOfficer = async (officerId: number, version: number) => {
     try {
-      const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}`, { method: 'DELETE' });
+      const response = await fetch(`http://localhost:5000/api/admin/officers/${officerId}`, { method: 'DELETE', headers: { ...adminAuthHeaders(), ...ifMatchHeaders(version) } });
       const data = await response.json();
       if (response.ok) {
         toast({ title: 'Officer Deleted', description: 'The officer has been removed.' });
@@ -449,6 +472,7 @@ const AdminDashboard = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...adminAuthHeaders(),
         },
         body: JSON.stringify({ name: newConstituency.trim() }),
       });
@@ -482,6 +506,7 @@ const AdminDashboard = () => {
     try {
       const response = await fetch(`http://localhost:5000/api/admin/constituencies/${constituencyId}`, {
         method: 'DELETE',
+        headers: adminAuthHeaders(),
       });
 
       const data = await response.json();
@@ -802,7 +827,7 @@ const AdminDashboard = () => {
                             <TableCell>
                               <Button
                                 size="sm"
-                                onClick={() => handleDispatch(application.id)}
+                                onClick={() => handleDispatch(application.id, application.version)}
                                 className="bg-purple-600 hover:bg-purple-700"
                               >
                                 <Truck className="h-4 w-4 mr-1" />
@@ -828,6 +853,7 @@ const AdminDashboard = () => {
                 </CardTitle>
                 <CardDescription>
                   Review and approve officer applications to grant system access
+                  {pendingTotal > 0 && ` (${pendingTotal} pending)`}
                 </CardDescription>
               </CardHeader>
               <CardContent>
@@ -890,7 +916,7 @@ const AdminDashboard = () => {
                                 <Button
                                   size="sm"
                                   variant="default"
-                                  onClick={() => handleApprove(officer.id)}
+                                  onClick={() => handleApprove(officer.id, officer.version)}
                                   className="bg-green-600 hover:bg-green-700"
                                 >
                                   <Check className="h-4 w-4 mr-1" />
@@ -899,7 +925,7 @@ const AdminDashboard = () => {
                                 <Button
                                   size="sm"
                                   variant="destructive"
-                                  onClick={() => handleReject(officer.id)}
+                                  onClick={() => handleReject(officer.id, officer.version)}
                                 >
                                   <X className="h-4 w-4 mr-1" />
                                   Reject
@@ -910,6 +936,32 @@ const AdminDashboard = () => {
                         ))}
                       </TableBody>
                     </Table>
+                    {pendingTotal > PENDING_OFFICERS_PAGE_SIZE && (
+                      <div className="flex items-center justify-between border-t px-4 py-3">
+                        <div className="text-sm text-muted-foreground">
+                          Showing {(pendingPage - 1) * PENDING_OFFICERS_PAGE_SIZE + 1}–
+                          {(pendingPage - 1) * PENDING_OFFICERS_PAGE_SIZE + pendingOfficers.length} of {pendingTotal}
+                        </div>
+                        <div className="flex gap-2">
+                          <Button
+                            size="sm"
+                            variant="outline"
+                            disabled={pendingPage <= 1}
+                            onClick={() => fetchPendingOfficers(pendingPage - 1)}
+                          >
+                            Previous
+                          </Button>
+                          <Button
+                            size="sm"
+                            variant="outline"
+                            disabled={pendingPage * PENDING_OFFICERS_PAGE_SIZE >= pendingTotal}
+                            onClick={() => fetchPendingOfficers(pendingPage + 1)}
+                          >
+                            Next
+                          </Button>
+                        </div>
+                      </div>
+                    )}
                   </div>
                 )}
               </CardContent>
@@ -994,7 +1046,7 @@ const AdminDashboard = () => {
                                   <Button
                                     size="sm"
                                     variant="default"
-                                    onClick={() => handleUnsuspendOfficer(officer.id)}
+                                    onClick={() => handleUnsuspendOfficer(officer.id, officer.version)}
                                   >
                                     <Check className="h-4 w-4 mr-1" />
                                     Unsuspend
@@ -1003,7 +1055,7 @@ const AdminDashboard = () => {
                                   <Button
                                     size="sm"
                                     variant="outline"
-                                    onClick={() => handleSuspendOfficer(officer.id)}
+                                    onClick={() => handleSuspendOfficer(officer.id, officer.version)}
                                   >
                                     <Pause className="h-4 w-4 mr-1" />
                                     Suspend
@@ -1012,7 +1064,7 @@ const AdminDashboard = () => {
                                 <Button
                                   size="sm"
                                   variant="destructive"
-                                  onClick={() => handleDeleteOfficer(officer.id)}
+                                  onClick={() => handleDeleteOfficer(officer.id, officer.version)}
                                 >
                                   <Trash2 className="h-4 w-4 mr-1" />
                                   Delete
@@ -7,6 +7,7 @@ import { Label } from "@/components/ui/label";
 import { Badge } from "@/components/ui/badge";
 import { useToast } from "@/hooks/use-toast";
 import { CreditCard, Smartphone, CheckCircle, ArrowLeft } from "lucide-react";
+import { ifMatchHeaders } from "@/lib/auth";
 
 interface LocationState {
   applicationNumber: string;
@@ -64,7 +65,8 @@ const LostIdPayment = () => {
         const submitResponse = await fetch(`http://localhost:5000/api/applications/${state.applicationId}/submit-for-approval`, {
           method: 'PUT',
           headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            ...ifMatchHeaders(data.applicationVersion ?? undefined)
           }
         });
 
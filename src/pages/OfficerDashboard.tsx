@@ -7,6 +7,7 @@ import { Badge } from "@/components/ui/badge";
 import { LogOut, User, FileText, Users, CheckCircle, Package, AlertTriangle } from "lucide-react";
 import { useNavigate } from "react-router-dom";
 import { useToast } from "@/hooks/use-toast";
+import { ifMatchHeaders, officerAuthHeaders } from "@/lib/auth";
 
 interface Application {
   id: number;
@@ -16,6 +17,7 @@ interface Application {
   created_at: string;
   updated_at: string;
   generated_id_number: string;
+  version: number;
 }
 
 const OfficerDashboard = () => {
@@ -98,12 +100,14 @@ const OfficerDashboard = () => {
     navigate("/officer");
   };
 
-  const handleCardArrived = async (applicationId: number) => {
+  const handleCardArrived = async (applicationId: number, version: number) => {
     try {
       const response = await fetch(`http://localhost:5000/api/officer/applications/${applicationId}/card-arrived`, {
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...officerAuthHeaders(),
+          ...ifMatchHeaders(version),
         },
         body: JSON.stringify({
           status: 'card_arrived'
@@ -128,13 +132,15 @@ const OfficerDashboard = () => {
     }
   };
 
-  const handleCardCollected = async (applicationId: number) => {
+  const handleCardCollected = async (applicationId: number, version: number) => {
     try {
       console.log('Attempting to mark card as collected for application:', applicationId);
       const response = await fetch(`http://localhost:5000/api/officer/applications/${applicationId}/card-collected`, {
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
+          ...officerAuthHeaders(),
+          ...ifMatchHeaders(version),
         }
       });
       
@@ -348,7 +354,7 @@ const OfficerDashboard = () => {
                                 <Button
                                   size="sm"
                                   variant="outline"
-                                  onClick={() => handleCardArrived(app.id)}
+                                  onClick={() => handleCardArrived(app.id, app.version)}
                                   className="flex items-center gap-1"
                                 >
                                   <Package className="h-3 w-3" />
@@ -358,7 +364,7 @@ const OfficerDashboard = () => {
                               {(app.status === 'ready_for_collection' || (app.status === '' && app.generated_id_number)) && (
                                 <Button
                                   size="sm"
-                                  onClick={() => handleCardCollected(app.id)}
+                                  onClick={() => handleCardCollected(app.id, app.version)}
                                   className="flex items-center gap-1"
                                 >
                                   <CheckCircle className="h-3 w-3" />